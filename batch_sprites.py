@@ -0,0 +1,175 @@
+import os
+import sys
+import json
+import argparse
+
+import sprite_cache
+import sprite_cluster
+import sprite_palette
+import sprite_pipeline
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Render sprites for every model in a manifest without the GUI.')
+    parser.add_argument('manifest', help='JSON manifest: a list of jobs, or {"defaults": {...}, "jobs": [...]}')
+    parser.add_argument('--blender', default=os.environ.get('BLENDER', sprite_pipeline.DEFAULT_BLENDER),
+                        help='Path to the Blender executable (default: $BLENDER or the GUI default)')
+    parser.add_argument('--out', default=os.path.join(os.getcwd(), 'output_sprites'), help='Output directory for sprites')
+    parser.add_argument('-j', '--workers', type=int, default=os.cpu_count() or 1,
+                        help='Number of Blender processes to run at once')
+    parser.add_argument('--threads', type=int, default=None,
+                        help='Render threads per job (default: cores / workers), divided between its shards')
+    parser.add_argument('--shards', type=int, default=None,
+                        help='Split the directions of each model across this many Blender processes (overrides the manifest)')
+    parser.add_argument('--transport', choices=sprite_pipeline.TRANSPORTS, default=None,
+                        help="How frames reach the post-processor: 'png' files or uncompressed 'raw' scratch frames "
+                             "(overrides the manifest)")
+    parser.add_argument('--symmetry', choices=sprite_pipeline.SYMMETRY_MODES, default=None,
+                        help="Render left-side directions as flipped right-side ones: 'auto' detects mirror symmetry, "
+                             "'force' assumes it (overrides the manifest)")
+    parser.add_argument('--profile', choices=sprite_pipeline.RENDER_PROFILES, default=None,
+                        help="Render quality: 'draft' (flat Workbench), 'preview' (4-sample EEVEE) or 'final' "
+                             "(64-sample EEVEE, the default; overrides the manifest)")
+    parser.add_argument('--framing', choices=sprite_pipeline.FRAMING_MODES, default=None,
+                        help="'tight' fits the camera to the model's silhouette across all directions (overrides the manifest)")
+    parser.add_argument('--no-render-border', action='store_true',
+                        help='Render full frames instead of cropping each render to the projected silhouette')
+    parser.add_argument('--proxy', action='store_true',
+                        help='Decimate high-poly models to a triangle budget that still covers every final sprite pixel')
+    parser.add_argument('--passes', default=None, metavar='PASS[,PASS...]',
+                        help=f"Also write these passes next to each sprite, from the same render: "
+                             f"{', '.join(sprite_pipeline.PASSES)} (overrides the manifest)")
+    parser.add_argument('--output', choices=sprite_pipeline.OUTPUT_FORMATS, default=None,
+                        help="'sprites' writes a PNG per view, 'atlas' one packed sheet plus index per model "
+                             "(overrides the manifest)")
+    parser.add_argument('--atlas', default=None, metavar='NAME',
+                        help='Pack every model of the batch into one atlas, <out>/NAME.png with a NAME.json index')
+    parser.add_argument('--atlas-binary', action='store_true',
+                        help='Also write a compact binary .bin index next to each atlas JSON index')
+    parser.add_argument('--palette', default=None,
+                        help='Quantize sprites to this palette (PLAYPAL lump, .act, JASC .pal, GIMP .gpl or palette PNG)')
+    parser.add_argument('--palette-output', choices=sprite_palette.PALETTE_OUTPUTS, default=None,
+                        help="With a palette: 'png' writes indexed PNGs, 'patch' Doom picture lumps (.lmp)")
+    parser.add_argument('--palette-bits', type=int, choices=sprite_palette.LUT_BITS, default=None,
+                        help='Bits per channel of the cached palette lookup table (6 = 64^3, 8 = exact 256^3)')
+    parser.add_argument('--fresh-process', action='store_true',
+                        help='Launch a new Blender for every job instead of reusing warm render servers')
+    parser.add_argument('--no-cache', action='store_true', help='Bypass the render cache and always re-render')
+    parser.add_argument('--cache-dir', default=None, help='Render cache folder (default: $SPRITE_CACHE_DIR or the user cache folder)')
+    parser.add_argument('--cache-size', type=sprite_cache.parse_size, default=sprite_cache.DEFAULT_CACHE_SIZE,
+                        help='Render cache size limit, e.g. 500MB or 4GB (default: 2GB)')
+    parser.add_argument('--cluster', default=None, metavar='[HOST:]PORT',
+                        help='Render on worker machines (worker_sprites.py) that connect to this address instead of '
+                             'locally; cropping, alignment and the cache stay on this machine')
+    parser.add_argument('--min-workers', type=int, default=1,
+                        help='With --cluster: wait for this many workers before starting')
+    parser.add_argument('--worker-wait', type=float, default=sprite_cluster.WORKER_WAIT, metavar='SECONDS',
+                        help='With --cluster: fail the remaining tasks when no worker has been connected for this long '
+                             f'(default {sprite_cluster.WORKER_WAIT:.0f})')
+    parser.add_argument('--split', choices=('model', 'direction'), default='model',
+                        help="With --cluster: send each model as one task, or each direction as its own task")
+    parser.add_argument('--log-dir', default=None, help='Directory for per-job Blender logs (default: <out>/logs)')
+    parser.add_argument('--summary', default=None, help='Write the JSON run summary to this file')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not args.cluster and not os.path.isfile(args.blender):
+        print(f'Blender executable not found: {args.blender}', file=sys.stderr)
+        return 2
+    try:
+        jobs = sprite_pipeline.load_manifest(args.manifest)
+        for job in jobs:
+            if args.transport:
+                job['transport'] = args.transport
+            if args.symmetry:
+                job['symmetry'] = args.symmetry
+            if args.profile:
+                job['profile'] = args.profile
+            if args.framing:
+                job['framing'] = args.framing
+            if args.no_render_border:
+                job['crop_border'] = False
+            if args.proxy:
+                job['proxy'] = True
+            if args.output:
+                job['output'] = args.output
+            if args.atlas_binary:
+                job['atlas_binary'] = True
+            if args.palette:
+                job['palette'] = os.path.abspath(args.palette)
+            if args.palette_output:
+                job['palette_output'] = args.palette_output
+            if args.palette_bits:
+                job['palette_bits'] = args.palette_bits
+            if args.shards:
+                job['shards'] = max(1, args.shards)
+            if args.cluster and args.split == 'direction':
+                job['shards'] = len(sprite_pipeline.DIRECTION_NAMES)
+            if args.passes is not None:
+                job['passes'] = args.passes
+        # Check the overridden settings together, the way the manifest's own were
+        jobs = [sprite_pipeline.make_job(job) for job in jobs]
+        if args.atlas:
+            # Reject what can't be packed before any Blender starts; run_batch reports what it overrides
+            sprite_pipeline.atlas_jobs(jobs)
+    except (OSError, ValueError) as e:
+        print(f'Invalid manifest: {e}', file=sys.stderr)
+        return 2
+    if not jobs:
+        print('Manifest contains no jobs.', file=sys.stderr)
+        return 2
+
+    log_dir = args.log_dir or os.path.join(args.out, 'logs')
+    cache = sprite_cache.RenderCache(args.cache_dir, args.cache_size, enabled=not args.no_cache)
+    cluster = None
+    if args.cluster:
+        try:
+            cluster = sprite_cluster.ClusterCoordinator(*sprite_cluster.parse_address(args.cluster),
+                                                       worker_wait=args.worker_wait)
+        except (OSError, ValueError) as e:
+            print(f'Cannot listen on {args.cluster}: {e}', file=sys.stderr)
+            return 2
+        print(f'Waiting for {args.min_workers} workers on port {cluster.address[1]}...')
+        cluster.wait_for_workers(args.min_workers)
+    try:
+        summary = sprite_pipeline.run_batch(args.blender, jobs, args.out, args.workers, log_dir, args.threads,
+                                           persistent=not args.fresh_process, cache=cache,
+                                           atlas=args.atlas, atlas_binary=args.atlas_binary, pool=cluster)
+    finally:
+        if cluster is not None:
+            cluster.close()
+    if cluster is not None:
+        summary['cluster'] = cluster.stats()
+
+    print()
+    print(f"Finished {summary['jobs']} jobs in {summary['wall_seconds']:.1f}s "
+          f"({summary['jobs_per_minute']:.1f} jobs/min, {summary['workers']} workers, "
+          f"{summary['worker_utilization'] * 100:.0f}% busy)")
+    print(f"  Succeeded: {summary['succeeded']}  Failed: {summary['failed']}  Sprites written: {summary['sprites_written']}"
+          + (f"  Atlas files written: {summary['atlas_files_written']}" if summary['atlas_files_written'] else ''))
+    if 'cache' in summary:
+        stats = summary['cache']
+        stages = sorted(set(stats['hits']) | set(stats['misses']))
+        counts = ', '.join(f"{stage} {stats['hits'].get(stage, 0)}/{stats['hits'].get(stage, 0) + stats['misses'].get(stage, 0)}"
+                           for stage in stages)
+        print(f"  Cache hits: {counts or 'none'} ({stats['hit_rate'] * 100:.0f}% overall), "
+              f"{stats['evictions']} evicted, {stats['bytes'] / 1024 ** 2:.1f} MB used")
+    if 'atlas' in summary:
+        print(f"  Atlas: {', '.join(summary['atlas'])}")
+    for worker in summary.get('cluster', []):
+        print(f"  Worker {worker['name']}: {worker['tasks']} tasks, {worker['frames']} frames, "
+              f"{worker['frames_per_second']:.2f} frames/s rendering, {worker['utilization'] * 100:.0f}% busy"
+              + (f", {worker['lost']} lost" if worker['lost'] else '') + (f", {worker['failed']} failed" if worker['failed'] else ''))
+    for failure in summary['failures']:
+        print(f"  FAILED {failure['name']}: {failure['error']} (log: {failure['log']})")
+
+    if args.summary:
+        with open(args.summary, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2)
+    return 1 if summary['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
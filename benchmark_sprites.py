@@ -0,0 +1,209 @@
+import os
+import sys
+import json
+import math
+import time
+import hashlib
+import argparse
+import platform
+import statistics
+import numpy as np
+
+import sprite_pipeline
+
+
+BENCHMARK_VERSION = 1
+
+DEFAULT_SIZES = '1k,10k,100k,1m,2m'
+
+# Stages reported per model size: the helper's, Blender's per-frame times and the host's post-processing passes
+STAGES = ('import', 'load prepared', 'bounds', 'framing', 'render views', 'frame render', 'frame write',
+          'blender', 'downscale', 'crop/align', 'write', 'total')
+
+# The post-processing passes timed on the host
+HOST_STAGES = ('downscale', 'crop/align', 'write')
+
+# Stages faster than this are too noisy to call a regression
+MIN_COMPARE_SECONDS = 0.01
+
+
+def parse_count(text):
+    text = text.strip().lower()
+    scale = {'k': 1000, 'm': 1000 ** 2}.get(text[-1:], 1)
+    return int(float(text.rstrip('km')) * scale)
+
+
+def make_model(path, vertices):
+    # A bumpy UV sphere with about the requested vertex count, written as OBJ quads
+    rings = max(3, int(round(math.sqrt(vertices / 2.0))))
+    segments = max(3, vertices // rings)
+    theta = np.linspace(0.05, math.pi - 0.05, rings)[:, None]
+    phi = np.linspace(0.0, 2.0 * math.pi, segments, endpoint=False)[None, :]
+    radius = 1.0 + 0.15 * np.sin(5 * theta) * np.cos(3 * phi)
+    verts = np.stack([radius * np.sin(theta) * np.cos(phi) * 0.6,
+                      radius * np.sin(theta) * np.sin(phi) * 0.4,
+                      radius * np.cos(theta) * 1.0], axis=-1).reshape(-1, 3)
+    index = np.arange(rings * segments).reshape(rings, segments) + 1
+    nxt = np.roll(index, -1, axis=1)
+    faces = np.stack([index[:-1], nxt[:-1], nxt[1:], index[1:]], axis=-1).reshape(-1, 4)
+    with open(path, 'w', encoding='ascii') as f:
+        f.write(f'# synthetic benchmark model, {len(verts)} vertices\n')
+        np.savetxt(f, verts, fmt='v %.6f %.6f %.6f')
+        np.savetxt(f, faces, fmt='f %d %d %d %d')
+    return len(verts)
+
+
+def stub_launcher(work_dir):
+    # The pipeline runs Blender as an executable, so wrap the stand-in script in one
+    stub = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'blender_stub.py')
+    if os.name == 'nt':
+        path = os.path.join(work_dir, 'blender.cmd')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(f'@"{sys.executable}" "{stub}" %*\r\n')
+    else:
+        path = os.path.join(work_dir, 'blender')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(f'#!/bin/sh\nexec "{sys.executable}" "{stub}" "$@"\n')
+        os.chmod(path, 0o755)
+    return path
+
+
+def file_hashes(out_dir, files):
+    hashes = {}
+    for name in files:
+        with open(os.path.join(out_dir, name), 'rb') as f:
+            hashes[name] = hashlib.sha256(f.read()).hexdigest()
+    return hashes
+
+
+def run_once(blender, job, out_dir):
+    start = time.perf_counter()
+    result = sprite_pipeline.generate_job(blender, job, out_dir, log=lambda text: None)
+    total = time.perf_counter() - start
+    timing = result['timing']
+    stages = {stage: seconds for stage, seconds in timing['blender'].items() if stage in STAGES}
+    frames = timing['frames']
+    if frames:
+        stages['frame render'] = sum(f['render'] for f in frames.values())
+        stages['frame write'] = sum(f['write'] for f in frames.values())
+    for entry in result['stages']:
+        if entry['stage'].startswith('render '):
+            # Host-side wall time of the Blender process(es), startup included
+            stages['blender'] = stages.get('blender', 0.0) + (entry['seconds'] or 0.0)
+        elif entry['stage'] in HOST_STAGES and entry['ran']:
+            stages[entry['stage']] = entry['seconds']
+    stages['total'] = total
+    return {'stages': stages, 'frames': frames,
+            'outputs': file_hashes(out_dir, result['files'] + [f"{job['name']}_sprites.json"])}
+
+
+def run_benchmark(blender, sizes, work_dir, repeat=3, settings=None, log=print):
+    os.makedirs(work_dir, exist_ok=True)
+    results = []
+    for count in sizes:
+        model = os.path.join(work_dir, f'bench_{count}.obj')
+        if not os.path.isfile(model):
+            log(f'Generating {count:,}-vertex model...')
+            make_model(model, count)
+        job = sprite_pipeline.make_job(dict(settings or {}, model=model, name=f'bench_{count}'))
+        runs = []
+        for i in range(repeat):
+            runs.append(run_once(blender, job, os.path.join(work_dir, 'out')))
+            log(f"  {count:,} vertices, run {i + 1}/{repeat}: {runs[-1]['stages']['total']:.2f}s")
+        median = {stage: statistics.median(r['stages'][stage] for r in runs)
+                  for stage in STAGES if all(stage in r['stages'] for r in runs)}
+        deterministic = all(r['outputs'] == runs[0]['outputs'] for r in runs)
+        results.append({'vertices': count, 'model_bytes': os.path.getsize(model), 'median': median,
+                        'outputs': runs[0]['outputs'], 'deterministic': deterministic, 'runs': runs})
+    return results
+
+
+def compare(current, baseline, threshold):
+    # Per size and stage: new median / old median. Also flags sprites that differ from the baseline.
+    old = {r['vertices']: r for r in baseline['results']}
+    regressions, lines = [], []
+    for result in current['results']:
+        before = old.get(result['vertices'])
+        if before is None:
+            continue
+        for stage, seconds in result['median'].items():
+            was = before['median'].get(stage)
+            if not was or max(was, seconds) < MIN_COMPARE_SECONDS:
+                continue
+            ratio = seconds / was
+            line = f"{result['vertices']:>9,} {stage:<14} {was:8.3f}s -> {seconds:8.3f}s  x{ratio:.2f}"
+            if ratio > threshold:
+                line += '  REGRESSION'
+                regressions.append(line)
+            lines.append(line)
+        if before.get('outputs') and result['outputs'] != before['outputs']:
+            line = f"{result['vertices']:>9,} output differs from the baseline"
+            regressions.append(line)
+            lines.append(line)
+    return lines, regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Time every stage of sprite generation on synthetic models.')
+    parser.add_argument('--blender', default=None,
+                        help='Blender executable to benchmark (default: the bundled stand-in, which only exercises the host)')
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help=f'Comma-separated vertex counts (default: {DEFAULT_SIZES})')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per size; the median of each stage is reported')
+    parser.add_argument('--img-size', type=int, default=512, help='Render size')
+    parser.add_argument('--pixel-size', type=int, default=64, help='Final sprite size')
+    parser.add_argument('--profile', choices=sprite_pipeline.RENDER_PROFILES, default='final', help='Render profile')
+    parser.add_argument('--transport', choices=sprite_pipeline.TRANSPORTS, default='png', help='Frame transport')
+    parser.add_argument('--work-dir', default=os.path.join(os.getcwd(), 'benchmark'),
+                        help='Folder for generated models and output (models are reused between runs)')
+    parser.add_argument('--out', default=None, help='Write the JSON results to this file')
+    parser.add_argument('--compare', default=None, help='Earlier JSON results to compare against')
+    parser.add_argument('--threshold', type=float, default=1.2,
+                        help='Slowdown ratio counted as a regression in --compare (default: 1.2)')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    os.makedirs(args.work_dir, exist_ok=True)
+    blender = args.blender or stub_launcher(args.work_dir)
+    settings = {'img_size': args.img_size, 'pixel_size': args.pixel_size, 'profile': args.profile,
+                'transport': args.transport}
+    sizes = [parse_count(s) for s in args.sizes.split(',') if s.strip()]
+    results = run_benchmark(blender, sizes, args.work_dir, max(1, args.repeat), settings)
+    report = {
+        'version': BENCHMARK_VERSION,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'machine': {'platform': platform.platform(), 'python': platform.python_version(), 'cpus': os.cpu_count()},
+        'blender': 'stub' if args.blender is None else os.path.abspath(args.blender),
+        'settings': settings,
+        'results': results,
+    }
+
+    print()
+    print(f"{'vertices':>9} " + ' '.join(f'{s:>12}' for s in STAGES))
+    for result in results:
+        print(f"{result['vertices']:>9,} " + ' '.join(
+            f"{result['median'][s]:>11.3f}s" if s in result['median'] else f"{'-':>12}" for s in STAGES))
+    for result in results:
+        if not result['deterministic']:
+            print(f"Warning: {result['vertices']:,}-vertex sprites differed between runs")
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        lines, regressions = compare(report, baseline, args.threshold)
+        print()
+        print(f'Compared with {args.compare}:')
+        for line in lines:
+            print('  ' + line)
+        if regressions:
+            print(f'{len(regressions)} regressions')
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
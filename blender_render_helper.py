@@ -3,135 +3,336 @@ import os
 import math
 import mathutils
 import sys
+import json
+import time
+import traceback
+import contextlib
+import numpy as np
 
-argv = sys.argv
-if '--' in argv:
-    argv = argv[argv.index('--') + 1:]
-else:
-    argv = []
-
-if len(argv) < 8:
-    print('Usage: blender -b --python script.py -- model texture out_dir base_name img_size rotX rotY rotZ camAngle')
-    sys.exit(1)
-
-model_path = argv[0]
-texture_path = argv[1] if argv[1] else None
-out_dir = argv[2]
-base_name = argv[3]
-img_size = int(argv[4])
-rotX = float(argv[5])
-rotY = float(argv[6])
-rotZ = float(argv[7]) if len(argv) > 7 else 0.0
-camAngle = float(argv[8]) if len(argv) > 8 else 90.0
-
-bpy.ops.wm.read_factory_settings(use_empty=True)
-os.makedirs(out_dir, exist_ok=True)
-
-ext = os.path.splitext(model_path)[1].lower()
-
-# Check if FBX is ASCII format (not supported by Blender)
-if ext == '.fbx':
+# Lines starting with this prefix are machine-readable events for the host process
+EVENT_PREFIX = '@@SPRITE '
+
+# Id of the job being rendered, attached to progress events so the host can route them
+current_job_id = None
+
+# Model left loaded by the last keep_model job of a render server: its key and (root, objects, bounds, scene objects)
+loaded_model = None
+
+DIRECTIONS = [
+    ('front', 0),
+    ('front_right', 45),
+    ('right', 90),
+    ('back_right', 135),
+    ('back', 180),
+    ('back_left', 225),
+    ('left', 270),
+    ('front_left', 315),
+]
+
+# For a model that is mirror-symmetric left/right, each left-side view is a flipped right-side view
+MIRROR_PAIRS = {
+    'front_left': 'front_right',
+    'left': 'right',
+    'back_left': 'back_right',
+}
+
+# Share of vertices that must have a mirrored twin for auto-detected symmetry
+SYMMETRY_THRESHOLD = 0.98
+SYMMETRY_MAX_SAMPLES = 200000
+
+# Pixels kept around each direction's projected silhouette so antialiased edges survive the render border
+BORDER_PADDING = 4
+
+# Share of the widest silhouette left empty on each side by tight framing
+TIGHT_MARGIN = 0.03
+
+FRAMING_MODES = ('legacy', 'tight')
+
+# Custom property marking the root of a prepared scene, holding its centered bounds
+PREPARED_BOUNDS = 'sprite_bounds'
+
+# Custom property on the root of a decimated proxy scene, holding how it was built
+PROXY_INFO = 'sprite_proxy'
+
+# Proxy triangle budget per output pixel the model can cover, and a floor for tiny sprites
+PROXY_TRIANGLES_PER_PIXEL = 8
+PROXY_MIN_TRIANGLES = 2000
+
+# Frame file format per transport: 'raw' skips PNG compression for frames the host only reads once
+FRAME_FORMATS = {
+    'png': ('PNG', '.png'),
+    'raw': ('TARGA_RAW', '.tga'),
+}
+
+# Named render quality presets. 'final' matches what factory settings rendered before profiles existed.
+RENDER_PROFILES = {
+    # Flat-lit Workbench: no shading or lighting cost, just the model's colors and silhouette
+    'draft': {'engine': 'BLENDER_WORKBENCH', 'samples': 1, 'tile': 2048},
+    'preview': {'engine': 'BLENDER_EEVEE', 'samples': 4, 'tile': 2048},
+    'final': {'engine': 'BLENDER_EEVEE', 'samples': 64, 'tile': 256},
+}
+
+# Extra passes written from the same render as the colour frame (the mask is the colour alpha, cut on the host).
+# Render layer sockets per pass; older versions call the depth output 'Z'.
+PASS_SOCKETS = {
+    'normal': ('Normal',),
+    'depth': ('Depth', 'Z'),
+}
+
+# Data collections emptied between server jobs instead of reloading factory settings
+RESET_COLLECTIONS = (
+    'objects', 'meshes', 'materials', 'images', 'textures', 'cameras', 'lights',
+    'armatures', 'actions', 'node_groups', 'curves', 'collections',
+)
+
+
+class JobError(Exception):
+    pass
+
+
+@contextlib.contextmanager
+def timed(stage):
+    start = time.perf_counter()
+    yield
+    seconds = time.perf_counter() - start
+    print(f"[timing] {stage}: {seconds * 1000.0:.1f} ms")
+    emit('stage', id=current_job_id, stage=stage, seconds=seconds)
+
+
+def emit(event, **fields):
+    fields['event'] = event
+    print(EVENT_PREFIX + json.dumps(fields), flush=True)
+
+
+def parse_job(argv):
+    if len(argv) == 2 and argv[0] == '--job':
+        return json.loads(argv[1])
+
+    if len(argv) < 8:
+        print('Usage: blender -b --python script.py -- model texture out_dir base_name img_size rotX rotY rotZ camAngle')
+        print('       blender -b --python script.py -- --job <json>')
+        print('       blender -b --python script.py -- --server')
+        sys.exit(1)
+
+    return {
+        'model': argv[0],
+        'texture': argv[1] if argv[1] else None,
+        'out_dir': argv[2],
+        'name': argv[3],
+        'img_size': int(argv[4]),
+        'rotX': float(argv[5]),
+        'rotY': float(argv[6]),
+        'rotZ': float(argv[7]) if len(argv) > 7 else 0.0,
+        'camAngle': float(argv[8]) if len(argv) > 8 else 90.0,
+    }
+
+
+def reset_scene():
+    # Cheaper than read_factory_settings: add-ons and preferences stay loaded
+    scene = bpy.context.scene
+    for obj in list(scene.collection.objects):
+        scene.collection.objects.unlink(obj)
+    for attr in RESET_COLLECTIONS:
+        data = getattr(bpy.data, attr)
+        for block in list(data):
+            data.remove(block)
+    for extra in list(bpy.data.scenes):
+        if extra != scene:
+            bpy.data.scenes.remove(extra)
+
+
+def clear_render_setup(model_objects):
+    # Remove the previous job's camera and light but keep the loaded model
+    keep = {obj.name for obj in model_objects}
+    for obj in list(bpy.context.scene.objects):
+        if obj.name in keep:
+            continue
+        data = obj.data
+        bpy.data.objects.remove(obj)
+        if isinstance(data, bpy.types.Camera) and not data.users:
+            bpy.data.cameras.remove(data)
+        elif isinstance(data, bpy.types.Light) and not data.users:
+            bpy.data.lights.remove(data)
+
+
+def model_key(job):
+    # A kept model is only reused while its files are unchanged
+    files = [job['model'], job.get('texture')]
+    return [[path, os.path.getmtime(path)] if path else None for path in files]
+
+
+def check_fbx_format(model_path):
+    # Check if FBX is ASCII format (not supported by Blender)
     try:
         with open(model_path, 'rb') as f:
             header = f.read(20)
-            # ASCII FBX files start with "; FBX"
-            if header.startswith(b'; FBX') or header.startswith(b';FBX'):
-                print("=" * 80)
-                print("ERROR: This FBX file is in ASCII format, which is not supported by Blender.")
-                print("Please convert it to BINARY FBX format using one of these methods:")
-                print("  1. Autodesk FBX Converter (free download)")
-                print("  2. Open in Blender GUI and re-export as Binary FBX")
-                print("  3. Use another 3D software to export as Binary FBX")
-                print("  4. Try exporting your model as OBJ, GLTF, or GLB instead")
-                print("=" * 80)
-                sys.exit(1)
     except Exception as e:
         print(f"Warning: Could not check FBX format: {e}")
-
-# Import the model
-try:
-    if ext == '.obj':
-        bpy.ops.import_scene.obj(filepath=model_path)
-    elif ext in ('.fbx',):
-        bpy.ops.import_scene.fbx(filepath=model_path)
-    elif ext in ('.gltf', '.glb'):
-        bpy.ops.import_scene.gltf(filepath=model_path)
-    else:
-        bpy.ops.import_scene.obj(filepath=model_path)
-except RuntimeError as e:
-    if "ASCII FBX" in str(e):
+        return
+    # ASCII FBX files start with "; FBX"
+    if header.startswith(b'; FBX') or header.startswith(b';FBX'):
         print("=" * 80)
-        print("ERROR: ASCII FBX format detected!")
-        print("Blender only supports BINARY FBX files.")
-        print("Please convert your FBX file to binary format or use OBJ/GLTF/GLB instead.")
+        print("ERROR: This FBX file is in ASCII format, which is not supported by Blender.")
+        print("Please convert it to BINARY FBX format using one of these methods:")
+        print("  1. Autodesk FBX Converter (free download)")
+        print("  2. Open in Blender GUI and re-export as Binary FBX")
+        print("  3. Use another 3D software to export as Binary FBX")
+        print("  4. Try exporting your model as OBJ, GLTF, or GLB instead")
         print("=" * 80)
-    raise
-
-objs = [o for o in bpy.context.scene.objects if o.type == 'MESH']
-if not objs:
-    print('No mesh found')
-    sys.exit(1)
-
-# Reset all armatures to rest pose and clear animation data
-print("Checking for animations and armatures...")
-for obj in bpy.context.scene.objects:
-    # Clear animation data from all objects to prevent animations from affecting render
-    if obj.animation_data:
-        print(f"Clearing animation data from {obj.name}")
-        obj.animation_data_clear()
-    
-    # For armatures, set to pose mode but don't force rest pose
-    # This preserves the model's default/intended pose
-    if obj.type == 'ARMATURE':
-        print(f"Found armature {obj.name} - keeping current pose")
-        # Don't change pose_position - keep whatever pose the model has
-
-# Note: We are NOT applying armature modifiers anymore
-# This preserves the model's intended pose (e.g., hands in correct position)
-# while still preventing animations from interfering with the render
-
-# Deselect all and reselect mesh objects for joining
-bpy.ops.object.select_all(action='DESELECT')
-
-# For GLB/GLTF files with complex hierarchies, don't join - use a parent empty instead
-all_imported_objs = [o for o in bpy.context.scene.objects if o.type in ('MESH', 'ARMATURE', 'EMPTY')]
-
-# Create a parent empty to control all imported objects
-print("Creating parent empty for rotation control...")
-bpy.ops.object.empty_add(type='PLAIN_AXES', location=(0, 0, 0))
-root = bpy.context.active_object
-root.name = "SpriteRoot"
-
-# Parent all imported objects to this empty
-for obj in all_imported_objs:
-    if obj != root:
-        obj.parent = root
-        obj.matrix_parent_inverse = root.matrix_world.inverted()
-
-# Update scene
-bpy.context.view_layer.update()
-
-# Force center the model at world origin first
-print("Centering model...")
-# Calculate bounding box of all children
-min_b = [1e9]*3
-max_b = [-1e9]*3
-for obj in all_imported_objs:
-    if obj.type == 'MESH':
-        for vert in obj.data.vertices:
-            vx = obj.matrix_world @ vert.co
-            for i in range(3):
-                min_b[i] = min(min_b[i], vx[i])
-                max_b[i] = max(max_b[i], vx[i])
-
-# Calculate center offset
-center = [(min_b[i] + max_b[i]) / 2.0 for i in range(3)]
-print(f"Model center before adjustment: {center}")
-
-# Move the root empty to center the model
-root.location = (-center[0], -center[1], -center[2])
-
-if texture_path:
+        raise JobError('ASCII FBX files are not supported')
+
+
+def import_model(model_path):
+    ext = os.path.splitext(model_path)[1].lower()
+    if ext == '.fbx':
+        check_fbx_format(model_path)
+
+    # Import the model
+    try:
+        if ext == '.obj':
+            bpy.ops.import_scene.obj(filepath=model_path)
+        elif ext in ('.fbx',):
+            bpy.ops.import_scene.fbx(filepath=model_path)
+        elif ext in ('.gltf', '.glb'):
+            bpy.ops.import_scene.gltf(filepath=model_path)
+        else:
+            bpy.ops.import_scene.obj(filepath=model_path)
+    except RuntimeError as e:
+        if "ASCII FBX" in str(e):
+            print("=" * 80)
+            print("ERROR: ASCII FBX format detected!")
+            print("Blender only supports BINARY FBX files.")
+            print("Please convert your FBX file to binary format or use OBJ/GLTF/GLB instead.")
+            print("=" * 80)
+        raise
+
+    objs = [o for o in bpy.context.scene.objects if o.type == 'MESH']
+    if not objs:
+        print('No mesh found')
+        raise JobError('No mesh found')
+
+
+def prepare_hierarchy():
+    # Animation data is kept here (prepared scenes are shared by still and animated jobs); setup_animation
+    # clears it or picks the requested action
+    print("Checking for animations and armatures...")
+    for obj in bpy.context.scene.objects:
+        # For armatures, set to pose mode but don't force rest pose
+        # This preserves the model's default/intended pose
+        if obj.type == 'ARMATURE':
+            print(f"Found armature {obj.name} - keeping current pose")
+            # Don't change pose_position - keep whatever pose the model has
+
+    # Note: We are NOT applying armature modifiers anymore
+    # This preserves the model's intended pose (e.g., hands in correct position)
+
+    # Deselect all and reselect mesh objects for joining
+    bpy.ops.object.select_all(action='DESELECT')
+
+    # For GLB/GLTF files with complex hierarchies, don't join - use a parent empty instead
+    all_imported_objs = [o for o in bpy.context.scene.objects if o.type in ('MESH', 'ARMATURE', 'EMPTY')]
+
+    # Create a parent empty to control all imported objects
+    print("Creating parent empty for rotation control...")
+    bpy.ops.object.empty_add(type='PLAIN_AXES', location=(0, 0, 0))
+    root = bpy.context.active_object
+    root.name = "SpriteRoot"
+
+    # Parent all imported objects to this empty
+    for obj in all_imported_objs:
+        if obj != root:
+            obj.parent = root
+            obj.matrix_parent_inverse = root.matrix_world.inverted()
+
+    # Update scene
+    bpy.context.view_layer.update()
+    return root, all_imported_objs
+
+
+def world_vertices(obj, depsgraph=None):
+    # Bulk-copy vertex positions and transform them with one matrix multiply
+    if depsgraph is not None and obj.modifiers:
+        # Posed/modified geometry is what actually gets rendered
+        evaluated = obj.evaluated_get(depsgraph)
+        mesh = evaluated.to_mesh()
+        try:
+            co = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+            mesh.vertices.foreach_get('co', co)
+        finally:
+            evaluated.to_mesh_clear()
+    else:
+        mesh = obj.data
+        co = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+        mesh.vertices.foreach_get('co', co)
+    matrix = np.array(obj.matrix_world, dtype=np.float64)
+    return co.reshape(-1, 3) @ matrix[:3, :3].T + matrix[:3, 3]
+
+
+def compute_bounds(objs):
+    min_b = np.full(3, np.inf)
+    max_b = np.full(3, -np.inf)
+    vertex_count = 0
+    for obj in objs:
+        if obj.type == 'MESH' and len(obj.data.vertices):
+            coords = world_vertices(obj)
+            min_b = np.minimum(min_b, coords.min(axis=0))
+            max_b = np.maximum(max_b, coords.max(axis=0))
+            vertex_count += len(coords)
+    if not vertex_count:
+        return [0.0]*3, [0.0]*3
+    print(f"Bounds computed from {vertex_count} vertices")
+    return min_b.tolist(), max_b.tolist()
+
+
+def center_model(root, all_imported_objs):
+    # Force center the model at world origin first
+    print("Centering model...")
+    # Calculate bounding box of all children
+    with timed('bounds'):
+        min_b, max_b = compute_bounds(all_imported_objs)
+
+    # Calculate center offset
+    center = [(min_b[i] + max_b[i]) / 2.0 for i in range(3)]
+    print(f"Model center before adjustment: {center}")
+
+    # Move the root empty to center the model
+    root.location = (-center[0], -center[1], -center[2])
+
+    # The root is only translated here, so the centered bounds follow without another pass over the vertices
+    return [min_b[i] - center[i] for i in range(3)], [max_b[i] - center[i] for i in range(3)]
+
+
+def detect_mirror_symmetry(all_imported_objs, rotX, rotY, rotZ):
+    coords = [world_vertices(obj) for obj in all_imported_objs if obj.type == 'MESH' and len(obj.data.vertices)]
+    if not coords:
+        return False
+    coords = np.concatenate(coords)
+    if len(coords) > SYMMETRY_MAX_SAMPLES:
+        coords = coords[np.random.default_rng(0).choice(len(coords), SYMMETRY_MAX_SAMPLES, replace=False)]
+
+    # Put the model in its corrected orientation at the front view; the camera's horizontal axis is world X
+    rotation = mathutils.Euler((math.radians(rotX), math.radians(rotY), math.radians(rotZ)), 'XYZ').to_matrix()
+    pts = coords @ np.array(rotation).T
+    extent = pts.max(axis=0) - pts.min(axis=0)
+    cell = max(float(extent.max()), 1e-6) * 0.005
+    # A mirror-symmetric point set is symmetric about the middle of its X range
+    pts[:, 0] -= (pts[:, 0].max() + pts[:, 0].min()) / 2.0
+
+    # Hash vertices onto a grid and check that every vertex's mirror image lands on an occupied cell
+    grid = np.round(pts / cell).astype(np.int64)
+    grid -= grid.min(axis=0) - 1
+    span = int(grid.max()) + 2
+    keys = np.unique((grid[:, 0] * span + grid[:, 1]) * span + grid[:, 2])
+    mirror_x = grid[:, 0].min() + grid[:, 0].max() - grid[:, 0]
+    found = np.zeros(len(grid), dtype=bool)
+    for dx in (-1, 0, 1):
+        found |= np.isin(((mirror_x + dx) * span + grid[:, 1]) * span + grid[:, 2], keys)
+    score = float(found.mean())
+    print(f"Mirror symmetry score: {score:.3f}")
+    return score >= SYMMETRY_THRESHOLD
+
+
+def apply_texture(texture_path, all_imported_objs):
     mat = bpy.data.materials.new(name='SpriteMaterial')
     mat.use_nodes = True
     bsdf = mat.node_tree.nodes.get('Principled BSDF')
@@ -144,7 +345,7 @@ if texture_path:
     if img:
         tex_node.image = img
         mat.node_tree.links.new(tex_node.outputs['Color'], bsdf.inputs['Base Color'])
-    
+
     # Apply material to all mesh children
     for obj in all_imported_objs:
         if obj.type == 'MESH':
@@ -153,74 +354,544 @@ if texture_path:
             else:
                 obj.data.materials.append(mat)
 
-cam_data = bpy.data.cameras.new('SpriteCam')
-cam_data.type = 'ORTHO'
-cam = bpy.data.objects.new('SpriteCam', cam_data)
-bpy.context.collection.objects.link(cam)
-light_data = bpy.data.lights.new(name='KeyLight', type='SUN')
-light = bpy.data.objects.new('KeyLight', light_data)
-bpy.context.collection.objects.link(light)
-light.rotation_euler = (math.radians(50), 0, math.radians(30))
-
-bpy.context.view_layer.update()
-
-# Calculate bounding box from actual mesh vertices for camera setup
-print("Calculating model bounds for camera...")
-min_b = [1e9]*3
-max_b = [-1e9]*3
-
-# Get world-space coordinates of all vertices from all mesh children
-for obj in all_imported_objs:
-    if obj.type == 'MESH':
-        for vert in obj.data.vertices:
-            vx = obj.matrix_world @ vert.co
-            for i in range(3):
-                min_b[i] = min(min_b[i], vx[i])
-                max_b[i] = max(max_b[i], vx[i])
-
-# Calculate dimensions (but don't move the model)
-dims = [max_b[i] - min_b[i] for i in range(3)]
-max_dim = max(dims) if dims else 1.0
-
-print(f"Model dimensions: {dims}")
-print(f"Max dimension: {max_dim}")
-
-
-
-# Camera setup with adjustable elevation
-cam.data.ortho_scale = max_dim*1.8
-distance = max_dim*3.0
-height = max_dim*0.3  # Much lower height for more side-on view
-cam.location = (0.0, -distance, height)
-cam.rotation_euler = (math.radians(camAngle), 0, 0)
-
-scene = bpy.context.scene
-scene.camera = cam
-scene.render.resolution_x = img_size
-scene.render.resolution_y = img_size
-scene.render.resolution_percentage = 100
-scene.render.image_settings.file_format = 'PNG'
-scene.render.film_transparent = True
 
-DIRECTIONS = [
-    ('front', 0),
-    ('front_right', 45),
-    ('right', 90),
-    ('back_right', 135),
-    ('back', 180),
-    ('back_left', 225),
-    ('left', 270),
-    ('front_left', 315),
-]
+def save_prepared(path, root, bounds, objects):
+    # Store the parented, centered and textured model so later jobs can skip the importer
+    root[PREPARED_BOUNDS] = list(bounds[0]) + list(bounds[1])
+    for image in bpy.data.images:
+        if image.source == 'FILE' and not image.packed_file:
+            try:
+                image.pack()
+            except RuntimeError as e:
+                print(f"Warning: could not pack image {image.name}: {e}")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Keep every action, not just the assigned ones, so animated jobs can pick any of them
+    bpy.data.libraries.write(path, set(objects) | set(bpy.data.actions))
+    print(f"Saved prepared model to {path}")
+
+
+def load_prepared(path):
+    with bpy.data.libraries.load(path, link=False) as (data_from, data_to):
+        data_to.objects = list(data_from.objects)
+        data_to.actions = list(data_from.actions)
+    root = None
+    for obj in data_to.objects:
+        if obj is None:
+            continue
+        bpy.context.scene.collection.objects.link(obj)
+        if PREPARED_BOUNDS in obj:
+            root = obj
+    if root is None:
+        raise JobError(f'Prepared model has no sprite root: {path}')
+    bpy.context.view_layer.update()
+    values = list(root[PREPARED_BOUNDS])
+    all_imported_objs = [o for o in data_to.objects
+                         if o is not None and o is not root and o.type in ('MESH', 'ARMATURE', 'EMPTY')]
+    if not any(o.type == 'MESH' for o in all_imported_objs):
+        raise JobError(f'Prepared model has no mesh: {path}')
+    print(f"Loaded prepared model from {path}")
+    return root, all_imported_objs, (values[:3], values[3:])
+
+
+def prepare_model(job):
+    if job.get('prepared'):
+        try:
+            with timed('load prepared'):
+                return load_prepared(job['prepared'])
+        except (OSError, RuntimeError, JobError) as e:
+            # Fall back to a normal import; the host replaces the entry when we save a new one
+            print(f"Warning: could not load prepared model ({e}), importing instead")
+            reset_scene()
+    with timed('import'):
+        import_model(job['model'])
+    root, all_imported_objs = prepare_hierarchy()
+    bounds = center_model(root, all_imported_objs)
+    if job.get('texture'):
+        with timed('materials'):
+            apply_texture(job['texture'], all_imported_objs)
+    if job.get('save_prepared'):
+        with timed('save prepared'):
+            save_prepared(job['save_prepared'], root, bounds, bpy.context.scene.objects)
+    return root, all_imported_objs, bounds
+
+
+def setup_animation(job, all_imported_objs):
+    if not job.get('action'):
+        # Clear animation data from all objects to prevent animations from affecting render
+        for obj in bpy.context.scene.objects:
+            if obj.animation_data:
+                print(f"Clearing animation data from {obj.name}")
+                obj.animation_data_clear()
+        return
+    action = bpy.data.actions.get(job['action'])
+    if action is None:
+        available = ', '.join(a.name for a in bpy.data.actions) or 'none'
+        raise JobError(f"Action '{job['action']}' not found (available: {available})")
+    # Play the action on whatever it was imported onto, falling back to the armatures
+    targets = [o for o in all_imported_objs if o.animation_data and o.animation_data.action]
+    targets = targets or [o for o in all_imported_objs if o.type == 'ARMATURE']
+    if not targets:
+        raise JobError(f"No armature or animated object to play '{job['action']}' on")
+    for obj in targets:
+        anim = obj.animation_data or obj.animation_data_create()
+        # Only the requested action should drive the pose
+        for track in list(anim.nla_tracks):
+            anim.nla_tracks.remove(track)
+        anim.action = action
+        print(f"Playing action {action.name} on {obj.name}")
+
+
+def job_views(job):
+    # (view, direction, angle, frame) for every sprite; a still has one view per direction, named after it
+    if not job.get('action'):
+        return [(name, name, ang, None) for name, ang in DIRECTIONS]
+    frames = range(int(job['frame_start']), int(job['frame_end']) + 1, int(job.get('frame_step') or 1))
+    return [(f"{frame:04d}_{name}", name, ang, frame) for frame in frames for name, ang in DIRECTIONS]
+
+
+def mesh_triangles(mesh):
+    counts = np.empty(len(mesh.polygons), dtype=np.int32)
+    mesh.polygons.foreach_get('loop_total', counts)
+    return int((counts - 2).sum())
+
+
+def proxy_budget(extents, ortho_scale, pixel_size):
+    # Triangles beyond a few per final sprite pixel can't change the NEAREST-downscaled result
+    span = max(max(e[1] - e[0], e[3] - e[2]) for e in extents.values())
+    pixels = span / ortho_scale * pixel_size
+    return max(PROXY_MIN_TRIANGLES, int(pixels * pixels * PROXY_TRIANGLES_PER_PIXEL))
+
+
+def decimate_meshes(all_imported_objs, budget):
+    users = {}
+    for obj in all_imported_objs:
+        if obj.type == 'MESH':
+            users.setdefault(obj.data, []).append(obj)
+    before = sum(mesh_triangles(mesh) * len(objs) for mesh, objs in users.items())
+    if before <= budget:
+        return before, before
+    ratio = budget / before
+    for mesh in users:
+        # Decimate through a throwaway object so armature and other modifiers on the real objects stay live
+        temp = bpy.data.objects.new('SpriteProxy', mesh)
+        bpy.context.scene.collection.objects.link(temp)
+        modifier = temp.modifiers.new('Decimate', 'DECIMATE')
+        modifier.decimate_type = 'COLLAPSE'
+        modifier.ratio = ratio
+        depsgraph = bpy.context.evaluated_depsgraph_get()
+        proxy = bpy.data.meshes.new_from_object(temp.evaluated_get(depsgraph), preserve_all_data_layers=True,
+                                                depsgraph=depsgraph)
+        bpy.data.objects.remove(temp)
+        name = mesh.name
+        mesh.user_remap(proxy)
+        bpy.data.meshes.remove(mesh)
+        proxy.name = name
+    bpy.context.view_layer.update()
+    after = sum(mesh_triangles(obj.data) for obj in all_imported_objs if obj.type == 'MESH')
+    return before, after
+
+
+def apply_proxy(job, root, all_imported_objs, bounds, objects, extents, ortho_scale):
+    if PROXY_INFO in root:
+        info = json.loads(root[PROXY_INFO])
+        info['reused'] = True
+        print(f"Using cached proxy mesh: {info['triangles_after']} of {info['triangles_before']} triangles "
+              f"(skipped {info['seconds']:.2f}s of decimation)")
+        return info
+    budget = proxy_budget(extents, ortho_scale, job['proxy_pixels'])
+    start = time.perf_counter()
+    before, after = decimate_meshes(all_imported_objs, budget)
+    info = {'budget': budget, 'triangles_before': before, 'triangles_after': after,
+            'seconds': time.perf_counter() - start, 'reused': False}
+    if after < before:
+        print(f"Proxy mesh: {before} -> {after} triangles ({100.0 * (1 - after / before):.0f}% fewer, "
+              f"budget {budget}) in {info['seconds']:.2f}s")
+    else:
+        print(f"Proxy mesh: {before} triangles already within budget {budget}")
+    root[PROXY_INFO] = json.dumps(info)
+    if job.get('save_proxy'):
+        with timed('save proxy'):
+            save_prepared(job['save_proxy'], root, bounds, objects)
+    return info
+
+
+def setup_camera(bounds, img_size, camAngle):
+    cam_data = bpy.data.cameras.new('SpriteCam')
+    cam_data.type = 'ORTHO'
+    cam = bpy.data.objects.new('SpriteCam', cam_data)
+    bpy.context.collection.objects.link(cam)
+    light_data = bpy.data.lights.new(name='KeyLight', type='SUN')
+    light = bpy.data.objects.new('KeyLight', light_data)
+    bpy.context.collection.objects.link(light)
+    light.rotation_euler = (math.radians(50), 0, math.radians(30))
 
-for name, ang in DIRECTIONS:
-    # Apply full rotation: user corrections (X, Y) + direction angle (Z)
-    rotation = (math.radians(rotX), math.radians(rotY), math.radians(ang + rotZ))
-    root.rotation_euler = rotation
     bpy.context.view_layer.update()
-    print(f"Rendering {name}: rotation = ({rotX}°, {rotY}°, {ang + rotZ}°)")
-    fname = os.path.join(out_dir, f"{base_name}_{name}.png")
-    scene.render.filepath = bpy.path.abspath(fname)
-    bpy.ops.render.render(write_still=True)
-    print('Wrote', fname)
 
+    # Reuse the bounding box measured while centering the model
+    min_b, max_b = bounds
+
+    # Calculate dimensions (but don't move the model)
+    dims = [max_b[i] - min_b[i] for i in range(3)]
+    max_dim = max(dims) if dims else 1.0
+
+    print(f"Model dimensions: {dims}")
+    print(f"Max dimension: {max_dim}")
+
+    # Camera setup with adjustable elevation
+    cam.data.ortho_scale = max_dim*1.8
+    distance = max_dim*3.0
+    height = max_dim*0.3  # Much lower height for more side-on view
+    cam.location = (0.0, -distance, height)
+    cam.rotation_euler = (math.radians(camAngle), 0, 0)
+
+    scene = bpy.context.scene
+    scene.camera = cam
+    scene.render.resolution_x = img_size
+    scene.render.resolution_y = img_size
+    scene.render.resolution_percentage = 100
+    scene.render.film_transparent = True
+    return scene
+
+
+def silhouette_extents(root, all_imported_objs, cam, job, views):
+    # Camera-plane extents of the model for every view, posed exactly as render_views will pose it
+    scene = bpy.context.scene
+    basis = np.array(cam.rotation_euler.to_matrix())
+    offset = np.array(root.location) - np.array(cam.location)
+    extents = {}
+    for frame in sorted({view[3] for view in views}, key=lambda f: -1 if f is None else f):
+        if frame is not None:
+            scene.frame_set(frame)
+        bpy.context.view_layer.update()
+        depsgraph = bpy.context.evaluated_depsgraph_get()
+        coords = [world_vertices(obj, depsgraph) for obj in all_imported_objs
+                  if obj.type == 'MESH' and len(obj.data.vertices)]
+        if not coords:
+            return {}
+        inverse = np.array(root.matrix_world.inverted())
+        local = np.concatenate(coords) @ inverse[:3, :3].T + inverse[:3, 3]
+        for view, name, ang, view_frame in views:
+            if view_frame != frame:
+                continue
+            rotation = mathutils.Euler((math.radians(job['rotX']), math.radians(job['rotY']), math.radians(ang + job['rotZ'])), 'XYZ')
+            # Fold the camera's right/up axes into the rotation so each direction costs one multiply
+            uv = local @ (np.array(rotation.to_matrix()).T @ basis[:, :2]) + offset @ basis[:, :2]
+            extents[view] = [float(uv[:, 0].min()), float(uv[:, 0].max()), float(uv[:, 1].min()), float(uv[:, 1].max())]
+    return extents
+
+
+def fit_tight_framing(cam, extents):
+    # One ortho scale and camera position for all views, so sprites don't jitter between angles or frames
+    umin = min(e[0] for e in extents.values())
+    umax = max(e[1] for e in extents.values())
+    vmin = min(e[2] for e in extents.values())
+    vmax = max(e[3] for e in extents.values())
+    span = max(umax - umin, vmax - vmin)
+    if span <= 0:
+        return extents
+    uc, vc = (umin + umax) / 2.0, (vmin + vmax) / 2.0
+    basis = cam.rotation_euler.to_matrix()
+    cam.location = cam.location + basis.col[0] * uc + basis.col[1] * vc
+    cam.data.ortho_scale = span * (1.0 + 2.0 * TIGHT_MARGIN)
+    print(f"Tight framing: ortho scale {cam.data.ortho_scale:.4f}")
+    return {name: [e[0] - uc, e[1] - uc, e[2] - vc, e[3] - vc] for name, e in extents.items()}
+
+
+def border_rect(extent, ortho_scale, img_size):
+    # Pixel rectangle (left, top, right, bottom) covering the silhouette, or None to render the full frame
+    scale = img_size / ortho_scale
+    half = img_size / 2.0
+    x0 = max(0, math.floor(half + extent[0] * scale) - BORDER_PADDING)
+    x1 = min(img_size, math.ceil(half + extent[1] * scale) + BORDER_PADDING)
+    y0 = max(0, math.floor(half - extent[3] * scale) - BORDER_PADDING)
+    y1 = min(img_size, math.ceil(half - extent[2] * scale) + BORDER_PADDING)
+    if x1 <= x0 or y1 <= y0 or (x1 - x0, y1 - y0) == (img_size, img_size):
+        return None
+    return [x0, y0, x1, y1]
+
+
+def set_render_border(scene, rect, img_size):
+    render = scene.render
+    render.use_border = rect is not None
+    render.use_crop_to_border = rect is not None
+    if rect is None:
+        return
+    x0, y0, x1, y1 = rect
+    # Blender truncates border * resolution to whole pixels and measures Y from the bottom
+    render.border_min_x = (x0 + 0.25) / img_size
+    render.border_max_x = min(1.0, (x1 + 0.25) / img_size)
+    render.border_min_y = (img_size - y1 + 0.25) / img_size
+    render.border_max_y = min(1.0, (img_size - y0 + 0.25) / img_size)
+
+
+def apply_render_profile(scene, name, threads):
+    if name not in RENDER_PROFILES:
+        raise JobError(f'Unknown render profile: {name}')
+    profile = RENDER_PROFILES[name]
+    render = scene.render
+    engines = render.bl_rna.properties['engine'].enum_items.keys()
+    engine = profile['engine']
+    if engine not in engines and engine + '_NEXT' in engines:
+        # Blender 4.2 renamed EEVEE
+        engine += '_NEXT'
+    render.engine = engine
+    if profile['engine'] == 'BLENDER_WORKBENCH':
+        scene.display.shading.light = 'FLAT'
+        scene.display.shading.color_type = 'TEXTURE'
+        scene.display.render_aa = 'OFF' if profile['samples'] <= 1 else str(profile['samples'])
+    else:
+        scene.eevee.taa_render_samples = profile['samples']
+    # Tiles only exist for Cycles (3.0+) and for every engine before 3.0
+    if hasattr(scene, 'cycles') and hasattr(scene.cycles, 'tile_size'):
+        scene.cycles.tile_size = profile['tile']
+    if hasattr(render, 'tile_x'):
+        render.tile_x = render.tile_y = profile['tile']
+    # The host divides the machine's cores between concurrent Blender processes
+    if threads:
+        render.threads_mode = 'FIXED'
+        render.threads = int(threads)
+    else:
+        render.threads_mode = 'AUTO'
+    print(f"Render profile {name}: {render.engine}, {profile['samples']} samples, "
+          f"{render.threads if threads else 'auto'} threads")
+
+
+def depth_range(root, cam, bounds):
+    # Camera depths the model can reach in any direction: it turns about the root, and every vertex lies
+    # within the root's distance from the bbox centre plus half the bbox diagonal
+    min_b, max_b = bounds
+    pivot = mathutils.Vector(root.location)
+    radius = pivot.length + 0.5 * math.sqrt(sum((max_b[i] - min_b[i]) ** 2 for i in range(3)))
+    forward = cam.rotation_euler.to_matrix() @ mathutils.Vector((0.0, 0.0, -1.0))
+    distance = (pivot - cam.location).dot(forward)
+    return [max(0.0, distance - radius), distance + radius]
+
+
+def setup_passes(scene, passes, out_dir):
+    # Route the requested passes of every render to a float EXR file output node; None without passes
+    wanted = [name for name in PASS_SOCKETS if name in (passes or ())]
+    view_layer = bpy.context.view_layer
+    view_layer.use_pass_normal = 'normal' in wanted
+    view_layer.use_pass_z = 'depth' in wanted
+    # Server jobs share the scene, so a job without passes switches the compositor off again
+    scene.use_nodes = bool(wanted)
+    if not wanted:
+        return None
+    if 'normal' in wanted and scene.render.engine == 'BLENDER_WORKBENCH':
+        raise JobError('The draft profile (Workbench) has no normal pass; use the preview or final profile')
+    tree = scene.node_tree
+    tree.nodes.clear()
+    layers = tree.nodes.new('CompositorNodeRLayers')
+    composite = tree.nodes.new('CompositorNodeComposite')
+    tree.links.new(layers.outputs['Image'], composite.inputs['Image'])
+    output = tree.nodes.new('CompositorNodeOutputFile')
+    output.base_path = bpy.path.abspath(out_dir)
+    # 32-bit EXR keeps the values as rendered: no view transform, no quantization
+    output.format.file_format = 'OPEN_EXR'
+    output.format.color_mode = 'RGB'
+    output.format.color_depth = '32'
+    output.file_slots.clear()
+    for name in wanted:
+        socket = next((layers.outputs[s] for s in PASS_SOCKETS[name] if s in layers.outputs), None)
+        if socket is None or not socket.enabled:
+            raise JobError(f'The {scene.render.engine} engine has no {name} pass')
+        output.file_slots.new(name)
+        tree.links.new(socket, output.inputs[-1])
+    return output, wanted
+
+
+def save_passes(output, names, prefix, frame):
+    # Turn the compositor's EXRs into .npy arrays, which the host reads without an EXR decoder
+    saved = {}
+    for slot, name in zip(output.file_slots, names):
+        path = os.path.join(output.base_path, f'{slot.path}{frame:04d}.exr')
+        img = bpy.data.images.load(path, check_existing=False)
+        try:
+            img.colorspace_settings.name = 'Non-Color'
+            width, height = img.size
+            pixels = np.empty(width * height * 4, dtype=np.float32)
+            img.pixels.foreach_get(pixels)
+        finally:
+            bpy.data.images.remove(img)
+        os.remove(path)
+        # Blender stores rows bottom-up; normals keep XYZ, depth one channel
+        pixels = pixels.reshape(height, width, 4)[::-1]
+        data = pixels[..., :3] if name == 'normal' else pixels[..., :1]
+        saved[name] = f'{prefix}_{name}.npy'
+        np.save(saved[name], np.ascontiguousarray(data))
+    return saved
+
+
+def render_views(job, root, scene, views, mirrored, borders):
+    rotX, rotY, rotZ = job['rotX'], job['rotY'], job['rotZ']
+    file_format, ext = FRAME_FORMATS[job.get('transport') or 'png']
+    scene.render.image_settings.file_format = file_format
+    scene.render.image_settings.color_mode = 'RGBA'
+    apply_render_profile(scene, job.get('profile') or 'final', job.get('threads'))
+    pass_output = setup_passes(scene, job.get('passes'), job['out_dir'])
+    # Render only the requested views (the host may already have the others)
+    wanted = job.get('views') or [view[0] for view in views]
+    todo = [v for v in views if v[0] in wanted and v[0] not in mirrored]
+    emit('plan', id=current_job_id, views=[v[0] for v in todo], mirrored=[v for v in wanted if v in mirrored])
+    frames = {}
+    passes = {}
+    current = None
+    # Views are ordered frame by frame, so each animation frame is evaluated once for all directions
+    for view, name, ang, frame in todo:
+        if frame is not None and frame != current:
+            scene.frame_set(frame)
+            current = frame
+        # Apply full rotation: user corrections (X, Y) + direction angle (Z)
+        rotation = (math.radians(rotX), math.radians(rotY), math.radians(ang + rotZ))
+        root.rotation_euler = rotation
+        bpy.context.view_layer.update()
+        set_render_border(scene, borders.get(view), job['img_size'])
+        label = name if frame is None else f"{name} frame {frame}"
+        print(f"Rendering {label}: rotation = ({rotX}°, {rotY}°, {ang + rotZ}°)")
+        fname = os.path.join(job['out_dir'], f"{job['name']}_{view}{ext}")
+        scene.render.filepath = bpy.path.abspath(fname)
+        prefix = os.path.splitext(scene.render.filepath)[0]
+        if pass_output is not None:
+            for slot, pass_name in zip(pass_output[0].file_slots, pass_output[1]):
+                slot.path = f"{job['name']}_{view}_{pass_name}_"
+        # Render and save separately so the timing report can tell the two apart
+        start = time.perf_counter()
+        bpy.ops.render.render()
+        rendered = time.perf_counter()
+        bpy.data.images['Render Result'].save_render(filepath=scene.render.filepath, scene=scene)
+        if pass_output is not None:
+            passes[view] = save_passes(pass_output[0], pass_output[1], prefix, scene.frame_current)
+        print('Wrote', fname)
+        frames[view] = fname
+        emit('frame', id=current_job_id, view=view, index=len(frames), total=len(todo),
+             render=rendered - start, write=time.perf_counter() - rendered)
+    return frames, passes
+
+
+def run_job(job, loaded=None):
+    global loaded_model
+    os.makedirs(job['out_dir'], exist_ok=True)
+    if loaded is None:
+        root, all_imported_objs, bounds = prepare_model(job)
+        model_objects = list(bpy.context.scene.objects)
+    else:
+        root, all_imported_objs, bounds, model_objects = loaded
+        clear_render_setup(model_objects)
+        # The last job left the root turned to its final view; framing and symmetry detection expect it unturned
+        root.rotation_euler = (0.0, 0.0, 0.0)
+        bpy.context.view_layer.update()
+    if job.get('keep_model') and not job.get('proxy_pixels') and not job.get('action'):
+        # Proxies and animations change the model, so only plain stills leave it reusable
+        loaded_model = (model_key(job), (root, all_imported_objs, bounds, model_objects))
+    else:
+        # This job may decimate or pose a model it reused, so the next job imports afresh
+        loaded_model = None
+    setup_animation(job, all_imported_objs)
+    views = job_views(job)
+    scene = setup_camera(bounds, job['img_size'], job['camAngle'])
+    cam = scene.camera
+
+    framing = job.get('framing') or 'legacy'
+    if framing not in FRAMING_MODES:
+        raise JobError(f'Unknown framing mode: {framing}')
+    borders = {}
+    extents = {}
+    if framing == 'tight' or job.get('crop_border', True) or job.get('proxy_pixels'):
+        with timed('framing'):
+            extents = silhouette_extents(root, all_imported_objs, cam, job, views)
+            if framing == 'tight' and extents:
+                extents = fit_tight_framing(cam, extents)
+            if job.get('crop_border', True):
+                borders = {name: border_rect(e, cam.data.ortho_scale, job['img_size']) for name, e in extents.items()}
+
+    mode = job.get('symmetry') or 'off'
+    symmetric = mode == 'force'
+    if mode == 'auto':
+        with timed('symmetry'):
+            symmetric = detect_mirror_symmetry(all_imported_objs, job['rotX'], job['rotY'], job['rotZ'])
+    mirrored = {}
+    if symmetric:
+        by_key = {(name, frame): view for view, name, _, frame in views}
+        mirrored = {view: by_key[(MIRROR_PAIRS[name], frame)] for view, name, _, frame in views if name in MIRROR_PAIRS}
+        print(f"Model is mirror-symmetric: skipping {', '.join(MIRROR_PAIRS)} (flipped from the right side)")
+
+    proxy = None
+    if job.get('proxy_pixels') and extents:
+        with timed('proxy'):
+            proxy = apply_proxy(job, root, all_imported_objs, bounds, model_objects, extents, cam.data.ortho_scale)
+    with timed('render views'):
+        frames, passes = render_views(job, root, scene, views, mirrored, borders)
+    return {
+        'frames': frames,
+        'borders': {name: borders.get(name) for name in frames},
+        'passes': passes,
+        'prepared': job.get('save_prepared') if job.get('save_prepared') and os.path.isfile(job['save_prepared']) else None,
+        'proxy': proxy,
+        'proxy_file': job.get('save_proxy') if job.get('save_proxy') and os.path.isfile(job['save_proxy']) else None,
+        'framing': {'mode': framing, 'ortho_scale': cam.data.ortho_scale, 'camera': list(cam.location),
+                    'depth_range': depth_range(root, cam, bounds)},
+        'symmetric': symmetric,
+        'mirrored': mirrored,
+    }
+
+
+def serve():
+    # Stay resident and render one JSON job per stdin line, reporting a result event for each
+    global current_job_id, loaded_model
+    print('Sprite render server ready')
+    emit('ready', pid=os.getpid())
+    for line in sys.stdin:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            job = json.loads(line)
+        except ValueError as e:
+            emit('result', id=None, ok=False, error=f'Invalid job: {e}')
+            continue
+        if job.get('command') == 'quit':
+            break
+
+        current_job_id = job.get('id')
+        start = time.perf_counter()
+        try:
+            loaded = None
+            if job.get('keep_model') and loaded_model and loaded_model[0] == model_key(job):
+                # Quick previews of the same model skip the import
+                loaded = loaded_model[1]
+            else:
+                loaded_model = None
+                reset_scene()
+            result = run_job(job, loaded)
+            emit('result', id=job.get('id'), ok=True, seconds=time.perf_counter() - start, **result)
+        except Exception as e:
+            traceback.print_exc()
+            loaded_model = None
+            emit('result', id=job.get('id'), ok=False, error=str(e), seconds=time.perf_counter() - start)
+
+
+def main():
+    argv = sys.argv
+    if '--' in argv:
+        argv = argv[argv.index('--') + 1:]
+    else:
+        argv = []
+
+    server = '--server' in argv
+    job = None if server else parse_job(argv)
+
+    bpy.ops.wm.read_factory_settings(use_empty=True)
+
+    if server:
+        serve()
+        return
+
+    try:
+        result = run_job(job)
+    except JobError:
+        sys.exit(1)
+    emit('result', id=None, ok=True, **result)
+
+
+if __name__ == '__main__':
+    main()
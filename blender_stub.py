@@ -0,0 +1,199 @@
+# Stand-in for Blender that speaks the render helper's protocol (--job / --server, @@SPRITE events)
+# and writes deterministic PNGs, so the host side can be benchmarked and checked without Blender.
+# It only reads the vertices of OBJ models and draws them as shaded points.
+import os
+import sys
+import json
+import math
+import time
+import contextlib
+import numpy as np
+from PIL import Image
+
+EVENT_PREFIX = '@@SPRITE '
+
+# Must match blender_render_helper.py
+DIRECTIONS = [
+    ('front', 0),
+    ('front_right', 45),
+    ('right', 90),
+    ('back_right', 135),
+    ('back', 180),
+    ('back_left', 225),
+    ('left', 270),
+    ('front_left', 315),
+]
+MIRROR_PAIRS = {
+    'front_left': 'front_right',
+    'left': 'right',
+    'back_left': 'back_right',
+}
+BORDER_PADDING = 4
+FRAME_FORMATS = {
+    'png': ('PNG', '.png'),
+    'raw': ('TGA', '.tga'),
+}
+
+current_job_id = None
+
+
+def emit(event, **fields):
+    fields['event'] = event
+    print(EVENT_PREFIX + json.dumps(fields), flush=True)
+
+
+@contextlib.contextmanager
+def timed(stage):
+    start = time.perf_counter()
+    yield
+    emit('stage', id=current_job_id, stage=stage, seconds=time.perf_counter() - start)
+
+
+def load_vertices(path):
+    with open(path, 'rb') as f:
+        lines = [line[2:] for line in f if line.startswith(b'v ')]
+    if not lines:
+        raise ValueError(f'No vertices in {path}')
+    return np.array(b' '.join(lines).split(), dtype=np.float64).reshape(-1, 3)
+
+
+def job_views(job):
+    if not job.get('action'):
+        return [(name, name, angle, None) for name, angle in DIRECTIONS]
+    frames = range(job['frame_start'], job['frame_end'] + 1, job.get('frame_step') or 1)
+    return [(f'{frame:04d}_{name}', name, angle, frame) for frame in frames for name, angle in DIRECTIONS]
+
+
+def rotation(x, y, z):
+    x, y, z = math.radians(x), math.radians(y), math.radians(z)
+    rx = np.array([[1, 0, 0], [0, math.cos(x), -math.sin(x)], [0, math.sin(x), math.cos(x)]])
+    ry = np.array([[math.cos(y), 0, math.sin(y)], [0, 1, 0], [-math.sin(y), 0, math.cos(y)]])
+    rz = np.array([[math.cos(z), -math.sin(z), 0], [math.sin(z), math.cos(z), 0], [0, 0, 1]])
+    return rz @ ry @ rx
+
+
+def project(verts, job, angle, frame, ortho_scale):
+    size = job['img_size']
+    points = verts @ rotation(job['rotX'], job['rotY'], angle + job['rotZ']).T
+    if frame is not None:
+        # A deterministic "animation": the model bobs up and down
+        points = points + [0.0, 0.0, 0.05 * ortho_scale * math.sin(frame)]
+    px = np.clip(((points[:, 0] / ortho_scale) + 0.5) * size, 0, size - 1).astype(np.int64)
+    py = np.clip((0.5 - points[:, 2] / ortho_scale) * size, 0, size - 1).astype(np.int64)
+    return px, py, points
+
+
+def render_view(verts, job, angle, frame, ortho_scale):
+    size = job['img_size']
+    px, py, points = project(verts, job, angle, frame, ortho_scale)
+    depth = points[:, 1]
+    # Nearest point wins: draw far to near
+    order = np.argsort(-depth, kind='stable')
+    shade = (96 + 159 * (depth.max() - depth) / max(1e-9, np.ptp(depth))).astype(np.uint8)
+    rgba = np.zeros((size, size, 4), dtype=np.uint8)
+    rgba[py[order], px[order], 0] = shade[order]
+    rgba[py[order], px[order], 1] = shade[order] // 2
+    rgba[py[order], px[order], 2] = 32
+    rgba[py[order], px[order], 3] = 255
+    # Passes like Blender's: camera distance (the camera sits ortho_scale in front) and a normal per point,
+    # here simply its direction from the centre
+    passes = {}
+    if 'depth' in (job.get('passes') or ()):
+        passes['depth'] = np.full((size, size, 1), 1e10, dtype=np.float32)
+        passes['depth'][py[order], px[order], 0] = depth[order] + ortho_scale
+    if 'normal' in (job.get('passes') or ()):
+        normals = points / np.maximum(np.linalg.norm(points, axis=1, keepdims=True), 1e-9)
+        passes['normal'] = np.zeros((size, size, 3), dtype=np.float32)
+        passes['normal'][py[order], px[order]] = normals[order]
+    box = (int(px.min()), int(py.min()), int(px.max()) + 1, int(py.max()) + 1)
+    return Image.fromarray(rgba, 'RGBA'), passes, box
+
+
+def run_job(job):
+    os.makedirs(job['out_dir'], exist_ok=True)
+    if job.get('prepared') and os.path.isfile(job['prepared']):
+        with timed('load prepared'):
+            with open(job['prepared'], 'rb') as f:
+                verts = np.load(f)
+    else:
+        with timed('import'):
+            verts = load_vertices(job['model'])
+        if job.get('save_prepared'):
+            with timed('save prepared'):
+                with open(job['save_prepared'], 'wb') as f:
+                    np.save(f, verts)
+    with timed('bounds'):
+        verts = verts - (verts.min(axis=0) + verts.max(axis=0)) / 2.0
+        ortho_scale = float(np.ptp(verts, axis=0).max()) * 1.8 or 1.0
+        radius = float(np.linalg.norm(verts, axis=1).max())
+
+    views = job_views(job)
+    mirrored = {}
+    if job.get('symmetry') == 'force':
+        by_key = {(name, frame): view for view, name, _, frame in views}
+        mirrored = {view: by_key[(MIRROR_PAIRS[name], frame)] for view, name, _, frame in views if name in MIRROR_PAIRS}
+    wanted = job.get('views') or [view[0] for view in views]
+    todo = [v for v in views if v[0] in wanted and v[0] not in mirrored]
+    emit('plan', id=current_job_id, views=[v[0] for v in todo], mirrored=[v for v in wanted if v in mirrored])
+
+    file_format, ext = FRAME_FORMATS[job.get('transport') or 'png']
+    frames, borders, passes = {}, {}, {}
+    with timed('render views'):
+        for view, name, angle, frame in todo:
+            start = time.perf_counter()
+            img, arrays, box = render_view(verts, job, angle, frame, ortho_scale)
+            border = None
+            if job.get('crop_border', True):
+                size = job['img_size']
+                border = [max(0, box[0] - BORDER_PADDING), max(0, box[1] - BORDER_PADDING),
+                          min(size, box[2] + BORDER_PADDING), min(size, box[3] + BORDER_PADDING)]
+                img = img.crop(border)
+                arrays = {key: data[border[1]:border[3], border[0]:border[2]] for key, data in arrays.items()}
+            rendered = time.perf_counter()
+            path = os.path.join(job['out_dir'], f"{job['name']}_{view}{ext}")
+            img.save(path, file_format, **({'optimize': False} if file_format == 'PNG' else {}))
+            for key, data in arrays.items():
+                passes.setdefault(view, {})[key] = os.path.join(job['out_dir'], f"{job['name']}_{view}_{key}.npy")
+                np.save(passes[view][key], np.ascontiguousarray(data))
+            frames[view] = path
+            borders[view] = border
+            emit('frame', id=current_job_id, view=view, index=len(frames), total=len(todo),
+                 render=rendered - start, write=time.perf_counter() - rendered)
+    return {
+        'frames': frames,
+        'borders': borders,
+        'passes': passes,
+        'prepared': job.get('save_prepared') if job.get('save_prepared') and os.path.isfile(job['save_prepared']) else None,
+        'proxy': None,
+        'proxy_file': None,
+        'framing': {'mode': 'legacy', 'ortho_scale': ortho_scale, 'camera': [0.0, -ortho_scale, 0.0],
+                    'depth_range': [max(0.0, ortho_scale - radius), ortho_scale + radius]},
+        'symmetric': bool(mirrored),
+        'mirrored': mirrored,
+    }
+
+
+def main():
+    global current_job_id
+    argv = sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else []
+    if '--server' in argv:
+        emit('ready', pid=os.getpid())
+        for line in sys.stdin:
+            if not line.strip():
+                continue
+            job = json.loads(line)
+            if job.get('command') == 'quit':
+                break
+            current_job_id = job.get('id')
+            start = time.perf_counter()
+            try:
+                emit('result', id=current_job_id, ok=True, seconds=time.perf_counter() - start, **run_job(job))
+            except Exception as e:
+                emit('result', id=current_job_id, ok=False, error=str(e), seconds=time.perf_counter() - start)
+        return
+    job = json.loads(argv[argv.index('--job') + 1])
+    emit('result', id=None, ok=True, **run_job(job))
+
+
+if __name__ == '__main__':
+    main()
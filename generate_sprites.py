@@ -1,13 +1,24 @@
 import sys
 import os
+import time
+import shutil
+import tempfile
+import collections
 import subprocess
 from PyQt5 import QtWidgets, QtCore, QtGui
-from PIL import Image
 import threading
 
+import sprite_cache
+import sprite_pipeline
+from sprite_pipeline import DEFAULT_BLENDER
 
-DEFAULT_BLENDER = r"C:\Program Files\Blender Foundation\Blender 3.6\blender.exe"
-BLENDER_SCRIPT_NAME = "blender_render_helper.py"
+# The console keeps only the newest lines; the full output can go to a log file instead
+LOG_MAX_LINES = 2000
+LOG_FLUSH_MS = 100
+
+# The live preview renders once the settings have been left alone this long
+PREVIEW_DEBOUNCE_MS = 300
+PREVIEW_DISPLAY_SIZE = 192
 
 class SpriteGUI(QtWidgets.QWidget):
     def __init__(self):
@@ -143,6 +154,15 @@ class SpriteGUI(QtWidgets.QWidget):
         
         self.btn_texture = QtWidgets.QPushButton('Load Texture')
         files_layout.addWidget(self.btn_texture)
+
+        files_layout.addSpacing(10)
+
+        self.palette_label = QtWidgets.QLabel('No palette selected (optional, e.g. PLAYPAL)')
+        self.palette_label.setObjectName('fileLabel')
+        files_layout.addWidget(self.palette_label)
+
+        self.btn_palette = QtWidgets.QPushButton('Load Palette')
+        files_layout.addWidget(self.btn_palette)
         
         files_group.setLayout(files_layout)
         main_layout.addWidget(files_group)
@@ -160,6 +180,16 @@ class SpriteGUI(QtWidgets.QWidget):
         form.addRow('Sprite name:', self.base_name)
         form.addRow('Render size:', self.img_size)
         form.addRow('Final pixel size:', self.pixel_size)
+
+        self.action = QtWidgets.QLineEdit('')
+        self.action.setPlaceholderText('Leave empty for a still pose')
+        self.action.setToolTip('Name of the animation action to render, e.g. Walk')
+        form.addRow('Animation action:', self.action)
+
+        self.frame_range = QtWidgets.QLineEdit('')
+        self.frame_range.setPlaceholderText('e.g. 1-24 or 1-24/2')
+        self.frame_range.setToolTip('Frames of the action to render: start-end, optionally /step')
+        form.addRow('Frames:', self.frame_range)
         
         rotation_label = QtWidgets.QLabel('Model Rotation Correction')
         rotation_label.setObjectName('sectionLabel')
@@ -179,9 +209,89 @@ class SpriteGUI(QtWidgets.QWidget):
         
         self.camAngle = QtWidgets.QLineEdit('90')
         form.addRow('Camera angle:', self.camAngle)
+
+        self.symmetry = QtWidgets.QComboBox()
+        self.symmetry.addItem('Off (render all 8)', 'off')
+        self.symmetry.addItem('Auto-detect', 'auto')
+        self.symmetry.addItem('Force (mirror left from right)', 'force')
+        self.symmetry.setToolTip('Symmetric models only need 5 renders; the left side is flipped from the right')
+        form.addRow('Mirror symmetry:', self.symmetry)
+
+        self.profile = QtWidgets.QComboBox()
+        self.profile.addItem('Final (EEVEE, 64 samples)', 'final')
+        self.profile.addItem('Preview (EEVEE, 4 samples)', 'preview')
+        self.profile.addItem('Draft (flat Workbench)', 'draft')
+        self.profile.setToolTip('Lower profiles render much faster; useful for checking framing and rotation')
+        form.addRow('Render profile:', self.profile)
+
+        self.tight_framing = QtWidgets.QCheckBox('Fit camera to the model')
+        self.tight_framing.setToolTip('Zoom the camera so the model fills the render in every direction')
+        form.addRow('Tight framing:', self.tight_framing)
+
+        self.proxy = QtWidgets.QCheckBox('Decimate high-poly models for small sprites')
+        self.proxy.setToolTip('Render a simplified copy of the mesh with only as many triangles as the final pixel size can show')
+        form.addRow('Proxy mesh:', self.proxy)
+
+        self.shards = QtWidgets.QLineEdit('1')
+        self.shards.setToolTip('Split the 8 directions across this many Blender processes')
+        form.addRow('Blender processes:', self.shards)
+
+        self.output = QtWidgets.QComboBox()
+        self.output.addItem('One PNG per sprite', 'sprites')
+        self.output.addItem('Sprite atlas (PNG sheet + JSON index)', 'atlas')
+        form.addRow('Output:', self.output)
+
+        # Written from the same renders as the sprites, cropped and aligned the same way
+        passes_row = QtWidgets.QHBoxLayout()
+        self.passes = {}
+        for name, label in (('mask', 'Mask'), ('normal', 'Normals'), ('depth', 'Depth')):
+            self.passes[name] = QtWidgets.QCheckBox(label)
+            passes_row.addWidget(self.passes[name])
+        self.passes['normal'].setToolTip('World-space normals; needs the preview or final profile')
+        passes_row.addStretch()
+        form.addRow('Extra passes:', passes_row)
+
+        self.palette_output = QtWidgets.QComboBox()
+        self.palette_output.addItem('Indexed PNG', 'png')
+        self.palette_output.addItem('Doom patch (.lmp)', 'patch')
+        self.palette_output.setToolTip('How sprites are written when a palette is loaded')
+        form.addRow('Palette output:', self.palette_output)
+
+        self.use_cache = QtWidgets.QCheckBox('Reuse cached renders when nothing changed')
+        self.use_cache.setChecked(True)
+        form.addRow('Render cache:', self.use_cache)
+
+        self.save_log = QtWidgets.QCheckBox('Write the full Blender output to output_sprites/logs')
+        self.save_log.setToolTip(f'The console only shows the last {LOG_MAX_LINES} lines')
+        form.addRow('Log file:', self.save_log)
         
         settings_group.setLayout(form)
-        main_layout.addWidget(settings_group)
+
+        preview_group = QtWidgets.QGroupBox('Preview')
+        preview_layout = QtWidgets.QVBoxLayout()
+        self.preview_enabled = QtWidgets.QCheckBox('Live preview')
+        self.preview_enabled.setChecked(True)
+        self.preview_enabled.setToolTip('Render one direction with the draft engine whenever a setting changes')
+        preview_layout.addWidget(self.preview_enabled)
+        self.preview_direction = QtWidgets.QComboBox()
+        for name in sprite_pipeline.DIRECTION_NAMES:
+            self.preview_direction.addItem(name.replace('_', ' ').title(), name)
+        preview_layout.addWidget(self.preview_direction)
+        self.preview_image = QtWidgets.QLabel('Load a model to preview it')
+        self.preview_image.setFixedSize(PREVIEW_DISPLAY_SIZE, PREVIEW_DISPLAY_SIZE)
+        self.preview_image.setAlignment(QtCore.Qt.AlignCenter)
+        self.preview_image.setWordWrap(True)
+        preview_layout.addWidget(self.preview_image)
+        self.preview_status = QtWidgets.QLabel('')
+        self.preview_status.setWordWrap(True)
+        preview_layout.addWidget(self.preview_status)
+        preview_layout.addStretch(1)
+        preview_group.setLayout(preview_layout)
+
+        settings_row = QtWidgets.QHBoxLayout()
+        settings_row.addWidget(settings_group, 1)
+        settings_row.addWidget(preview_group)
+        main_layout.addLayout(settings_row)
 
         self.btn_generate = QtWidgets.QPushButton('GENERATE SPRITES')
         self.btn_generate.setObjectName('generateBtn')
@@ -217,16 +327,49 @@ class SpriteGUI(QtWidgets.QWidget):
         self.log = QtWidgets.QTextEdit()
         self.log.setReadOnly(True)
         self.log.setFixedHeight(120)
+        self.log.document().setMaximumBlockCount(LOG_MAX_LINES)
         main_layout.addWidget(self.log)
 
+        # Worker threads queue lines here; a timer moves them into the console in batches
+        self._log_pending = collections.deque(maxlen=LOG_MAX_LINES)
+        self._log_dropped = 0
+        self._log_lock = threading.Lock()
+        self._log_timer = QtCore.QTimer(self)
+        self._log_timer.setInterval(LOG_FLUSH_MS)
+        self._log_timer.timeout.connect(self.flush_log)
+        self._log_timer.start()
+
+        # Edits restart the timer, so a burst of typing renders the preview once
+        self.preview_timer = QtCore.QTimer(self)
+        self.preview_timer.setSingleShot(True)
+        self.preview_timer.setInterval(PREVIEW_DEBOUNCE_MS)
+        self.preview_timer.timeout.connect(self.request_preview)
+        self.preview_server = None
+        self._preview_dir = None
+        self._preview_lock = threading.Lock()
+        self._preview_seq = 0
+        self._preview_pending = None
+        self._preview_current = None
+        self._preview_busy = False
+        self._preview_result = None
+
         self.setLayout(main_layout)
         self.model_path = None
         self.texture_path = None
+        self.palette_path = None
+        self.server_pool = None
+        self.cache = sprite_cache.RenderCache()
 
         self.btn_model.clicked.connect(self.load_model)
         self.btn_texture.clicked.connect(self.load_texture)
+        self.btn_palette.clicked.connect(self.load_palette)
         self.btn_browse_blender.clicked.connect(self.browse_blender)
         self.btn_generate.clicked.connect(self.generate)
+        for field in (self.img_size, self.pixel_size, self.rotX, self.rotY, self.rotZ, self.camAngle):
+            field.textChanged.connect(self.schedule_preview)
+        self.tight_framing.toggled.connect(self.schedule_preview)
+        self.preview_direction.currentIndexChanged.connect(self.schedule_preview)
+        self.preview_enabled.toggled.connect(self.schedule_preview)
 
     def append_log(self, *parts):
         if len(parts) == 1:
@@ -247,6 +390,7 @@ class SpriteGUI(QtWidgets.QWidget):
             self.model_label.setProperty('loaded', 'true')
             self.model_label.style().unpolish(self.model_label)
             self.model_label.style().polish(self.model_label)
+            self.schedule_preview()
 
     def load_texture(self):
         p, _ = QtWidgets.QFileDialog.getOpenFileName(self, 'Select Texture', '', 'Images (*.png *.jpg *.jpeg)')
@@ -256,6 +400,16 @@ class SpriteGUI(QtWidgets.QWidget):
             self.texture_label.setProperty('loaded', 'true')
             self.texture_label.style().unpolish(self.texture_label)
             self.texture_label.style().polish(self.texture_label)
+            self.schedule_preview()
+
+    def load_palette(self):
+        p, _ = QtWidgets.QFileDialog.getOpenFileName(self, 'Select Palette', '', 'Palettes (*.lmp *.pal *.act *.gpl *.png);;All files (*)')
+        if p:
+            self.palette_path = p
+            self.palette_label.setText(f'Palette: {os.path.basename(p)}')
+            self.palette_label.setProperty('loaded', 'true')
+            self.palette_label.style().unpolish(self.palette_label)
+            self.palette_label.style().polish(self.palette_label)
 
     def generate(self):
         blender = self.blender_path.text().strip()
@@ -276,119 +430,259 @@ class SpriteGUI(QtWidgets.QWidget):
             rotZ = float(self.rotZ.text().strip())
             camAngle = float(self.camAngle.text().strip())
             pixel_size = int(self.pixel_size.text().strip())
+            shards = int(self.shards.text().strip())
         except Exception:
-            QtWidgets.QMessageBox.warning(self, 'Error', 'Rotation, camera angle, and sizes must be numeric.')
+            QtWidgets.QMessageBox.warning(self, 'Error', 'Rotation, camera angle, sizes and process count must be numeric.')
             return
+        animation = {}
+        if self.action.text().strip():
+            try:
+                frames, _, step = self.frame_range.text().strip().partition('/')
+                start, _, end = frames.partition('-')
+                animation = {'action': self.action.text().strip(), 'frame_start': int(start),
+                             'frame_end': int(end or start), 'frame_step': int(step or 1)}
+            except ValueError:
+                QtWidgets.QMessageBox.warning(self, 'Error', 'Enter the frames to render as start-end, e.g. 1-24.')
+                return
 
         # Disable button and show progress bar
         self.btn_generate.setEnabled(False)
+        # Indeterminate until Blender reports how many frames it renders
+        self.progress_bar.setRange(0, 0)
+        self.progress_bar.setFormat('Rendering sprites...')
         self.progress_bar.show()
         self.log.clear()
+        with self._log_lock:
+            self._log_pending.clear()
+            self._log_dropped = 0
         
         # Run generation in a separate thread
-        thread = threading.Thread(target=self._run_generation, args=(blender, base, img_size, rotX, rotY, rotZ, camAngle, pixel_size))
+        self.cache.enabled = self.use_cache.isChecked()
+        symmetry = self.symmetry.currentData()
+        framing = 'tight' if self.tight_framing.isChecked() else 'legacy'
+        proxy = self.proxy.isChecked()
+        profile = self.profile.currentData()
+        output = self.output.currentData()
+        passes = [name for name, box in self.passes.items() if box.isChecked()]
+        palette = {}
+        if self.palette_path:
+            palette = {'palette': self.palette_path, 'palette_output': self.palette_output.currentData()}
+        thread = threading.Thread(target=self._run_generation, args=(blender, base, img_size, rotX, rotY, rotZ, camAngle, pixel_size, shards, symmetry, framing, proxy, profile, animation, output, passes, palette, self.save_log.isChecked()))
         thread.daemon = True
         thread.start()
 
-    def _run_generation(self, blender, base, img_size, rotX, rotY, rotZ, camAngle, pixel_size):
+    def _get_server_pool(self, blender, size):
+        # Keep Blender resident between runs so repeated generations skip its startup
+        if self.server_pool is not None and self.server_pool.blender != blender:
+            self.server_pool.close()
+            self.server_pool = None
+        if self.server_pool is None:
+            self.server_pool = sprite_pipeline.ServerPool(blender, size=size)
+        self.server_pool.size = max(self.server_pool.size, size)
+        return self.server_pool
+
+    def closeEvent(self, event):
+        if self.server_pool is not None:
+            # Don't leave a render running in the background after the window is gone
+            self.server_pool.close(kill=not self.btn_generate.isEnabled())
+        self.preview_timer.stop()
+        self.preview_enabled.setChecked(False)
+        with self._preview_lock:
+            self._preview_pending = None
+            preview_server = self.preview_server
+        if preview_server is not None:
+            preview_server[1].close(kill=True)
+        if self._preview_dir is not None:
+            shutil.rmtree(self._preview_dir, ignore_errors=True)
+        super().closeEvent(event)
+
+    def schedule_preview(self, *args):
+        if self.preview_enabled.isChecked():
+            self.preview_timer.start()
+
+    def request_preview(self):
+        blender = self.blender_path.text().strip()
+        if not self.preview_enabled.isChecked() or not self.model_path or not os.path.isfile(blender):
+            return
+        try:
+            # make_job does the same number parsing as generation; half-typed values just wait for the next edit
+            job = sprite_pipeline.make_job({
+                'model': self.model_path,
+                'texture': self.texture_path or '',
+                'img_size': self.img_size.text(),
+                'pixel_size': self.pixel_size.text(),
+                'rotX': self.rotX.text(),
+                'rotY': self.rotY.text(),
+                'rotZ': self.rotZ.text(),
+                'camAngle': self.camAngle.text(),
+                'framing': 'tight' if self.tight_framing.isChecked() else 'legacy',
+            })
+        except ValueError:
+            self.preview_status.setText('Waiting for valid settings')
+            return
+        if self._preview_dir is None:
+            self._preview_dir = tempfile.mkdtemp(prefix='sprite-preview-', dir=sprite_pipeline.scratch_root())
+        with self._preview_lock:
+            self._preview_seq += 1
+            # Only the newest request is kept; older ones that haven't started are dropped
+            self._preview_pending = (self._preview_seq, blender, job, self.preview_direction.currentData())
+            busy = self._preview_busy
+            self._preview_busy = True
+            current = self._preview_current
+            preview_server = self.preview_server
+        self.preview_status.setText('Rendering...')
+        if not busy:
+            thread = threading.Thread(target=self._run_previews)
+            thread.daemon = True
+            thread.start()
+        elif current != (blender, job['model'], job['texture']) and preview_server is not None:
+            # The render in flight is for a model that is about to be replaced: stop it instead of waiting.
+            # Otherwise it is left to finish (well under a second) so the server keeps the model loaded.
+            preview_server[1].close(kill=True)
+
+    def _get_preview_server(self, blender):
+        # A server of its own, so generation never unloads the previewed model
+        with self._preview_lock:
+            preview_server = self.preview_server
+        if preview_server is not None and (preview_server[0] != blender or not preview_server[1].alive()):
+            preview_server[1].close(kill=True)
+            preview_server = None
+        if preview_server is None:
+            preview_server = (blender, sprite_pipeline.BlenderServer(blender, log=lambda text: None))
+            with self._preview_lock:
+                self.preview_server = preview_server
+        return preview_server[1]
+
+    def _run_previews(self):
+        while True:
+            with self._preview_lock:
+                request, self._preview_pending = self._preview_pending, None
+                if request is None:
+                    self._preview_busy = False
+                    self._preview_current = None
+                    return
+                seq, blender, job, direction = request
+                self._preview_current = (blender, job['model'], job['texture'])
+            start = time.perf_counter()
+            try:
+                server = self._get_preview_server(blender)
+                sprite = sprite_pipeline.render_preview(server, job, direction, self._preview_dir, log=lambda text: None)
+                result = (sprite, f"{direction.replace('_', ' ').title()} in {time.perf_counter() - start:.2f}s")
+            except Exception as e:
+                result = (None, f'Preview failed: {e}')
+            with self._preview_lock:
+                if seq != self._preview_seq:
+                    # Superseded while rendering; the newer request is already pending
+                    continue
+                self._preview_result = result
+            QtCore.QMetaObject.invokeMethod(self, "show_preview", QtCore.Qt.QueuedConnection)
+
+    def _run_generation(self, blender, base, img_size, rotX, rotY, rotZ, camAngle, pixel_size, shards, symmetry, framing, proxy, profile, animation, output, passes, palette, save_log):
+        log_file = None
+
+        def log(text):
+            if log_file is not None:
+                log_file.write(text + '\n')
+            self.queue_log(text)
+
         try:
             out_dir = os.path.join(os.getcwd(), 'output_sprites')
-            os.makedirs(out_dir, exist_ok=True)
-
-            if getattr(sys, 'frozen', False):
-                # We are running in a bundle
-                base_path = sys._MEIPASS
-            else:
-                # We are running in a normal Python environment
-                base_path = os.path.dirname(os.path.abspath(__file__))
-            
-            script_path = os.path.join(base_path, BLENDER_SCRIPT_NAME)
-            if not os.path.exists(script_path):
-                 raise FileNotFoundError(f"Helper script not found at {script_path}")
-
-            tex_arg = self.texture_path if self.texture_path else ''
-            args = [blender, '-b', '--python', script_path, '--', self.model_path, tex_arg, out_dir, base, str(img_size), str(rotX), str(rotY), str(rotZ), str(camAngle)]
-            
-            QtCore.QMetaObject.invokeMethod(self, "append_log", QtCore.Qt.QueuedConnection, QtCore.Q_ARG(str, 'Starting Blender render...'))
-            QtCore.QMetaObject.invokeMethod(self, "append_log", QtCore.Qt.QueuedConnection, QtCore.Q_ARG(str, 'Command: ' + ' '.join(args)))
-
-            proc = subprocess.run(args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, check=True)
-            QtCore.QMetaObject.invokeMethod(self, "append_log", QtCore.Qt.QueuedConnection, QtCore.Q_ARG(str, proc.stdout))
-
-            # Post-process: First pixelate, THEN crop
-            QtCore.QMetaObject.invokeMethod(self, "append_log", QtCore.Qt.QueuedConnection, QtCore.Q_ARG(str, f'Downscaling to {pixel_size}x{pixel_size}...'))
-            
-            # First pass: pixelate all images
-            sprite_files = [f for f in os.listdir(out_dir) if f.endswith('.png') and f.startswith(base)]
-            for file in sprite_files:
-                img_path = os.path.join(out_dir, file)
-                img = Image.open(img_path).convert('RGBA')
-                img = img.resize((pixel_size, pixel_size), Image.NEAREST)
-                img.save(img_path, optimize=False)
-            
-            QtCore.QMetaObject.invokeMethod(self, "append_log", QtCore.Qt.QueuedConnection, QtCore.Q_ARG(str, 'Finding optimal crop bounds...'))
-            
-            # Second pass: find the maximum bounding box across all pixelated sprites
-            max_bbox = None
-            for file in sprite_files:
-                img_path = os.path.join(out_dir, file)
-                img = Image.open(img_path).convert('RGBA')
-                
-                # Get bounding box of non-transparent pixels
-                bbox = img.getbbox()
-                if bbox:
-                    width = bbox[2] - bbox[0]
-                    height = bbox[3] - bbox[1]
-                    if max_bbox is None:
-                        max_bbox = (width, height)
-                    else:
-                        max_bbox = (max(max_bbox[0], width), max(max_bbox[1], height))
-            
-            if max_bbox is None:
-                QtCore.QMetaObject.invokeMethod(self, "append_log", QtCore.Qt.QueuedConnection, QtCore.Q_ARG(str, 'Warning: No visible pixels found in sprites'))
-            else:
-                QtCore.QMetaObject.invokeMethod(self, "append_log", QtCore.Qt.QueuedConnection, QtCore.Q_ARG(str, f'Cropping all sprites to {max_bbox[0]}x{max_bbox[1]} pixels...'))
-                
-                # Third pass: crop all sprites to the same uniform size
-                for file in sprite_files:
-                    img_path = os.path.join(out_dir, file)
-                    img = Image.open(img_path).convert('RGBA')
-                    
-                    # Get bounding box and crop
-                    bbox = img.getbbox()
-                    if bbox:
-                        cropped = img.crop(bbox)
-                        
-                        # Create a new image with the maximum dimensions
-                        final_img = Image.new('RGBA', max_bbox, (0, 0, 0, 0))
-                        
-                        # Center the cropped sprite in the final image
-                        x_offset = (max_bbox[0] - cropped.width) // 2
-                        y_offset = (max_bbox[1] - cropped.height) // 2
-                        final_img.paste(cropped, (x_offset, y_offset))
-                        
-                        final_img.save(img_path, optimize=False)
-                        QtCore.QMetaObject.invokeMethod(self, "append_log", QtCore.Qt.QueuedConnection, QtCore.Q_ARG(str, f'  Processed: {file}'))
-
-            QtCore.QMetaObject.invokeMethod(self, "append_log", QtCore.Qt.QueuedConnection, QtCore.Q_ARG(str, f'Complete! Sprites saved to: {out_dir}'))
+            if save_log:
+                os.makedirs(os.path.join(out_dir, 'logs'), exist_ok=True)
+                log_file = open(os.path.join(out_dir, 'logs', f'{base}.log'), 'w', encoding='utf-8')
+                log(f'Writing the full log to {log_file.name}')
+            job = sprite_pipeline.make_job({
+                'model': self.model_path,
+                'texture': self.texture_path or '',
+                'name': base,
+                'img_size': img_size,
+                'pixel_size': pixel_size,
+                'rotX': rotX,
+                'rotY': rotY,
+                'rotZ': rotZ,
+                'camAngle': camAngle,
+                'shards': shards,
+                'symmetry': symmetry,
+                'framing': framing,
+                'proxy': proxy,
+                'profile': profile,
+                'output': output,
+                'passes': passes,
+                **animation,
+                **palette,
+            })
+
+            def progress(done, total):
+                QtCore.QMetaObject.invokeMethod(self, "update_progress", QtCore.Qt.QueuedConnection,
+                                                QtCore.Q_ARG(int, done), QtCore.Q_ARG(int, total))
+
+            start = time.perf_counter()
+            result = sprite_pipeline.generate_job(blender, job, out_dir, log=log, pool=self._get_server_pool(blender, job['shards']),
+                                                  cache=self.cache, progress=progress)
+            result['seconds'] = time.perf_counter() - start
+            report = os.path.join(out_dir, 'logs', f'{base}_timing.json')
+            sprite_pipeline.write_timing_report(report, job, result)
+            log(f'Timing report: {report}')
+
+            log(f'Complete! Sprites saved to: {out_dir}')
             QtCore.QMetaObject.invokeMethod(self, "show_success", QtCore.Qt.QueuedConnection, QtCore.Q_ARG(str, out_dir))
         except subprocess.CalledProcessError as e:
-            QtCore.QMetaObject.invokeMethod(self, "append_log", QtCore.Qt.QueuedConnection, QtCore.Q_ARG(str, 'ERROR: Blender returned non-zero exit code'))
-            QtCore.QMetaObject.invokeMethod(self, "append_log", QtCore.Qt.QueuedConnection, QtCore.Q_ARG(str, e.stdout))
+            log('ERROR: Blender returned non-zero exit code (its output is above)')
             QtCore.QMetaObject.invokeMethod(self, "show_error", QtCore.Qt.QueuedConnection, QtCore.Q_ARG(str, 'Blender failed. See console log for details.'))
         except Exception as e:
-            QtCore.QMetaObject.invokeMethod(self, "append_log", QtCore.Qt.QueuedConnection, QtCore.Q_ARG(str, f'ERROR: {str(e)}'))
+            log(f'ERROR: {str(e)}')
             QtCore.QMetaObject.invokeMethod(self, "show_error", QtCore.Qt.QueuedConnection, QtCore.Q_ARG(str, f'An error occurred: {str(e)}'))
         finally:
-            pass
+            if log_file is not None:
+                log_file.close()
             # Re-enable button and hide progress bar
             QtCore.QMetaObject.invokeMethod(self, "finish_generation", QtCore.Qt.QueuedConnection)
 
+    def queue_log(self, text):
+        # Called from worker threads; the deque drops the oldest lines if the console falls behind
+        with self._log_lock:
+            for line in text.splitlines() or ['']:
+                if len(self._log_pending) == self._log_pending.maxlen:
+                    self._log_dropped += 1
+                self._log_pending.append(line)
+
+    @QtCore.pyqtSlot()
+    def flush_log(self):
+        with self._log_lock:
+            lines = list(self._log_pending)
+            dropped = self._log_dropped
+            self._log_pending.clear()
+            self._log_dropped = 0
+        if dropped:
+            lines.insert(0, f'... {dropped} lines skipped ...')
+        if lines:
+            self.log.append('\n'.join(lines))
+
     @QtCore.pyqtSlot()
     def finish_generation(self):
+        self.flush_log()
         self.btn_generate.setEnabled(True)
         self.progress_bar.hide()
 
+    @QtCore.pyqtSlot(int, int)
+    def update_progress(self, done, total):
+        self.progress_bar.setRange(0, total)
+        self.progress_bar.setValue(done)
+        self.progress_bar.setFormat('Rendering sprites... %v/%m')
+
+    @QtCore.pyqtSlot()
+    def show_preview(self):
+        with self._preview_lock:
+            sprite, message = self._preview_result
+        if sprite is not None:
+            data = sprite.tobytes('raw', 'RGBA')
+            image = QtGui.QImage(data, sprite.width, sprite.height, 4 * sprite.width, QtGui.QImage.Format_RGBA8888).copy()
+            # Scaled up without smoothing so the pixels look as they will in game
+            pixmap = QtGui.QPixmap.fromImage(image).scaled(PREVIEW_DISPLAY_SIZE, PREVIEW_DISPLAY_SIZE,
+                                                          QtCore.Qt.KeepAspectRatio, QtCore.Qt.FastTransformation)
+            self.preview_image.setPixmap(pixmap)
+        self.preview_status.setText(message)
+
     @QtCore.pyqtSlot(str)
     def show_success(self, out_dir):
         QtWidgets.QMessageBox.information(self, 'Success', f'All sprites generated!\n\nLocation: {out_dir}')
@@ -0,0 +1,141 @@
+import os
+import json
+import math
+import struct
+from PIL import Image, ImageOps
+
+
+ATLAS_PADDING = 1
+
+# Binary index: header, then one record per sprite (all little-endian)
+BINARY_MAGIC = b'SPAT'
+BINARY_VERSION = 1
+BINARY_HEADER = struct.Struct('<4sHIHH')
+BINARY_RECORD = struct.Struct('<HHHHhhHHiB')
+FLAG_FLIP = 1
+
+
+def make_entries(model, views, aligned, mirrored):
+    # One atlas entry per sprite, trimmed to its visible pixels; mirrored views reuse their source's pixels
+    entries = []
+    for view, direction, frame in views:
+        img = aligned[view]
+        entry = {'name': f'{model}_{view}', 'model': model, 'direction': direction, 'frame': frame,
+                 'source_size': list(img.size), 'mirrored_from': None, 'image': None, 'offset': [0, 0]}
+        bbox = img.getchannel('A').getbbox()
+        if bbox:
+            entry['offset'] = [bbox[0], bbox[1]]
+            if view in mirrored:
+                # The trimmed pixels are an exact flip of the source's, wherever the crop put them
+                entry['mirrored_from'] = f'{model}_{mirrored[view]}'
+            else:
+                entry['image'] = img.crop(bbox)
+        entries.append(entry)
+    return entries
+
+
+def pack(sizes, padding=ATLAS_PADDING):
+    # Shelf packing, tallest first, into a power-of-two wide sheet about as wide as it is tall
+    if not sizes:
+        return 0, 0, []
+    area = sum((w + padding) * (h + padding) for w, h in sizes)
+    width = max(max(w for w, _ in sizes), 2 ** math.ceil(math.log2(max(1, math.sqrt(area)))))
+    positions = [None] * len(sizes)
+    x = y = shelf = 0
+    for i in sorted(range(len(sizes)), key=lambda i: (-sizes[i][1], -sizes[i][0])):
+        w, h = sizes[i]
+        if x and x + w > width:
+            x, y, shelf = 0, y + shelf + padding, 0
+        positions[i] = (x, y)
+        x += w + padding
+        shelf = max(shelf, h)
+    return width, y + shelf, positions
+
+
+def write_atlas(entries, out_dir, base, models, binary=False, palette=None):
+    packed = [e for e in entries if e['image'] is not None]
+    width, height, positions = pack([e['image'].size for e in packed])
+    sheet = Image.new('RGBA', (max(1, width), max(1, height)), (0, 0, 0, 0))
+    rects = {}
+    for entry, (x, y) in zip(packed, positions):
+        sheet.paste(entry['image'], (x, y))
+        rects[entry['name']] = [x, y, entry['image'].width, entry['image'].height]
+
+    sprites = []
+    for entry in entries:
+        record = {'name': entry['name'], 'model': entry['model'], 'direction': entry['direction'],
+                  'rect': [0, 0, 0, 0], 'offset': list(entry['offset']), 'source_size': entry['source_size'],
+                  'flip': False, 'mirrored_from': entry['mirrored_from']}
+        if entry['frame'] is not None:
+            record['frame'] = entry['frame']
+        source = entry['mirrored_from']
+        if source is not None and source in rects:
+            record['rect'] = rects[source]
+            record['flip'] = True
+        elif entry['name'] in rects:
+            record['rect'] = rects[entry['name']]
+        sprites.append(record)
+
+    image_name = f'{base}.png'
+    if palette is not None:
+        palette.save_png(sheet, os.path.join(out_dir, image_name))
+    else:
+        sheet.save(os.path.join(out_dir, image_name), optimize=False)
+    files = [image_name, f'{base}.json']
+    with open(os.path.join(out_dir, files[1]), 'w', encoding='utf-8') as f:
+        json.dump({'image': image_name, 'size': [width, height], 'padding': ATLAS_PADDING,
+                   'models': models, 'sprites': sprites}, f, indent=2)
+    if binary:
+        files.append(f'{base}.bin')
+        write_binary_index(os.path.join(out_dir, files[-1]), width, height, sprites)
+    return files
+
+
+def write_binary_index(path, width, height, sprites):
+    with open(path, 'wb') as f:
+        f.write(BINARY_HEADER.pack(BINARY_MAGIC, BINARY_VERSION, len(sprites), width, height))
+        for record in sprites:
+            name = record['name'].encode('utf-8')
+            f.write(struct.pack('<B', len(name)) + name)
+            frame = record.get('frame')
+            f.write(BINARY_RECORD.pack(*record['rect'], *record['offset'], *record['source_size'],
+                                       -1 if frame is None else frame, FLAG_FLIP if record['flip'] else 0))
+
+
+def read_entries(index_path):
+    # Turn an atlas back into entries so several atlases can be packed into one
+    with open(index_path, 'r', encoding='utf-8') as f:
+        index = json.load(f)
+    with Image.open(os.path.join(os.path.dirname(index_path), index['image'])) as img:
+        sheet = img.convert('RGBA')
+    entries = []
+    for record in index['sprites']:
+        x, y, w, h = record['rect']
+        entry = {'name': record['name'], 'model': record['model'], 'direction': record['direction'],
+                 'frame': record.get('frame'), 'source_size': record['source_size'],
+                 'mirrored_from': record['mirrored_from'], 'image': None, 'offset': record['offset']}
+        if w and h and not record['flip']:
+            entry['image'] = sheet.crop((x, y, x + w, y + h))
+        entries.append(entry)
+    return entries, index['models']
+
+
+def merge_atlases(index_paths, out_dir, base, binary=False, palette=None):
+    entries, models = [], {}
+    for path in index_paths:
+        more, more_models = read_entries(path)
+        entries.extend(more)
+        models.update(more_models)
+    return write_atlas(entries, out_dir, base, models, binary, palette)
+
+
+def unpack_sprite(sheet, record):
+    # Rebuild one full-size sprite from the atlas, e.g. for previews or engines without atlas support
+    frame = Image.new('RGBA', tuple(record['source_size']), (0, 0, 0, 0))
+    x, y, w, h = record['rect']
+    if w and h:
+        img = sheet.crop((x, y, x + w, y + h))
+        if record['flip']:
+            img = ImageOps.mirror(img)
+        frame.paste(img, tuple(record['offset']))
+    return frame
@@ -0,0 +1,262 @@
+import os
+import re
+import json
+import time
+import shutil
+import hashlib
+import tempfile
+import threading
+import contextlib
+import collections
+
+
+DEFAULT_CACHE_SIZE = 2 * 1024 ** 3
+
+# Bump when post-processing output changes so stale downscaled/final frames are not reused
+POSTPROCESS_VERSION = 2
+
+META_NAME = 'meta.json'
+
+
+def default_cache_dir():
+    if os.environ.get('SPRITE_CACHE_DIR'):
+        return os.environ['SPRITE_CACHE_DIR']
+    base = os.environ.get('LOCALAPPDATA') or os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'doomlike_sprites')
+
+
+def parse_size(text):
+    match = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*([kmgt]?)i?b?\s*', str(text), re.IGNORECASE)
+    if not match:
+        raise ValueError(f'Invalid size: {text}')
+    scale = {'': 1, 'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3, 't': 1024 ** 4}[match.group(2).lower()]
+    return int(float(match.group(1)) * scale)
+
+
+def digest(parts):
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def model_dependencies(model_path):
+    # Text formats pull in side files (materials, buffers, images) that change the render too
+    ext = os.path.splitext(model_path)[1].lower()
+    folder = os.path.dirname(model_path)
+    deps = []
+    try:
+        if ext == '.obj':
+            with open(model_path, 'r', encoding='utf-8', errors='ignore') as f:
+                for line in f:
+                    if line.startswith('mtllib '):
+                        deps.append(os.path.join(folder, line[7:].strip()))
+        elif ext == '.gltf':
+            with open(model_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            for item in data.get('buffers', []) + data.get('images', []):
+                uri = item.get('uri', '')
+                if uri and not uri.startswith('data:'):
+                    deps.append(os.path.join(folder, uri))
+    except (OSError, ValueError):
+        pass
+    return [d for d in deps if os.path.isfile(d)]
+
+
+class RenderCache:
+    def __init__(self, root=None, max_bytes=DEFAULT_CACHE_SIZE, enabled=True):
+        self.root = root or default_cache_dir()
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.stats = {'hits': {}, 'misses': {}, 'evictions': 0}
+        self._lock = threading.Lock()
+        self._digests = {}
+        self._index = None
+        # Entries a running job still reads from, with the number of jobs holding each; eviction skips them
+        self._pins = collections.Counter()
+
+    def file_digest(self, path):
+        st = os.stat(path)
+        memo_key = (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+        with self._lock:
+            if memo_key in self._digests:
+                return self._digests[memo_key]
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                h.update(chunk)
+        digest = h.hexdigest()
+        with self._lock:
+            self._digests[memo_key] = digest
+        return digest
+
+    def stage_keys(self, helper_args, helper_script, views, pixel_size, output=None):
+        # Each stage's key covers exactly the inputs it depends on, so a change only invalidates downstream stages
+        import_key = digest({
+            'model': self.file_digest(helper_args['model']),
+            'model_deps': [self.file_digest(d) for d in model_dependencies(helper_args['model'])],
+            'texture': self.file_digest(helper_args['texture']) if helper_args.get('texture') else None,
+            'helper': self.file_digest(helper_script),
+        })
+        # Paths don't matter, only what is inside the files and every other helper argument
+        args = {k: v for k, v in helper_args.items()
+                if k not in ('out_dir', 'model', 'texture', 'views', 'id', 'prepared', 'save_prepared', 'save_proxy')}
+        framing_key = digest({'import': import_key, 'args': args})
+        render = {name: digest({'framing': framing_key, 'direction': name}) for name in views}
+        downscale = {name: digest({'render': render[name], 'pixel_size': pixel_size, 'version': POSTPROCESS_VERSION})
+                     for name in views}
+        final = {'downscale': [downscale[name] for name in views], 'version': POSTPROCESS_VERSION}
+        if output:
+            final['output'] = output
+        final = digest(final)
+        return {'import': import_key, 'framing': framing_key, 'render': render, 'downscale': downscale, 'final': final}
+
+    def prepared_key(self, import_key, blender):
+        # A prepared .blend may not load in an older Blender, so the executable is part of the key
+        st = os.stat(blender)
+        return digest({'import': import_key, 'blender': [os.path.abspath(blender), st.st_size, st.st_mtime_ns]})
+
+    def proxy_key(self, prepared_key, framing_key):
+        # The proxy's triangle budget follows from the framing and the final pixel size, both in the framing key
+        return digest({'prepared': prepared_key, 'framing': framing_key})
+
+    def _entry_dir(self, kind, key):
+        return os.path.join(self.root, kind, key[:2], key)
+
+    def get(self, kind, key, hold=None):
+        if not self.enabled:
+            return None
+        entry = self._entry_dir(kind, key)
+        meta_path = os.path.join(entry, META_NAME)
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            # Touch the entry so eviction treats it as recently used
+            os.utime(meta_path)
+        except (OSError, ValueError):
+            return None
+        files = [os.path.join(entry, name) for name in meta['files']]
+        if not all(os.path.isfile(f) for f in files):
+            return None
+        with self._lock:
+            # Checked again under the lock: another job's eviction may have removed the entry meanwhile
+            if not os.path.isdir(entry):
+                return None
+            if self._index is not None:
+                self._index[entry] = (time.time(), meta.get('bytes', 0))
+            self._pin(entry, hold)
+        return files
+
+    def put(self, kind, key, files, move=False, hold=None):
+        if not self.enabled:
+            return None
+        entry = self._entry_dir(kind, key)
+        os.makedirs(os.path.dirname(entry), exist_ok=True)
+        staging = tempfile.mkdtemp(prefix='.put-', dir=os.path.dirname(entry))
+        try:
+            names = []
+            size = 0
+            for src in files:
+                name = os.path.basename(src)
+                dst = os.path.join(staging, name)
+                if move:
+                    shutil.move(src, dst)
+                else:
+                    shutil.copyfile(src, dst)
+                names.append(name)
+                size += os.path.getsize(dst)
+            with open(os.path.join(staging, META_NAME), 'w', encoding='utf-8') as f:
+                json.dump({'files': names, 'bytes': size, 'created': time.time()}, f)
+            with self._lock:
+                try:
+                    os.rename(staging, entry)
+                    if self._index is not None:
+                        self._index[entry] = (time.time(), size)
+                except OSError:
+                    # Another job stored the same entry first; theirs is just as good
+                    pass
+                if os.path.isdir(entry):
+                    self._pin(entry, hold)
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+        self.evict()
+        return [os.path.join(entry, name) for name in names]
+
+    def lookup(self, kind, key, hold=None):
+        files = self.get(kind, key, hold)
+        with self._lock:
+            counts = self.stats['hits' if files is not None else 'misses']
+            counts[kind] = counts.get(kind, 0) + 1
+        return files
+
+    def _load_index(self):
+        # Walk the cache once per process; later puts and hits keep the index current
+        index = {}
+        if not os.path.isdir(self.root):
+            return index
+        for kind_dir in os.scandir(self.root):
+            if not kind_dir.is_dir():
+                continue
+            for shard in os.scandir(kind_dir.path):
+                if not shard.is_dir():
+                    continue
+                for entry in os.scandir(shard.path):
+                    if entry.name.startswith('.'):
+                        continue
+                    meta_path = os.path.join(entry.path, META_NAME)
+                    try:
+                        with open(meta_path, 'r', encoding='utf-8') as f:
+                            size = json.load(f).get('bytes', 0)
+                        index[entry.path] = (os.path.getmtime(meta_path), size)
+                    except (OSError, ValueError):
+                        continue
+        return index
+
+    def _pin(self, entry, hold):
+        # Called with the lock held
+        if hold is not None and entry not in hold:
+            hold.add(entry)
+            self._pins[entry] += 1
+
+    @contextlib.contextmanager
+    def held(self):
+        # Entries looked up or stored with hold=<the yielded set> stay on disk until the block ends, so a job
+        # bigger than the whole cache never has its own renders evicted before it reads them back
+        hold = set()
+        try:
+            yield hold
+        finally:
+            with self._lock:
+                for entry in hold:
+                    self._pins[entry] -= 1
+                    if self._pins[entry] <= 0:
+                        del self._pins[entry]
+            self.evict()
+
+    def evict(self):
+        with self._lock:
+            if self._index is None:
+                self._index = self._load_index()
+            total = sum(size for _, size in self._index.values())
+            for path, (_, size) in sorted(self._index.items(), key=lambda item: item[1][0]):
+                if total <= self.max_bytes:
+                    break
+                if path in self._pins:
+                    continue
+                shutil.rmtree(path, ignore_errors=True)
+                del self._index[path]
+                total -= size
+                self.stats['evictions'] += 1
+
+    def size(self):
+        with self._lock:
+            if self._index is None:
+                self._index = self._load_index()
+            return sum(size for _, size in self._index.values())
+
+    def summary(self):
+        with self._lock:
+            stats = {'hits': dict(self.stats['hits']), 'misses': dict(self.stats['misses']),
+                     'evictions': self.stats['evictions']}
+        hits = sum(stats['hits'].values())
+        lookups = hits + sum(stats['misses'].values())
+        stats['hit_rate'] = (hits / lookups) if lookups else 0.0
+        stats['bytes'] = self.size()
+        return stats
@@ -0,0 +1,430 @@
+import os
+import re
+import json
+import time
+import queue
+import shutil
+import socket
+import hashlib
+import itertools
+import tempfile
+import threading
+
+import sprite_cache
+import sprite_pipeline
+from sprite_pipeline import RenderError
+
+
+DEFAULT_PORT = 7805
+
+PROTOCOL_VERSION = 1
+
+# Workers report in this often while they render; a worker silent for WORKER_TIMEOUT is treated as dead
+HEARTBEAT_SECONDS = 5.0
+WORKER_TIMEOUT = 30.0
+
+# Seconds a queued task waits while no worker is connected before it fails
+WORKER_WAIT = 60.0
+
+# Attempts per task before it fails; only lost workers cause a retry, a failed render is reported as is
+MAX_ATTEMPTS = 3
+
+# Longest JSON header line; file contents follow it as raw bytes
+MAX_LINE = 16 * 1024 * 1024
+
+
+def parse_address(text, default_host=''):
+    host, _, port = text.rpartition(':')
+    return host or default_host, int(port or DEFAULT_PORT)
+
+
+def send_message(stream, message, blobs=()):
+    # One JSON line, then the raw bytes of each blob it announces
+    message = dict(message, blobs=[len(blob) for blob in blobs])
+    stream.write(json.dumps(message).encode('utf-8') + b'\n')
+    for blob in blobs:
+        stream.write(blob)
+    stream.flush()
+    return sum(len(blob) for blob in blobs)
+
+
+def read_message(stream):
+    line = stream.readline(MAX_LINE)
+    if not line:
+        raise ConnectionError('Connection closed')
+    message = json.loads(line)
+    blobs = []
+    for size in message.pop('blobs', []):
+        blob = stream.read(size)
+        if len(blob) != size:
+            raise ConnectionError('Connection closed in the middle of a file')
+        blobs.append(blob)
+    return message, blobs
+
+
+def task_files(job):
+    # The model, the side files it references (kept at their relative paths) and the texture
+    folder = os.path.dirname(job['model'])
+    files = [('model', job['model'], os.path.basename(job['model']))]
+    for dep in sprite_cache.model_dependencies(job['model']):
+        rel = os.path.relpath(dep, folder)
+        # Only files inside the model's folder: a worker never writes outside its own
+        if not rel.startswith('..') and not os.path.isabs(rel):
+            files.append(('dep', dep, rel.replace(os.sep, '/')))
+    if job.get('texture'):
+        files.append(('texture', job['texture'], os.path.basename(job['texture'])))
+    return files
+
+
+class ClusterCoordinator:
+    # A render pool whose Blenders run on other machines. Workers connect to it; each render() call becomes
+    # a task that goes to the next free worker, and the frames come back here for cropping and alignment.
+    remote = True
+
+    def __init__(self, host='', port=DEFAULT_PORT, max_attempts=MAX_ATTEMPTS, log=print, worker_wait=WORKER_WAIT):
+        self.max_attempts = max_attempts
+        self.worker_wait = worker_wait
+        self.log = log
+        self._listener = socket.create_server((host, port))
+        self.address = self._listener.getsockname()[:2]
+        self._tasks = queue.Queue()
+        self._ids = itertools.count(1)
+        self._workers = []
+        self._threads = []
+        self._digests = {}
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._closed = False
+        thread = threading.Thread(target=self._accept, daemon=True)
+        thread.start()
+
+    def _accept(self):
+        while not self._closed:
+            try:
+                conn, addr = self._listener.accept()
+            except OSError:
+                return
+            thread = threading.Thread(target=self._serve_worker, args=(conn, addr), daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _digest(self, path):
+        st = os.stat(path)
+        key = (os.path.abspath(path), st.st_mtime_ns, st.st_size)
+        with self._lock:
+            if key in self._digests:
+                return self._digests[key]
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                h.update(chunk)
+        with self._lock:
+            self._digests[key] = h.hexdigest()
+        return self._digests[key]
+
+    def wait_for_workers(self, count=1, timeout=None):
+        deadline = None if timeout is None else time.time() + timeout
+        with self._changed:
+            while sum(1 for w in self._workers if w['alive']) < count:
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._changed.wait(remaining)
+        return True
+
+    def render(self, job, out_dir, log=print, progress=None):
+        # Paths into this machine's render cache mean nothing to a worker, which keeps its own Blender warm instead
+        payload = dict(job, prepared=None, save_prepared=None, save_proxy=None, keep_model=True)
+        task = {'id': next(self._ids), 'job': payload, 'out_dir': out_dir, 'log': log, 'progress': progress,
+                'attempts': 0, 'done': threading.Event(), 'result': None, 'error': None}
+        with self._lock:
+            if self._closed:
+                raise RenderError('The render cluster is closed')
+            task['claimed'] = False
+        self._tasks.put(task)
+        # Without a live worker nothing would ever take the task, so only wait so long for one to connect
+        last_worker = time.time()
+        while not task['done'].wait(1.0):
+            with self._lock:
+                if any(w['alive'] for w in self._workers):
+                    last_worker = time.time()
+                elif not task['claimed'] and time.time() - last_worker > self.worker_wait:
+                    self._fail(task, f'No render worker connected for {self.worker_wait:.0f}s')
+        if task['error']:
+            raise RenderError(task['error'])
+        return task['result']
+
+    def _serve_worker(self, conn, addr):
+        conn.settimeout(WORKER_TIMEOUT)
+        stream = conn.makefile('rwb')
+        try:
+            hello, _ = read_message(stream)
+            if hello.get('type') != 'hello' or hello.get('version') != PROTOCOL_VERSION:
+                raise ValueError(f'unexpected greeting {hello!r}')
+        except (OSError, ValueError) as e:
+            self.log(f'Rejected worker at {addr[0]}:{addr[1]}: {e}')
+            conn.close()
+            return
+        worker = {'name': hello.get('name') or f'{addr[0]}:{addr[1]}', 'address': f'{addr[0]}:{addr[1]}',
+                  'cpus': hello.get('cpus'), 'alive': True, 'connected': time.time(), 'disconnected': None,
+                  'tasks': 0, 'failed': 0, 'lost': 0, 'frames': 0, 'busy': 0.0, 'sent': 0, 'received': 0}
+        with self._changed:
+            self._workers.append(worker)
+            self._changed.notify_all()
+        self.log(f"Worker {worker['name']} joined ({worker['cpus']} cpus)")
+        # Files this worker already has, so a model is uploaded once per worker however many tasks it gets
+        known = set()
+        task = None
+        try:
+            while not self._closed:
+                try:
+                    task = self._tasks.get(timeout=0.5)
+                except queue.Empty:
+                    continue
+                with self._lock:
+                    # Failed while it waited in the queue
+                    if task['done'].is_set():
+                        task = None
+                        continue
+                    task['claimed'] = True
+                task['attempts'] += 1
+                start = time.perf_counter()
+                self._run_task(stream, worker, task, known)
+                worker['busy'] += time.perf_counter() - start
+                task['done'].set()
+                task = None
+            send_message(stream, {'type': 'bye'})
+        except Exception as e:
+            # Anything that goes wrong with this worker (a dropped connection, a malformed reply) loses only
+            # this worker; its task goes back to the queue
+            if task is not None:
+                worker['lost'] += 1
+                if task['attempts'] < self.max_attempts:
+                    task['log'](f"Worker {worker['name']} was lost ({e}); retrying on another worker")
+                    with self._lock:
+                        task['claimed'] = False
+                    self._tasks.put(task)
+                else:
+                    task['error'] = f"Gave up after {task['attempts']} attempts; last worker {worker['name']} was lost: {e}"
+                    task['done'].set()
+                task = None
+            self.log(f"Worker {worker['name']} left: {e}")
+        finally:
+            if task is not None:
+                # Never leave a claimed task in flight, or render() would wait for it forever
+                with self._lock:
+                    self._fail(task, f"Worker {worker['name']} stopped while running the task")
+            conn.close()
+            with self._changed:
+                worker['alive'] = False
+                worker['disconnected'] = time.time()
+                self._changed.notify_all()
+
+    def _run_task(self, stream, worker, task, known):
+        job = task['job']
+        files, blobs = [], []
+        try:
+            for role, path, name in task_files(job):
+                digest = self._digest(path)
+                entry = {'role': role, 'name': name, 'digest': digest, 'sent': digest not in known}
+                if entry['sent']:
+                    with open(path, 'rb') as f:
+                        blobs.append(f.read())
+                files.append(entry)
+        except OSError as e:
+            # A missing model is the job's problem, not the worker's
+            task['error'] = f"Cannot send {job['name']} to a worker: {e}"
+            return
+        worker['sent'] += send_message(stream, {'type': 'task', 'id': task['id'], 'job': job, 'files': files}, blobs)
+        known.update(entry['digest'] for entry in files)
+        while True:
+            message, blobs = read_message(stream)
+            kind = message.get('type')
+            if kind == 'log':
+                task['log'](message['line'])
+            elif kind == 'event':
+                if task['progress'] is not None:
+                    task['progress'](message['event'])
+            elif kind == 'result' and message.get('id') == task['id']:
+                break
+        worker['tasks'] += 1
+        if not message.get('ok'):
+            worker['failed'] += 1
+            task['error'] = message.get('error')
+            return
+        worker['received'] += sum(len(blob) for blob in blobs)
+        result = message['result']
+        frames, passes = {}, {}
+        blobs = iter(blobs)
+        # Frames first, then any normal/depth pass arrays rendered with them
+        for (view, name), blob in zip(message['frames'], blobs):
+            path = os.path.join(task['out_dir'], os.path.basename(name))
+            with open(path, 'wb') as f:
+                f.write(blob)
+            frames[view] = path
+        for (view, pass_name, name), blob in zip(message.get('passes', []), blobs):
+            path = os.path.join(task['out_dir'], os.path.basename(name))
+            with open(path, 'wb') as f:
+                f.write(blob)
+            passes.setdefault(view, {})[pass_name] = path
+        result['frames'] = frames
+        result['passes'] = passes
+        worker['frames'] += len(frames)
+        task['result'] = result
+
+    def stats(self):
+        # Per-worker throughput: frames per second of rendering, and tasks per minute connected
+        now = time.time()
+        with self._lock:
+            workers = [dict(w) for w in self._workers]
+        for w in workers:
+            connected = (w['disconnected'] or now) - w['connected']
+            w['frames_per_second'] = w['frames'] / w['busy'] if w['busy'] > 0 else 0.0
+            w['tasks_per_minute'] = w['tasks'] * 60.0 / connected if connected > 0 else 0.0
+            w['utilization'] = w['busy'] / connected if connected > 0 else 0.0
+        return workers
+
+    def _fail(self, task, error):
+        # Called with the lock held, for a task no worker is running
+        task['error'] = error
+        task['done'].set()
+
+    def close(self, kill=False):
+        # Same signature as ServerPool.close; idle workers are told the batch is over
+        with self._lock:
+            self._closed = True
+        self._listener.close()
+        for thread in self._threads:
+            thread.join(timeout=5.0)
+        # Whatever is still queued will never be taken now
+        while True:
+            try:
+                task = self._tasks.get_nowait()
+            except queue.Empty:
+                break
+            with self._lock:
+                if not task['done'].is_set():
+                    self._fail(task, 'The render cluster was closed before a worker took the task')
+
+
+def check_entry(entry):
+    # Names and digests come from the network and become paths here: plain relative names, hex digests only
+    name, digest = entry.get('name'), entry.get('digest')
+    parts = name.split('/') if isinstance(name, str) else []
+    if not parts or os.path.isabs(name) or '\\' in name or ':' in name or any(p in ('', '.', '..') for p in parts):
+        raise RenderError(f'Coordinator sent an unsafe file name: {name!r}')
+    if not isinstance(digest, str) or not re.fullmatch(r'[0-9a-f]{64}', digest):
+        raise RenderError(f'Coordinator sent an invalid file digest: {digest!r}')
+
+
+class ClusterWorker:
+    # Connects to a coordinator and renders its tasks on a local Blender render server
+    def __init__(self, blender, address, work_dir=None, threads=None, name=None, log=print):
+        self.blender = blender
+        self.address = address
+        self.threads = threads
+        self.name = name or f'{socket.gethostname()}:{os.getpid()}'
+        self.log = log
+        self.work_dir = work_dir or tempfile.mkdtemp(prefix='sprite-worker-', dir=sprite_pipeline.scratch_root())
+        self.server = None
+        self._send_lock = threading.Lock()
+
+    def _send(self, stream, message, blobs=()):
+        with self._send_lock:
+            send_message(stream, message, blobs)
+
+    def _store(self, files, blobs):
+        # Files are kept by content; each model gets a folder named after its files, so the same model always
+        # has the same path here and the render server can keep it loaded between tasks
+        blobs = iter(blobs)
+        for entry in files:
+            check_entry(entry)
+            path = os.path.join(self.work_dir, 'files', entry['digest'])
+            if entry['sent']:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path + '.part', 'wb') as f:
+                    f.write(next(blobs))
+                os.replace(path + '.part', path)
+            elif not os.path.isfile(path):
+                raise RenderError(f"Coordinator expected this worker to have {entry['name']} already")
+        folder = os.path.join(self.work_dir, 'models', sprite_cache.digest([[e['role'], e['name'], e['digest']] for e in files]))
+        paths = {}
+        for entry in files:
+            path = os.path.join(folder, 'texture' if entry['role'] == 'texture' else '', *entry['name'].split('/'))
+            # Whatever the names say, every file has to land inside the model's folder
+            if os.path.commonpath([os.path.abspath(folder), os.path.abspath(path)]) != os.path.abspath(folder):
+                raise RenderError(f"Coordinator sent a file outside the model folder: {entry['name']!r}")
+            if not os.path.isfile(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                source = os.path.join(self.work_dir, 'files', entry['digest'])
+                try:
+                    os.link(source, path)
+                except OSError:
+                    shutil.copyfile(source, path)
+            paths.setdefault(entry['role'], path)
+        return paths
+
+    def _run_task(self, stream, message, blobs):
+        job = message['job']
+        try:
+            paths = self._store(message['files'], blobs)
+        except (OSError, RenderError) as e:
+            self._send(stream, {'type': 'result', 'id': message['id'], 'ok': False, 'error': f'Worker could not store the model: {e}'})
+            return
+        job['model'] = paths['model']
+        job['texture'] = paths.get('texture', '')
+        job['threads'] = self.threads
+        out_dir = os.path.join(self.work_dir, 'out', str(message['id']))
+        os.makedirs(out_dir, exist_ok=True)
+        done = threading.Event()
+
+        def heartbeat():
+            while not done.wait(HEARTBEAT_SECONDS):
+                self._send(stream, {'type': 'heartbeat'})
+
+        beat = threading.Thread(target=heartbeat, daemon=True)
+        beat.start()
+        start = time.perf_counter()
+        try:
+            if self.server is None or not self.server.alive():
+                self.server = sprite_pipeline.BlenderServer(self.blender, lambda line: None)
+            result = self.server.submit(job, out_dir, lambda line: self._send(stream, {'type': 'log', 'line': line}),
+                                        lambda event: self._send(stream, {'type': 'event', 'event': event}))
+        except (OSError, RenderError) as e:
+            self._send(stream, {'type': 'result', 'id': message['id'], 'ok': False, 'error': str(e)})
+            return
+        finally:
+            done.set()
+            beat.join()
+        frames = list(result.pop('frames').items())
+        passes = [(view, name, path) for view, paths in (result.pop('passes', None) or {}).items()
+                  for name, path in paths.items()]
+        frame_blobs = []
+        for path in [path for _, path in frames] + [path for _, _, path in passes]:
+            with open(path, 'rb') as f:
+                frame_blobs.append(f.read())
+        self._send(stream, {'type': 'result', 'id': message['id'], 'ok': True, 'result': result,
+                            'frames': [[view, os.path.basename(path)] for view, path in frames],
+                            'passes': [[view, name, os.path.basename(path)] for view, name, path in passes]},
+                   frame_blobs)
+        shutil.rmtree(out_dir, ignore_errors=True)
+        self.log(f"Task {message['id']} ({job['name']}: {', '.join(v for v, _ in frames)}) "
+                 f"in {time.perf_counter() - start:.1f}s")
+
+    def serve(self):
+        # One coordinator session; returns when the coordinator says goodbye or the connection drops
+        with socket.create_connection(self.address) as conn:
+            stream = conn.makefile('rwb')
+            self._send(stream, {'type': 'hello', 'version': PROTOCOL_VERSION, 'name': self.name, 'cpus': os.cpu_count()})
+            self.log(f'Connected to {self.address[0]}:{self.address[1]} as {self.name}')
+            while True:
+                message, blobs = read_message(stream)
+                if message.get('type') == 'bye':
+                    return
+                if message.get('type') == 'task':
+                    self._run_task(stream, message, blobs)
+
+    def close(self):
+        if self.server is not None:
+            self.server.close(kill=True)
+            self.server = None
@@ -0,0 +1,198 @@
+import queue
+import asyncio
+import weakref
+import threading
+import subprocess
+import concurrent.futures
+from concurrent.futures import ThreadPoolExecutor
+
+import sprite_pipeline
+from sprite_pipeline import RenderError
+
+
+# Seconds Blender gets to exit after being asked to stop before it is killed
+KILL_GRACE = 5.0
+
+# Events waiting for the consumer before Blender's output is left unread (and Blender blocks on it)
+EVENT_QUEUE_SIZE = 1000
+
+# Longest line read from Blender; verbose importers can print very long ones
+LINE_LIMIT = 1024 * 1024
+
+
+class JobCancelled(RenderError):
+    pass
+
+
+class JobTimeout(RenderError):
+    pass
+
+
+async def stop_process(proc):
+    if proc.returncode is None:
+        proc.terminate()
+        try:
+            await asyncio.wait_for(proc.wait(), KILL_GRACE)
+        except asyncio.TimeoutError:
+            proc.kill()
+            await proc.wait()
+
+
+class _JobRun:
+    # One generate_job call running in a worker thread. It is also the "pool" the pipeline hands
+    # renders to, so every Blender it launches is an asyncio subprocess on the runner's loop.
+    def __init__(self, runner, loop):
+        self.runner = runner
+        self.loop = loop
+        self.slots = runner.slots(loop)
+        self.events = asyncio.Queue(EVENT_QUEUE_SIZE)
+        self.cancelled = threading.Event()
+        self._renders = set()
+        self._lock = threading.Lock()
+
+    def emit(self, event, force=False):
+        # Called from worker threads; blocks while the consumer is behind, unless the job was cancelled
+        future = asyncio.run_coroutine_threadsafe(self.events.put(event), self.loop)
+        while True:
+            try:
+                future.result(timeout=0.1)
+                return
+            except concurrent.futures.TimeoutError:
+                if self.cancelled.is_set() and not force:
+                    future.cancel()
+                    return
+
+    def cancel(self):
+        self.cancelled.set()
+        with self._lock:
+            renders = list(self._renders)
+        for future in renders:
+            future.cancel()
+
+    def render(self, job, out_dir, log=print, progress=None):
+        if self.cancelled.is_set():
+            raise JobCancelled(f"Rendering {job['name']} was cancelled")
+        inbox = queue.Queue()
+        future = asyncio.run_coroutine_threadsafe(self._render(job, out_dir, inbox), self.loop)
+        future.add_done_callback(lambda _: inbox.put(None))
+        with self._lock:
+            self._renders.add(future)
+        try:
+            # Helper events are counted here, off the event loop, then passed on to the consumer
+            for event in iter(inbox.get, None):
+                if progress is not None:
+                    progress(event)
+                self.emit(event)
+            return future.result()
+        except concurrent.futures.CancelledError:
+            raise JobCancelled(f"Rendering {job['name']} was cancelled")
+        finally:
+            with self._lock:
+                self._renders.discard(future)
+
+    async def _render(self, job, out_dir, inbox):
+        args = sprite_pipeline.build_blender_args(self.runner.blender, sprite_pipeline.helper_script_path(), job, out_dir)
+        result = None
+        # Backpressure: only max_renders Blenders run at once, across every job of the runner on this loop
+        async with self.slots:
+            proc = await asyncio.create_subprocess_exec(*args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                                        limit=LINE_LIMIT)
+            try:
+                async for raw in proc.stdout:
+                    line = raw.decode('utf-8', errors='replace').rstrip('\r\n')
+                    event = sprite_pipeline.parse_event(line)
+                    if event is None:
+                        await self.events.put({'event': 'log', 'name': job['name'], 'line': line})
+                    elif event.get('event') == 'result':
+                        result = event
+                    elif event.get('event') in sprite_pipeline.PROGRESS_EVENTS:
+                        inbox.put(dict(event, name=job['name']))
+                code = await proc.wait()
+            except BaseException:
+                await stop_process(proc)
+                raise
+        if code:
+            raise subprocess.CalledProcessError(code, args)
+        if result is None:
+            raise RenderError('Blender exited without reporting the rendered frames')
+        if not result.get('ok'):
+            raise RenderError(f"Blender failed to render {job['name']}: {result.get('error')}")
+        return result
+
+
+class AsyncJobRunner:
+    # Sprite generation for asyncio applications: every job yields its events as it runs, can be
+    # cancelled (which stops its Blender processes) and can have a timeout.
+    def __init__(self, blender, max_renders=1, max_jobs=None, threads=None, cache=None):
+        self.blender = blender
+        self.threads = threads
+        self.cache = cache
+        self.max_renders = max(1, max_renders)
+        # A semaphore belongs to the loop it is first used on, so each loop running jobs gets its own,
+        # made when the first job starts there
+        self._slots = weakref.WeakKeyDictionary()
+        self._slots_lock = threading.Lock()
+        # Post-processing runs in these threads; extra jobs wait for one to free up
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_jobs or max_renders))
+
+    def slots(self, loop):
+        with self._slots_lock:
+            if loop not in self._slots:
+                self._slots[loop] = asyncio.Semaphore(self.max_renders)
+            return self._slots[loop]
+
+    async def run(self, job, out_dir, timeout=None):
+        # Async generator of events: 'log', the helper's 'stage'/'plan'/'frame', 'progress' and a final 'result'
+        loop = asyncio.get_running_loop()
+        run = _JobRun(self, loop)
+
+        def work():
+            try:
+                if run.cancelled.is_set():
+                    raise JobCancelled(f"{job['name']} was cancelled before it started")
+                return sprite_pipeline.generate_job(
+                    self.blender, job, out_dir, self.threads, pool=run, cache=self.cache,
+                    log=lambda text: run.emit({'event': 'log', 'name': job['name'], 'line': text}),
+                    progress=lambda done, total: run.emit({'event': 'progress', 'name': job['name'],
+                                                           'done': done, 'total': total}))
+            finally:
+                run.emit(None, force=True)
+
+        worker = loop.run_in_executor(self._executor, work)
+        deadline = None if timeout is None else loop.time() + timeout
+        finished = False
+        try:
+            while True:
+                remaining = None if deadline is None else max(0.0, deadline - loop.time())
+                try:
+                    event = await asyncio.wait_for(run.events.get(), remaining)
+                except asyncio.TimeoutError:
+                    raise JobTimeout(f"{job['name']} did not finish within {timeout:g}s")
+                if event is None:
+                    break
+                yield event
+            finished = True
+            result = await worker
+            yield {'event': 'result', 'name': job['name'], **result}
+        finally:
+            if not finished:
+                # Cancelled, timed out or abandoned: stop Blender and let the worker thread unwind
+                run.cancel()
+                while await run.events.get() is not None:
+                    pass
+                await asyncio.gather(worker, return_exceptions=True)
+
+    async def generate(self, job, out_dir, timeout=None, on_event=None):
+        # Run a job to completion and return its result; cancel the calling task to stop it
+        events = self.run(job, out_dir, timeout)
+        try:
+            async for event in events:
+                if event['event'] == 'result':
+                    return event
+                if on_event is not None:
+                    on_event(event)
+        finally:
+            await events.aclose()
+
+    def close(self):
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,167 @@
+import os
+import struct
+import tempfile
+import threading
+import numpy as np
+from PIL import Image
+
+import sprite_cache
+
+
+# Bits per channel of the lookup table: 6 -> 64^3 entries (256 KB), 8 -> 256^3 (16 MB, exact)
+LUT_BITS = (5, 6, 7, 8)
+DEFAULT_LUT_BITS = 6
+
+# Index left out of colour matching so it can mark transparent pixels in indexed PNGs
+DEFAULT_TRANSPARENT_INDEX = 255
+
+ALPHA_THRESHOLD = 128
+
+# 'png' writes indexed PNGs, 'patch' Doom picture lumps (column posts, transparency without a palette slot)
+PALETTE_OUTPUTS = ('png', 'patch')
+
+_luts = {}
+_luts_lock = threading.Lock()
+
+
+def load_palette(path):
+    # PLAYPAL/.act/raw RGB triplets, JASC-PAL or GIMP palettes, or an image's palette or colours
+    ext = os.path.splitext(path)[1].lower()
+    if ext in ('.png', '.bmp', '.gif', '.pcx', '.tga'):
+        with Image.open(path) as img:
+            if img.mode == 'P':
+                colors = np.array(img.getpalette()[:768], dtype=np.uint8).reshape(-1, 3)
+            else:
+                # A swatch image: its distinct colours in reading order
+                pixels = np.asarray(img.convert('RGB')).reshape(-1, 3)
+                _, first = np.unique(pixels, axis=0, return_index=True)
+                colors = pixels[np.sort(first)]
+    else:
+        with open(path, 'rb') as f:
+            data = f.read()
+        if data.startswith(b'JASC-PAL'):
+            lines = data.decode('ascii', errors='ignore').split()
+            count = int(lines[2])
+            colors = np.array([int(v) for v in lines[3:3 + count * 3]], dtype=np.uint8).reshape(-1, 3)
+        elif data.startswith(b'GIMP Palette'):
+            values = []
+            for line in data.decode('utf-8', errors='ignore').splitlines()[1:]:
+                parts = line.split()
+                if len(parts) >= 3 and all(p.isdigit() for p in parts[:3]):
+                    values.append([int(p) for p in parts[:3]])
+            colors = np.array(values, dtype=np.uint8)
+        else:
+            # PLAYPAL holds 14 palettes (damage/pickup tints); the first is the normal one
+            if len(data) < 768 and len(data) % 3:
+                raise ValueError(f'Not a palette file: {path}')
+            colors = np.frombuffer(data[:768], dtype=np.uint8).reshape(-1, 3)
+    if not 1 <= len(colors) <= 256:
+        raise ValueError(f'Palette must have 1-256 colours, {path} has {len(colors)}')
+    return colors
+
+
+def build_lut(palette, bits=DEFAULT_LUT_BITS, exclude=None):
+    # Nearest palette colour for the centre of every RGB cell, one red slice at a time
+    size = 1 << bits
+    step = 256 // size
+    axis = (np.arange(size) * step + step // 2).astype(np.float32)
+    pal = palette.astype(np.float32)
+    pal_norm = (pal * pal).sum(axis=1)
+    if exclude is not None and exclude < len(pal):
+        pal_norm[exclude] = np.inf
+    g, b = np.meshgrid(axis, axis, indexing='ij')
+    gb = np.stack([g.ravel(), b.ravel()], axis=1)
+    lut = np.empty((size, size * size), dtype=np.uint8)
+    for r in range(size):
+        # |c - p|^2 = |c|^2 - 2 c.p + |p|^2, and |c|^2 doesn't change the argmin
+        dots = axis[r] * pal[:, 0] + gb @ pal[:, 1:].T
+        lut[r] = np.argmin(pal_norm - 2.0 * dots, axis=1)
+    return lut.reshape(size, size, size)
+
+
+class PaletteLUT:
+    def __init__(self, palette, lut, transparent_index=None):
+        self.palette = palette
+        self.lut = lut
+        self.shift = 8 - int(round(np.log2(lut.shape[0])))
+        self.transparent_index = transparent_index
+
+    def quantize(self, img):
+        # Whole-frame table lookup: palette indices plus the mask of opaque pixels
+        rgba = np.asarray(img.convert('RGBA'))
+        rgb = rgba[..., :3] >> self.shift
+        indices = self.lut[rgb[..., 0], rgb[..., 1], rgb[..., 2]]
+        opaque = rgba[..., 3] >= ALPHA_THRESHOLD
+        if self.transparent_index is not None:
+            indices = np.where(opaque, indices, np.uint8(self.transparent_index))
+        return indices, opaque
+
+    def indexed_image(self, img):
+        indices, _ = self.quantize(img)
+        out = Image.fromarray(indices, 'P')
+        # Pad short palettes so the transparent index always has a slot
+        colors = np.zeros((256, 3), dtype=np.uint8)
+        colors[:len(self.palette)] = self.palette
+        out.putpalette(colors.ravel().tolist())
+        if self.transparent_index is not None:
+            out.info['transparency'] = self.transparent_index
+        return out
+
+    def save_png(self, img, path):
+        out = self.indexed_image(img)
+        out.save(path, optimize=False, transparency=out.info.get('transparency'))
+
+    def save_patch(self, img, path):
+        indices, opaque = self.quantize(img)
+        with open(path, 'wb') as f:
+            f.write(patch_bytes(indices, opaque))
+
+
+def patch_bytes(indices, opaque, left=None, top=None):
+    # Doom picture format: header, column offsets, then per column runs ("posts") of opaque pixels
+    height, width = indices.shape
+    if height > 254:
+        raise ValueError(f'Doom patches can be at most 254 pixels tall (sprite is {height})')
+    left = width // 2 if left is None else left
+    top = height if top is None else top
+    columns = []
+    for x in range(width):
+        column = bytearray()
+        mask = np.concatenate(([False], opaque[:, x], [False]))
+        edges = np.flatnonzero(mask[1:] != mask[:-1])
+        for start, end in zip(edges[::2], edges[1::2]):
+            column += bytes((start, end - start, 0)) + indices[start:end, x].tobytes() + b'\0'
+        column += b'\xff'
+        columns.append(bytes(column))
+    offsets = []
+    position = 8 + 4 * width
+    for column in columns:
+        offsets.append(position)
+        position += len(column)
+    return struct.pack('<hhhh', width, height, left, top) + struct.pack(f'<{width}I', *offsets) + b''.join(columns)
+
+
+def load_lut(path, bits=DEFAULT_LUT_BITS, transparent_index=None, cache=None):
+    # Built once per palette and settings: memoized in-process and kept in the render cache across runs
+    if bits not in LUT_BITS:
+        raise ValueError(f'LUT bits must be one of {LUT_BITS}')
+    file_digest = cache.file_digest(path) if cache is not None else sprite_cache.digest([os.path.abspath(path), os.path.getmtime(path)])
+    key = sprite_cache.digest({'palette': file_digest, 'bits': bits, 'exclude': transparent_index})
+    with _luts_lock:
+        if key in _luts:
+            return _luts[key]
+    palette = load_palette(path)
+    hit = cache.lookup('lut', key) if cache is not None and cache.enabled else None
+    if hit is not None:
+        lut = np.load(hit[0])
+    else:
+        lut = build_lut(palette, bits, transparent_index)
+        if cache is not None and cache.enabled:
+            scratch = tempfile.mkdtemp(prefix='lut-')
+            np.save(os.path.join(scratch, 'lut.npy'), lut)
+            cache.put('lut', key, [os.path.join(scratch, 'lut.npy')], move=True)
+            os.rmdir(scratch)
+    result = PaletteLUT(palette, lut, transparent_index)
+    with _luts_lock:
+        _luts[key] = result
+    return result
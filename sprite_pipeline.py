@@ -0,0 +1,1228 @@
+import os
+import sys
+import re
+import json
+import collections
+import time
+import queue
+import shutil
+import filecmp
+import tempfile
+import itertools
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import numpy as np
+from PIL import Image, ImageOps
+
+import sprite_atlas
+import sprite_palette
+
+
+DEFAULT_BLENDER = r"C:\Program Files\Blender Foundation\Blender 3.6\blender.exe"
+BLENDER_SCRIPT_NAME = "blender_render_helper.py"
+
+# Must match EVENT_PREFIX in blender_render_helper.py
+EVENT_PREFIX = '@@SPRITE '
+
+# Lines of Blender output kept for the error raised when a one-shot render fails
+ERROR_TAIL_LINES = 200
+
+# Events the helper sends while a job runs, before its result
+PROGRESS_EVENTS = ('stage', 'plan', 'frame')
+
+# Restart a render server after this many jobs so leaked Blender data can't pile up
+SERVER_MAX_JOBS = 50
+
+# Must match MIRROR_PAIRS in blender_render_helper.py: mirrored direction -> direction it is flipped from
+MIRROR_PAIRS = {
+    'front_left': 'front_right',
+    'left': 'right',
+    'back_left': 'back_right',
+}
+
+# 'auto' lets the helper detect left/right mirror symmetry, 'force' assumes it
+SYMMETRY_MODES = ('off', 'auto', 'force')
+
+# Must match DIRECTIONS in blender_render_helper.py
+DIRECTION_NAMES = [
+    'front',
+    'front_right',
+    'right',
+    'back_right',
+    'back',
+    'back_left',
+    'left',
+    'front_left',
+]
+
+JOB_DEFAULTS = {
+    'texture': '',
+    'img_size': 512,
+    'pixel_size': 64,
+    'rotX': 0.0,
+    'rotY': 0.0,
+    'rotZ': 0.0,
+    'camAngle': 90.0,
+    'transport': 'png',
+    'shards': 1,
+    'symmetry': 'off',
+    'framing': 'legacy',
+    'crop_border': True,
+    'proxy': False,
+    'profile': 'final',
+    'action': '',
+    'frame_start': None,
+    'frame_end': None,
+    'frame_step': 1,
+    'output': 'sprites',
+    'atlas_binary': False,
+    'palette': '',
+    'palette_output': 'png',
+    'palette_bits': sprite_palette.DEFAULT_LUT_BITS,
+    'palette_transparent': sprite_palette.DEFAULT_TRANSPARENT_INDEX,
+    'passes': (),
+}
+
+# Largest render size of a live preview: with the draft profile one direction takes well under a second
+PREVIEW_SIZE = 256
+
+# Frame format Blender writes into the job's scratch folder: 'png' compresses every frame, 'raw' writes
+# uncompressed frames the host decodes once without zlib. Only finished sprites reach the output folder.
+TRANSPORTS = ('png', 'raw')
+
+# Free space (bytes) /dev/shm must keep on top of a job's frames before it is used as scratch space
+SCRATCH_HEADROOM = 256 * 1024 * 1024
+
+# 'sprites' writes one PNG per view, 'atlas' packs them into one sheet with an index
+OUTPUT_FORMATS = ('sprites', 'atlas')
+
+# Must match RENDER_PROFILES in blender_render_helper.py, fastest first
+RENDER_PROFILES = ('draft', 'preview', 'final')
+
+# Must match FRAMING_MODES in blender_render_helper.py: 'tight' fits the camera to the model's silhouette
+FRAMING_MODES = ('legacy', 'tight')
+
+# Extra images per sprite, pixel-aligned with it: the alpha mask, world-space normals and camera depth
+PASSES = ('mask', 'normal', 'depth')
+
+# Must match PASS_SOCKETS in blender_render_helper.py; the mask is cut from the colour frame's alpha instead
+RENDERED_PASSES = ('normal', 'depth')
+
+# Background value of a pass outside the rendered border: no normal, infinitely far
+PASS_FILL = {'normal': 0.0, 'depth': 1e10}
+
+# Staging folders untouched for this long (seconds) were left by a run that died before publishing
+STAGING_MAX_AGE = 3600
+
+
+class RenderError(RuntimeError):
+    pass
+
+
+def helper_script_path():
+    if getattr(sys, 'frozen', False):
+        # We are running in a bundle
+        base_path = sys._MEIPASS
+    else:
+        # We are running in a normal Python environment
+        base_path = os.path.dirname(os.path.abspath(__file__))
+
+    script_path = os.path.join(base_path, BLENDER_SCRIPT_NAME)
+    if not os.path.exists(script_path):
+        raise FileNotFoundError(f"Helper script not found at {script_path}")
+    return script_path
+
+
+def make_job(entry, defaults=None, base_dir=None):
+    job = dict(JOB_DEFAULTS)
+    job.update(defaults or {})
+    job.update(entry)
+    if not job.get('model'):
+        raise ValueError('Job is missing a model path')
+    for key in ('model', 'texture', 'palette'):
+        if job.get(key) and base_dir and not os.path.isabs(job[key]):
+            job[key] = os.path.normpath(os.path.join(base_dir, job[key]))
+    if not job.get('name'):
+        job['name'] = os.path.splitext(os.path.basename(job['model']))[0]
+    job['img_size'] = int(job['img_size'])
+    job['shards'] = max(1, int(job['shards']))
+    job['pixel_size'] = int(job['pixel_size'])
+    for key in ('rotX', 'rotY', 'rotZ', 'camAngle'):
+        job[key] = float(job[key])
+    if job['symmetry'] not in SYMMETRY_MODES:
+        raise ValueError(f"Unknown symmetry mode '{job['symmetry']}' (expected one of: {', '.join(SYMMETRY_MODES)})")
+    if job['framing'] not in FRAMING_MODES:
+        raise ValueError(f"Unknown framing mode '{job['framing']}' (expected one of: {', '.join(FRAMING_MODES)})")
+    if job['action']:
+        if job['frame_start'] is None or job['frame_end'] is None:
+            raise ValueError(f"Action '{job['action']}' needs frame_start and frame_end")
+        for key in ('frame_start', 'frame_end', 'frame_step'):
+            job[key] = int(job[key])
+        if job['frame_end'] < job['frame_start'] or job['frame_step'] < 1:
+            raise ValueError(f"Invalid frame range {job['frame_start']}-{job['frame_end']} step {job['frame_step']}")
+    if job['output'] not in OUTPUT_FORMATS:
+        raise ValueError(f"Unknown output '{job['output']}' (expected one of: {', '.join(OUTPUT_FORMATS)})")
+    job['atlas_binary'] = bool(job['atlas_binary'])
+    if job['palette']:
+        if job['palette_output'] not in sprite_palette.PALETTE_OUTPUTS:
+            raise ValueError(f"Unknown palette output '{job['palette_output']}' "
+                             f"(expected one of: {', '.join(sprite_palette.PALETTE_OUTPUTS)})")
+        if job['palette_output'] == 'patch' and job['output'] == 'atlas':
+            raise ValueError('Doom patch output writes one lump per sprite and cannot be packed into an atlas')
+        job['palette_bits'] = int(job['palette_bits'])
+        if job['palette_bits'] not in sprite_palette.LUT_BITS:
+            raise ValueError(f"Palette LUT bits must be one of: {', '.join(map(str, sprite_palette.LUT_BITS))}")
+        job['palette_transparent'] = int(job['palette_transparent'])
+    if job['profile'] not in RENDER_PROFILES:
+        raise ValueError(f"Unknown render profile '{job['profile']}' (expected one of: {', '.join(RENDER_PROFILES)})")
+    passes = job['passes']
+    if isinstance(passes, str):
+        passes = [p.strip() for p in passes.split(',') if p.strip()]
+    for name in passes:
+        if name not in PASSES:
+            raise ValueError(f"Unknown pass '{name}' (expected some of: {', '.join(PASSES)})")
+    job['passes'] = [name for name in PASSES if name in passes]
+    if job['passes'] and job['output'] == 'atlas':
+        raise ValueError('Extra passes are written next to each sprite and cannot be packed into an atlas')
+    if 'normal' in job['passes'] and job['profile'] == 'draft':
+        raise ValueError('The draft profile (Workbench) has no normal pass; use the preview or final profile')
+    job['crop_border'] = bool(job['crop_border'])
+    job['proxy'] = bool(job['proxy'])
+    if job['transport'] not in TRANSPORTS:
+        raise ValueError(f"Unknown transport '{job['transport']}' (expected one of: {', '.join(TRANSPORTS)})")
+    return job
+
+
+def load_manifest(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    if isinstance(data, list):
+        data = {'jobs': data}
+    base_dir = os.path.dirname(os.path.abspath(path))
+    defaults = data.get('defaults', {})
+    jobs = [make_job(entry, defaults, base_dir) for entry in data.get('jobs', [])]
+
+    names = [job['name'] for job in jobs]
+    dupes = sorted({n for n in names if names.count(n) > 1})
+    if dupes:
+        raise ValueError(f"Duplicate sprite names in manifest: {', '.join(dupes)}")
+    return jobs
+
+
+def build_blender_args(blender, script_path, job, out_dir):
+    return [blender, '-b', '--python', script_path, '--', '--job', json.dumps(helper_job(job, out_dir))]
+
+
+def helper_job(job, out_dir):
+    keys = ('model', 'texture', 'name', 'img_size', 'rotX', 'rotY', 'rotZ', 'camAngle', 'transport', 'views',
+            'threads', 'symmetry', 'framing', 'crop_border', 'profile', 'action', 'frame_start', 'frame_end',
+            'frame_step', 'prepared', 'save_prepared', 'save_proxy')
+    payload = {key: job.get(key) for key in keys}
+    # The proxy budget depends on the final pixel size, so only proxy renders are keyed on it
+    payload['proxy_pixels'] = job['pixel_size'] if job.get('proxy') else None
+    if job.get('keep_model'):
+        # Previews and cluster tasks ask the server to keep the model loaded; other payloads (and cache keys) leave it out
+        payload['keep_model'] = True
+    rendered = [name for name in job.get('passes') or () if name in RENDERED_PASSES]
+    if rendered:
+        # Likewise only jobs with normal or depth passes carry the key
+        payload['passes'] = rendered
+    payload['out_dir'] = out_dir
+    return payload
+
+
+def job_views(job):
+    # (view, direction, frame) for every sprite of a job, ordered frame by frame.
+    # Must match job_views in blender_render_helper.py; a still has one view per direction, named after it.
+    if not job.get('action'):
+        return [(d, d, None) for d in DIRECTION_NAMES]
+    frames = range(job['frame_start'], job['frame_end'] + 1, job['frame_step'])
+    return [(f'{frame:04d}_{d}', d, frame) for frame in frames for d in DIRECTION_NAMES]
+
+
+def mirror_views(views):
+    by_key = {(d, frame): view for view, d, frame in views}
+    return {view: by_key[(MIRROR_PAIRS[d], frame)] for view, d, frame in views if d in MIRROR_PAIRS}
+
+
+def parse_event(line):
+    if not line.startswith(EVENT_PREFIX):
+        return None
+    try:
+        return json.loads(line[len(EVENT_PREFIX):])
+    except ValueError:
+        return None
+
+
+class BlenderServer:
+    def __init__(self, blender, log=print):
+        args = [blender, '-b', '--python', helper_script_path(), '--', '--server']
+        self.proc = subprocess.Popen(args, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                     stderr=subprocess.STDOUT, text=True, bufsize=1)
+        self.jobs_done = 0
+        self._ids = itertools.count(1)
+        self._wait_for('ready', None, log)
+
+    def alive(self):
+        return self.proc.poll() is None
+
+    def _wait_for(self, event_name, job_id, log, progress=None):
+        for line in self.proc.stdout:
+            line = line.rstrip('\n')
+            event = parse_event(line)
+            if event is None:
+                log(line)
+            elif event.get('event') == event_name and event.get('id') == job_id:
+                return event
+            elif progress is not None and event.get('event') in PROGRESS_EVENTS:
+                progress(event)
+        raise RenderError(f'Blender render server exited with code {self.proc.wait()}')
+
+    def submit(self, job, out_dir, log=print, progress=None):
+        payload = helper_job(job, out_dir)
+        payload['id'] = next(self._ids)
+        try:
+            self.proc.stdin.write(json.dumps(payload) + '\n')
+            self.proc.stdin.flush()
+        except OSError:
+            raise RenderError('Blender render server is not running')
+        result = self._wait_for('result', payload['id'], log, progress)
+        self.jobs_done += 1
+        if not result.get('ok'):
+            raise RenderError(f"Blender failed to render {job['name']}: {result.get('error')}")
+        return result
+
+    def close(self, kill=False):
+        if kill and self.alive():
+            # Abandon the job in progress instead of waiting for it
+            self.proc.kill()
+            self.proc.wait()
+        if self.alive():
+            try:
+                self.proc.stdin.write(json.dumps({'command': 'quit'}) + '\n')
+                self.proc.stdin.close()
+                self.proc.wait(timeout=10)
+            except (OSError, subprocess.TimeoutExpired):
+                self.proc.kill()
+                self.proc.wait()
+
+
+class ServerPool:
+    def __init__(self, blender, size=1):
+        self.blender = blender
+        self.size = size
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._servers = []
+        self._starting = 0
+
+    def _acquire(self, log):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            start_new = len(self._servers) + self._starting < self.size
+            if start_new:
+                self._starting += 1
+        if not start_new:
+            return self._idle.get()
+        try:
+            server = BlenderServer(self.blender, log)
+            with self._lock:
+                self._servers.append(server)
+            return server
+        finally:
+            with self._lock:
+                self._starting -= 1
+
+    def _retire(self, server):
+        server.close()
+        with self._lock:
+            if server in self._servers:
+                self._servers.remove(server)
+
+    def warm(self, log=print):
+        # Start servers ahead of time so the first jobs skip Blender's startup
+        servers = []
+        while len(self._servers) + self._starting < self.size:
+            servers.append(self._acquire(log))
+        for server in servers:
+            self._idle.put(server)
+
+    def render(self, job, out_dir, log=print, progress=None):
+        server = self._acquire(log)
+        if not server.alive():
+            self._retire(server)
+            server = self._acquire(log)
+        try:
+            return server.submit(job, out_dir, log, progress)
+        finally:
+            if server.alive() and server.jobs_done < SERVER_MAX_JOBS:
+                self._idle.put(server)
+            else:
+                self._retire(server)
+
+    def close(self, kill=False):
+        with self._lock:
+            servers, self._servers = self._servers, []
+        for server in servers:
+            server.close(kill)
+
+
+def scratch_bytes(job):
+    # Rough upper bound on a job's scratch folder: an uncompressed RGBA frame per view plus its float32 passes
+    channels = 4 + sum(4 * (3 if name == 'normal' else 1) for name in job.get('passes') or () if name in RENDERED_PASSES)
+    return job['img_size'] ** 2 * channels * len(job_views(job))
+
+
+def scratch_root(needed=0):
+    # $SPRITE_SCRATCH_DIR if set, else a RAM-backed folder so raw frames never touch the disk, as long as it
+    # has room (Docker gives /dev/shm only 64 MB by default), else the system temp folder
+    if os.environ.get('SPRITE_SCRATCH_DIR'):
+        os.makedirs(os.environ['SPRITE_SCRATCH_DIR'], exist_ok=True)
+        return os.environ['SPRITE_SCRATCH_DIR']
+    try:
+        if os.access('/dev/shm', os.W_OK) and shutil.disk_usage('/dev/shm').free >= needed + SCRATCH_HEADROOM:
+            return '/dev/shm'
+    except OSError:
+        pass
+    return tempfile.gettempdir()
+
+
+def render_sprites(blender, job, out_dir, log=print, pool=None, progress=None):
+    os.makedirs(out_dir, exist_ok=True)
+    if pool is not None:
+        log('Sending job to Blender render server...')
+        return pool.render(job, out_dir, log, progress)
+
+    args = build_blender_args(blender, helper_script_path(), job, out_dir)
+    log('Starting Blender render...')
+    log('Command: ' + ' '.join(args))
+    # Read Blender's output as it comes so progress events arrive while it renders
+    proc = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, bufsize=1)
+    output = collections.deque(maxlen=ERROR_TAIL_LINES)
+    result = None
+    with proc:
+        for line in proc.stdout:
+            line = line.rstrip('\n')
+            output.append(line)
+            event = parse_event(line)
+            if event is None:
+                log(line)
+            elif event.get('event') == 'result':
+                result = event
+            elif progress is not None and event.get('event') in PROGRESS_EVENTS:
+                progress(event)
+    if proc.returncode:
+        raise subprocess.CalledProcessError(proc.returncode, args, output='\n'.join(output))
+    if result is None:
+        raise RenderError('Blender exited without reporting the rendered frames')
+    return result
+
+
+def preview_job(job, direction):
+    # One direction of a job as a quick draft still; the render server keeps the model loaded between previews
+    return dict(job, name='preview', views=[direction], img_size=max(job['pixel_size'], min(job['img_size'], PREVIEW_SIZE)),
+                profile='draft', transport='raw', symmetry='off', proxy=False, action='', shards=1, passes=[],
+                prepared=None, save_prepared=None, save_proxy=None, keep_model=True)
+
+
+def render_preview(server, job, direction, out_dir, log=print):
+    # The sprite as generate_job would downscale it, before cropping and alignment
+    preview = preview_job(job, direction)
+    result = server.submit(preview, out_dir, log)
+    small, _ = _downscale_frame(result['frames'][direction], preview['pixel_size'], preview['img_size'],
+                                result['borders'].get(direction))
+    return small
+
+
+def alpha_bbox(img):
+    # Bounding box of non-transparent pixels, measured on the alpha channel only
+    alpha = np.asarray(img.getchannel('A'))
+    rows = np.flatnonzero(alpha.any(axis=1))
+    if not rows.size:
+        return None
+    cols = np.flatnonzero(alpha.any(axis=0))
+    return (int(cols[0]), int(rows[0]), int(cols[-1]) + 1, int(rows[-1]) + 1)
+
+
+def _downscale_frame(path, pixel_size, img_size=None, border=None):
+    # The only decode of each render; the small frame stays in memory from here on
+    with Image.open(path) as img:
+        img = img.convert('RGBA')
+    if border:
+        # Put a border-cropped render back where it sits in the full frame so NEAREST samples the same pixels
+        full = Image.new('RGBA', (img_size, img_size), (0, 0, 0, 0))
+        full.paste(img, (border[0], border[1]))
+        img = full
+    small = img.resize((pixel_size, pixel_size), Image.NEAREST)
+    return small, alpha_bbox(small)
+
+
+def _downscale_pass(path, name, pixel_size, img_size=None, border=None):
+    # Same placement and NEAREST sampling as the colour frame, one float channel at a time
+    data = np.load(path)
+    channels = []
+    for c in range(data.shape[2]):
+        img = Image.fromarray(np.ascontiguousarray(data[..., c], dtype=np.float32), 'F')
+        if border:
+            full = Image.new('F', (img_size, img_size), PASS_FILL[name])
+            full.paste(img, (border[0], border[1]))
+            img = full
+        channels.append(np.asarray(img.resize((pixel_size, pixel_size), Image.NEAREST)))
+    return np.stack(channels, axis=-1)
+
+
+def _downscale_view(item, job):
+    path, border, passes = item
+    small, bbox = _downscale_frame(path, job['pixel_size'], job['img_size'], border)
+    return small, bbox, {name: _downscale_pass(p, name, job['pixel_size'], job['img_size'], border)
+                         for name, p in passes.items()}
+
+
+def _load_small_frame(path):
+    with Image.open(path) as img:
+        small = img.convert('RGBA')
+    return small, alpha_bbox(small)
+
+
+def _save_image(img, path):
+    img.save(path, optimize=False)
+
+
+def frame_layout(frames, shared_box=False):
+    # Sprite size and, per frame, the crop box of its small frame and where that lands in the sprite
+    if shared_box:
+        # One crop box for every frame keeps each sprite where the camera saw it, so animations don't jitter
+        boxes = [bbox for _, bbox in frames.values() if bbox]
+        if not boxes:
+            return None, {}
+        box = (min(b[0] for b in boxes), min(b[1] for b in boxes), max(b[2] for b in boxes), max(b[3] for b in boxes))
+        return (box[2] - box[0], box[3] - box[1]), {name: (box, (0, 0)) for name in frames}
+
+    # Find the maximum bounding box across all pixelated sprites
+    sizes = [(bbox[2] - bbox[0], bbox[3] - bbox[1]) for _, bbox in frames.values() if bbox]
+    if not sizes:
+        return None, {}
+    max_bbox = (max(w for w, _ in sizes), max(h for _, h in sizes))
+
+    # Center each cropped sprite in the uniform size
+    layout = {}
+    for name, (_, bbox) in frames.items():
+        if bbox:
+            offset = ((max_bbox[0] - (bbox[2] - bbox[0])) // 2, (max_bbox[1] - (bbox[3] - bbox[1])) // 2)
+            layout[name] = (bbox, offset)
+    return max_bbox, layout
+
+
+def align_frame(img, size, box, offset):
+    final_img = Image.new('RGBA', size, (0, 0, 0, 0))
+    final_img.paste(img.crop(box), offset)
+    return final_img
+
+
+def align_pass(data, name, size, box, offset):
+    # The colour sprite's crop and placement applied to a pass array
+    out = np.full((size[1], size[0], data.shape[2]), PASS_FILL[name], dtype=data.dtype)
+    x, y = offset
+    out[y:y + box[3] - box[1], x:x + box[2] - box[0]] = data[box[1]:box[3], box[0]:box[2]]
+    return out
+
+
+def mirror_pass(data, name):
+    flipped = data[:, ::-1]
+    if name == 'normal':
+        # Flipping the image turns the surface around the vertical axis too
+        flipped = flipped * np.array([-1.0, 1.0, 1.0], dtype=data.dtype)
+    return np.ascontiguousarray(flipped)
+
+
+def observed_depth_range(arrays):
+    # Falls back to the depths actually seen; the background fill and any infinities are left out
+    seen = [a[np.isfinite(a) & (a < PASS_FILL['depth'])] for a in arrays if a is not None]
+    seen = np.concatenate([a.ravel() for a in seen]) if seen else np.empty(0)
+    if not seen.size:
+        return [0.0, 1.0]
+    return [float(seen.min()), float(seen.max())]
+
+
+def pass_image(name, sprite, data=None, depth_range=None):
+    # 8-bit mask, normals as RGB = n * 0.5 + 0.5 under the sprite's alpha, depth as 16-bit grey over the job's range
+    alpha = np.asarray(sprite.getchannel('A'))
+    if name == 'mask':
+        return Image.fromarray(alpha)
+    if name == 'normal':
+        rgb = np.clip(np.rint((data * 0.5 + 0.5) * 255.0), 0, 255).astype(np.uint8)
+        return Image.fromarray(np.dstack([rgb, alpha]))
+    near, far = depth_range or observed_depth_range([data])
+    depth = np.clip((data[..., 0] - near) / max(far - near, 1e-9), 0.0, 1.0)
+    return Image.fromarray(np.rint(depth * 65535.0).astype(np.uint16))
+
+
+class StageLog:
+    def __init__(self, log):
+        self.log = log
+        self.stages = []
+
+    def record(self, stage, inputs, ran, seconds=0.0):
+        self.stages.append({'stage': stage, 'inputs': inputs, 'ran': ran, 'seconds': seconds})
+
+    def report(self):
+        parts = []
+        for entry in self.stages:
+            if not entry['ran']:
+                status = 'reused'
+            elif entry['seconds'] is None:
+                status = 'ran'
+            else:
+                status = f"{entry['seconds']:.2f}s"
+            parts.append(f"{entry['stage']} {status}")
+        self.log('Stages: ' + ', '.join(parts))
+
+
+class JobProgress:
+    # Counts finished views from Blender's events and collects their timings for the job's report
+    def __init__(self, total, callback=None):
+        self.total = total
+        self.done = 0
+        self.callback = callback
+        self.blender = {}
+        self.frames = {}
+        self._lock = threading.Lock()
+
+    def advance(self, count=1):
+        with self._lock:
+            self.done = min(self.total, self.done + count)
+            done = self.done
+        if self.callback is not None and count:
+            self.callback(done, self.total)
+
+    def __call__(self, event):
+        kind = event.get('event')
+        if kind == 'stage':
+            # Shards each report their own stages; the report sums them
+            with self._lock:
+                self.blender[event['stage']] = self.blender.get(event['stage'], 0.0) + event['seconds']
+        elif kind == 'plan':
+            # Mirrored views are flipped on the host and never rendered
+            self.advance(len(event.get('mirrored') or []))
+        elif kind == 'frame':
+            with self._lock:
+                self.frames[event['view']] = {'render': event['render'], 'write': event['write']}
+            self.advance()
+
+    def summary(self):
+        with self._lock:
+            blender = dict(self.blender)
+            frames = dict(self.frames)
+        parts = [f'{stage} {seconds:.2f}s' for stage, seconds in blender.items() if stage != 'render views']
+        if frames:
+            render = sum(f['render'] for f in frames.values()) / len(frames)
+            write = sum(f['write'] for f in frames.values()) / len(frames)
+            parts.append(f'{len(frames)} frames at {render:.2f}s render + {write:.3f}s write')
+        return ', '.join(parts)
+
+    def report(self, stages):
+        with self._lock:
+            return {'blender': dict(self.blender), 'frames': dict(self.frames), 'stages': stages}
+
+
+def write_timing_report(path, job, result):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'name': job['name'], 'model': job['model'], 'seconds': result.get('seconds'),
+                   **result['timing']}, f, indent=2)
+
+
+def split_views(views, shards):
+    # Deal views out round-robin so neighbouring (similar cost) angles land in different shards
+    shards = max(1, min(shards, len(views)))
+    return [views[i::shards] for i in range(shards)]
+
+
+def _render_stage(blender, job, keys, cache, scratch, threads, log, pool, stages, framing, progress, hold=None):
+    # Work out which views still need Blender; everything else comes from the cache.
+    # framing is None while an auto symmetry check is still pending.
+    mirrored = framing and framing['mirrored']
+    views = [view for view, _, _ in job_views(job)]
+    wanted = [v for v in views if not (mirrored and v in mirrored)]
+    rendered_passes = [name for name in job.get('passes') or () if name in RENDERED_PASSES]
+    small, raw, missing = {}, {}, []
+    # Cached frames carry a copy of the framing they were rendered with, in case its own entry was evicted
+    recovered = None
+    for view in wanted:
+        if cache is not None:
+            hit = cache.lookup('downscale', keys['downscale'][view], hold)
+            if hit is not None:
+                small[view] = (hit[0], cached_passes(hit[1:]))
+                recovered = recovered or cached_framing(hit[1:])
+                continue
+            hit = cache.lookup('render', keys['render'][view], hold)
+            if hit is not None:
+                border = None
+                if len(hit) > 1:
+                    with open(hit[1], 'r', encoding='utf-8') as f:
+                        border = json.load(f)
+                raw[view] = (hit[0], border, cached_passes(hit[2:]))
+                recovered = recovered or cached_framing(hit[2:])
+                continue
+        missing.append(view)
+    if not framing_known(framing) and recovered is not None:
+        framing = recovered
+        # Views an auto symmetry check had found to be mirrored don't need rendering after all
+        missing = [v for v in missing if v not in framing['mirrored']]
+        cache.put('framing', keys['framing'], [framing_file(scratch, job['name'], framing)], move=True)
+    if not missing and not framing_known(framing):
+        # Nothing cached knows the camera any more: render one view again to get it back
+        view = wanted[0]
+        small.pop(view, None)
+        raw.pop(view, None)
+        missing.append(view)
+    progress.advance(len(views) - len(missing))
+
+    if not missing:
+        stages.record('import', keys['import'], False)
+        stages.record('framing', keys['framing'], False)
+        return small, raw, missing, framing
+
+    # Optionally split the directions across several Blender processes, dividing the cores between them
+    chunks = split_views(missing, job.get('shards', 1))
+    shard_threads = None
+    if len(chunks) > 1 or threads:
+        shard_threads = max(1, (threads or os.cpu_count() or 1) // len(chunks))
+    if len(missing) < len(wanted):
+        log(f"Rendering only changed views: {', '.join(missing)}")
+    if len(chunks) > 1:
+        log(f'Splitting {len(missing)} views across {len(chunks)} Blender processes ({shard_threads} threads each)...')
+
+    # Load the model from a prepared .blend when one is cached (a decimated proxy if requested);
+    # otherwise have the first shard save one
+    prepared_key = proxy_key = prepared = proxy = None
+    # Prepared .blend files are paths on this machine, so pools rendering elsewhere skip them
+    if cache is not None and not getattr(pool, 'remote', False):
+        prepared_key = cache.prepared_key(keys['import'], blender)
+        if job.get('proxy'):
+            proxy_key = cache.proxy_key(prepared_key, keys['framing'])
+            proxy = cache.lookup('import', proxy_key, hold)
+        if proxy is None:
+            prepared = cache.lookup('import', prepared_key, hold)
+    if proxy is not None:
+        log('Loading proxy model from the import cache...')
+    elif prepared is not None:
+        log('Loading prepared model from the import cache...')
+
+    def render_shard(index, chunk):
+        shard_job = dict(job)
+        shard_job['threads'] = shard_threads
+        if proxy is not None:
+            shard_job['prepared'] = proxy[0]
+        elif prepared is not None:
+            shard_job['prepared'] = prepared[0]
+        elif cache is not None and index == 0:
+            shard_job['save_prepared'] = os.path.join(scratch, 'prepared.blend')
+        if proxy_key is not None and proxy is None and index == 0:
+            shard_job['save_proxy'] = os.path.join(scratch, 'proxy.blend')
+        if len(chunk) < len(views):
+            shard_job['views'] = chunk
+        start = time.perf_counter()
+        result = render_sprites(blender, shard_job, scratch, log, pool, progress)
+        return result, time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=len(chunks)) as executor:
+        shard_results = list(executor.map(render_shard, range(len(chunks)), chunks))
+
+    # Import and framing happen inside each Blender run, so their time is part of the render stage
+    first = shard_results[0][0]
+    if cache is not None:
+        for key, saved in ((prepared_key, first.get('prepared')), (proxy_key, first.get('proxy_file'))):
+            if key and saved and os.path.isfile(saved):
+                cache.put('import', key, [saved], move=True, hold=hold)
+    stages.record('import', keys and keys['import'], prepared is None and proxy is None, None)
+    stages.record('framing', keys and keys['framing'], True, None)
+    info = first.get('proxy')
+    if info:
+        if info['reused']:
+            log(f"Proxy mesh: reused {info['triangles_after']:,} of {info['triangles_before']:,} triangles "
+                f"(saved {info['seconds']:.1f}s of decimation per process)")
+        elif info['triangles_after'] < info['triangles_before']:
+            log(f"Proxy mesh: {info['triangles_before']:,} -> {info['triangles_after']:,} triangles "
+                f"(budget {info['budget']:,}) in {info['seconds']:.1f}s")
+        stages.record('proxy', proxy_key, not info['reused'], None if info['reused'] else info['seconds'])
+    if not framing_known(framing):
+        framing = dict(first.get('framing') or {})
+        framing['mirrored'] = first.get('mirrored') or {}
+        if cache is not None:
+            cache.put('framing', keys['framing'], [framing_file(scratch, job['name'], framing)], move=True)
+    for index, (result, seconds) in enumerate(shard_results):
+        borders = result.get('borders') or {}
+        for view, path in result['frames'].items():
+            border = borders.get(view)
+            passes = (result.get('passes') or {}).get(view) or {}
+            lost = [name for name in rendered_passes if name not in passes]
+            if lost:
+                raise RenderError(f"Blender wrote no {', '.join(lost)} pass for {view}")
+            passes = {name: passes[name] for name in rendered_passes}
+            if cache is not None:
+                # The border offset travels with the cropped render so a cache hit can be placed correctly
+                border_path = os.path.join(scratch, f"{job['name']}_{view}_border.json")
+                with open(border_path, 'w', encoding='utf-8') as f:
+                    json.dump(border, f)
+                files = [path, border_path, framing_file(scratch, f"{job['name']}_{view}", framing)]
+                stored = cache.put('render', keys['render'][view], files + list(passes.values()), move=True, hold=hold)
+                path = stored[0]
+                passes = cached_passes(stored[2:])
+            raw[view] = (path, border, passes)
+        label = f"render {len(result['frames'])}/{len(views)} {'views' if job.get('action') else 'directions'}"
+        if len(chunks) > 1:
+            label += f" (shard {index + 1}/{len(chunks)}: {', '.join(result['frames'])})"
+        stages.record(label, keys and {d: keys['render'][d] for d in result['frames']}, True, seconds)
+    log(f'Blender timing: {progress.summary()}')
+    rendered = [d for result, _ in shard_results for d in result['frames']]
+    return small, raw, rendered, framing
+
+
+def cached_passes(paths):
+    # Pass arrays follow the frame in a cache entry, named ..._<pass>.npy
+    return {os.path.splitext(path)[0].rsplit('_', 1)[-1]: path for path in paths if path.endswith('.npy')}
+
+
+def framing_file(scratch, prefix, framing):
+    path = os.path.join(scratch, f'{prefix}_framing.json')
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(framing, f)
+    return path
+
+
+def cached_framing(paths):
+    for path in paths:
+        if path.endswith('_framing.json'):
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+    return None
+
+
+def framing_known(framing):
+    # Only Blender decides the camera; a framing without one (symmetry settings alone) still needs a render
+    return framing is not None and 'camera' in framing
+
+
+def known_framing(job, keys, cache):
+    # Camera framing and auto-detected symmetry are decided inside Blender; reuse an earlier run's
+    # decision for the same model and settings
+    hit = cache.lookup('framing', keys['framing']) if cache is not None else None
+    if hit is not None:
+        with open(hit[0], 'r', encoding='utf-8') as f:
+            return json.load(f)
+    if job['symmetry'] == 'auto':
+        return None
+    return {'mirrored': mirror_views(job_views(job)) if job['symmetry'] == 'force' else {}}
+
+
+def sprite_file(job, view):
+    ext = 'lmp' if job.get('palette') and job['palette_output'] == 'patch' else 'png'
+    return f"{job['name']}_{view}.{ext}"
+
+
+def pass_file(job, view, name):
+    return f"{job['name']}_{view}_{name}.png"
+
+
+def job_palette(job, cache=None):
+    # Patches mark transparency per column, so every palette index stays usable for colour
+    if not job.get('palette'):
+        return None
+    transparent = job['palette_transparent'] if job['palette_output'] == 'png' else None
+    return sprite_palette.load_lut(job['palette'], job['palette_bits'], transparent, cache)
+
+
+def sprite_metadata(job, size, framing, views):
+    mirrored = framing['mirrored']
+    frames = []
+    for view, direction, frame in views:
+        entry = {'direction': direction, 'file': sprite_file(job, view), 'mirrored_from': mirrored.get(view)}
+        if frame is not None:
+            entry['frame'] = frame
+        if job.get('passes'):
+            entry['passes'] = {name: pass_file(job, view, name) for name in job['passes']}
+        frames.append(entry)
+    camera = {key: framing[key] for key in ('mode', 'ortho_scale', 'camera') if key in framing}
+    data = {'name': job['name'], 'pixel_size': job['pixel_size'], 'size': list(size),
+            'symmetric': bool(mirrored), 'framing': camera, 'frames': frames}
+    if job.get('action'):
+        data['action'] = job['action']
+    if job.get('palette'):
+        data['palette'] = {'file': os.path.basename(job['palette']), 'output': job['palette_output']}
+    if job.get('passes'):
+        # How to read each pass back: normals are world-space, depth spans the range the model can reach
+        info = {'mask': {'format': 'L8'},
+                'normal': {'format': 'RGBA8', 'space': 'world', 'encoding': 'rgb = normal * 0.5 + 0.5'},
+                'depth': {'format': 'L16', 'encoding': 'value = (distance - near) / (far - near)'}}
+        if 'depth_range' in framing:
+            info['depth'].update(near=framing['depth_range'][0], far=framing['depth_range'][1])
+        data['passes'] = {name: info[name] for name in job['passes']}
+    return data
+
+
+def write_metadata(path, job, size, framing, views):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(sprite_metadata(job, size, framing, views), f, indent=2)
+
+
+def final_output(job, cache):
+    # Only atlas, palette and pass jobs key their final stage on the output format, so plain sprites keep their cache entries
+    output = {}
+    if job.get('output') == 'atlas':
+        output.update({'format': 'atlas', 'binary': job['atlas_binary']})
+    if job.get('palette'):
+        output['palette'] = {'file': cache.file_digest(job['palette']), 'output': job['palette_output'],
+                             'bits': job['palette_bits'], 'transparent': job['palette_transparent']}
+    if job.get('passes'):
+        output['passes'] = job['passes']
+    return output or None
+
+
+def index_name(job):
+    # The file describing a job's finished set; it is published last
+    if job.get('output') == 'atlas':
+        return f"{job['name']}_atlas.json"
+    return f"{job['name']}_sprites.json"
+
+
+def published_files(out_dir, job):
+    # The set an earlier run of this job left in out_dir, according to its index. Both indexes are read,
+    # so switching a job between sprites and an atlas removes the other format's files too.
+    names = set()
+    for output in ('sprites', 'atlas'):
+        index_file = index_name(dict(job, output=output))
+        try:
+            with open(os.path.join(out_dir, index_file), 'r', encoding='utf-8') as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            continue
+        names.add(index_file)
+        if output == 'atlas':
+            names |= {index.get('image', ''), f"{job['name']}_atlas.bin"}
+        else:
+            names |= {frame.get('file', '') for frame in index.get('frames', [])}
+            names |= {name for frame in index.get('frames', []) for name in (frame.get('passes') or {}).values()}
+    # Never touch anything outside out_dir, whatever an index says
+    return {name for name in names if name and os.path.basename(name) == name}
+
+
+def staging_dir(out_dir, job):
+    # A private folder inside out_dir (so moving out of it is a rename), hidden from tools listing sprites.
+    # Folders a crashed run left behind are cleared once they are clearly not in use any more.
+    pattern = re.compile(rf"\.{re.escape(job['name'])}-[a-z0-9_]{{8}}")
+    now = time.time()
+    for entry in os.scandir(out_dir):
+        try:
+            if pattern.fullmatch(entry.name) and entry.is_dir() and now - entry.stat().st_mtime > STAGING_MAX_AGE:
+                shutil.rmtree(entry.path, ignore_errors=True)
+        except OSError:
+            pass
+    return tempfile.mkdtemp(prefix=f".{job['name']}-", dir=out_dir)
+
+
+def publish(staging, out_dir, names, job, current=()):
+    # Move the finished set from its staging folder into place. Each file is renamed on its own and the
+    # index goes last, so readers never see an index listing sprites that aren't there yet (the set as a
+    # whole is not swapped atomically). Files of the previous set that the new one doesn't have (other
+    # frames, the other output format) are removed afterwards.
+    stale = published_files(out_dir, job) - set(names) - set(current)
+    index = index_name(job)
+    for name in sorted(names, key=lambda n: n == index):
+        os.replace(os.path.join(staging, name), os.path.join(out_dir, name))
+    for name in stale:
+        try:
+            os.remove(os.path.join(out_dir, name))
+        except OSError:
+            pass
+
+
+def generate_job(blender, job, out_dir, threads=None, log=print, pool=None, cache=None, progress=None):
+    # Staged pipeline: import -> framing -> render (per view) -> downscale -> crop/align -> write.
+    # With a cache every stage is keyed by its inputs, so only the stages downstream of a change run again.
+    if cache is None or not cache.enabled:
+        return _generate_job(blender, job, out_dir, threads, log, pool, None, progress, None)
+    # The entries this job reads back stay out of eviction until it is done
+    with cache.held() as hold:
+        return _generate_job(blender, job, out_dir, threads, log, pool, cache, progress, hold)
+
+
+def _generate_job(blender, job, out_dir, threads, log, pool, cache, progress, hold):
+    stages = StageLog(log)
+    views = job_views(job)
+    view_names = [view for view, _, _ in views]
+    progress = JobProgress(len(views), progress)
+    keys = None
+    if cache is not None:
+        keys = cache.stage_keys(helper_job(job, ''), helper_script_path(), view_names, job['pixel_size'],
+                                final_output(job, cache))
+    sprite_name = lambda view: f"{job['name']}_{view}.png"
+    metadata_name = f"{job['name']}_sprites.json"
+    os.makedirs(out_dir, exist_ok=True)
+
+    finals = cache.lookup('final', keys['final'], hold) if cache is not None else None
+    if finals is not None:
+        for stage in ('import', 'framing', 'render', 'downscale', 'crop/align'):
+            stages.record(stage, None, False)
+        start = time.perf_counter()
+        changed, current = [], []
+        staging = staging_dir(out_dir, job)
+        try:
+            for src in finals:
+                name = os.path.basename(src)
+                dst = os.path.join(out_dir, name)
+                # Leave sprites that are already up to date alone
+                if os.path.isfile(dst) and filecmp.cmp(src, dst, shallow=False):
+                    current.append(name)
+                else:
+                    shutil.copyfile(src, os.path.join(staging, name))
+                    changed.append(name)
+            publish(staging, out_dir, changed, job, current)
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+        extra = {pass_file(job, view, name) for view in view_names for name in job.get('passes') or ()}
+        names = [os.path.basename(f) for f in finals if os.path.basename(f) != metadata_name]
+        result = {'files': [name for name in names if name not in extra], 'passes': [name for name in names if name in extra]}
+        if job.get('output') == 'atlas':
+            with open(os.path.join(out_dir, index_name(job)), 'r', encoding='utf-8') as f:
+                result.update(files=[], atlas=names, sprites=len(json.load(f)['sprites']))
+        else:
+            result['sprites'] = len(result['files'])
+        stages.record('write', keys['final'], bool(changed), time.perf_counter() - start)
+        stages.report()
+        progress.advance(len(views))
+        return dict(result, rendered=[], stages=stages.stages, timing=progress.report(stages.stages))
+
+    scratch = tempfile.mkdtemp(prefix=f"{job['name']}-", dir=scratch_root(scratch_bytes(job)))
+    try:
+        framing = known_framing(job, keys, cache)
+        small, raw, rendered, framing = _render_stage(blender, job, keys, cache, scratch, threads, log, pool,
+                                                      stages, framing, progress, hold)
+        mirrored = framing['mirrored']
+
+        log(f"Downscaling to {job['pixel_size']}x{job['pixel_size']}...")
+        start = time.perf_counter()
+        workers = threads or min(len(view_names), os.cpu_count() or 1)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            # Decode and downscale every new render (and its passes) in parallel; cached small frames only need loading
+            downscaled = dict(zip(raw, executor.map(lambda item: _downscale_view(item, job), raw.values())))
+            frames = {view: (img, bbox) for view, (img, bbox, _) in downscaled.items()}
+            frames.update(zip(small, executor.map(_load_small_frame, [path for path, _ in small.values()])))
+        pass_data = {view: passes for view, (_, _, passes) in downscaled.items()}
+        pass_data.update({view: {name: np.load(p) for name, p in passes.items()} for view, (_, passes) in small.items()})
+        if cache is not None:
+            for view in raw:
+                path = os.path.join(scratch, 'small_' + sprite_name(view))
+                frames[view][0].save(path, optimize=False)
+                files = [path, framing_file(scratch, f"small_{job['name']}_{view}", framing)]
+                for name, data in pass_data[view].items():
+                    files.append(os.path.join(scratch, f"small_{job['name']}_{view}_{name}.npy"))
+                    np.save(files[-1], data)
+                cache.put('downscale', keys['downscale'][view], files, move=True, hold=hold)
+        stages.record('downscale', keys and keys['downscale'], bool(raw), time.perf_counter() - start)
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    log('Finding optimal crop bounds...')
+    start = time.perf_counter()
+    shared_box = bool(job.get('action'))
+    if shared_box:
+        # Flip before cropping so mirrored views land inside the shared crop box too
+        for view, source in mirrored.items():
+            if source in frames:
+                img = ImageOps.mirror(frames[source][0])
+                frames[view] = (img, alpha_bbox(img))
+                pass_data[view] = {name: mirror_pass(data, name) for name, data in pass_data[source].items()}
+    max_bbox, layout = frame_layout({v: frames[v] for v in view_names if v in frames}, shared_box)
+    aligned = {view: align_frame(frames[view][0], max_bbox, *layout[view]) for view in layout}
+    # Every pass gets the crop and placement of its colour sprite, so the two stay pixel-aligned
+    aligned_passes = {view: {name: align_pass(data, name, max_bbox, *layout[view]) for name, data in pass_data[view].items()}
+                      for view in layout}
+    # Mirrored views are exact flips of their finished counterparts
+    for view, source in mirrored.items():
+        if source in aligned and view not in aligned:
+            aligned[view] = ImageOps.mirror(aligned[source])
+            aligned_passes[view] = {name: mirror_pass(data, name) for name, data in aligned_passes[source].items()}
+    stages.record('crop/align', keys and keys['final'], True, time.perf_counter() - start)
+    if 'depth' in (job.get('passes') or ()) and 'depth_range' not in framing:
+        # Only a Blender render reports the depth range; keep the depth pass consistent across views without one
+        framing = dict(framing, depth_range=observed_depth_range([p.get('depth') for p in aligned_passes.values()]))
+    if max_bbox is None:
+        log('Warning: No visible pixels found in sprites')
+        stages.report()
+        return {'files': [], 'passes': [], 'sprites': 0, 'rendered': rendered, 'stages': stages.stages,
+                'timing': progress.report(stages.stages)}
+    log(f'Cropping all sprites to {max_bbox[0]}x{max_bbox[1]} pixels...')
+    if mirrored:
+        log(f"Mirrored frames: {', '.join(f'{d} (from {s})' for d, s in mirrored.items())}")
+
+    # Encode each final sprite exactly once
+    start = time.perf_counter()
+    palette = job_palette(job, cache)
+    written = [view for view in views if view[0] in aligned]
+    pass_files = atlas_files = []
+    staging = staging_dir(out_dir, job)
+    try:
+        if job.get('output') == 'atlas':
+            # One sheet instead of a PNG per view; the index carries the metadata
+            metadata = sprite_metadata(job, max_bbox, framing, written)
+            del metadata['frames']
+            entries = sprite_atlas.make_entries(job['name'], written, aligned, mirrored)
+            atlas_files = sprite_atlas.write_atlas(entries, staging, f"{job['name']}_atlas", {job['name']: metadata},
+                                                   job['atlas_binary'], palette)
+            files = []
+            saved = atlas_files
+        else:
+            files = [sprite_file(job, view) for view, _, _ in written]
+            save = _save_image
+            if palette is not None:
+                save = palette.save_patch if job['palette_output'] == 'patch' else palette.save_png
+            extra = [(view, name) for view, _, _ in written for name in job.get('passes') or ()]
+            pass_files = [pass_file(job, view, name) for view, name in extra]
+
+            def save_pass(view, name):
+                img = pass_image(name, aligned[view], aligned_passes[view].get(name), framing.get('depth_range'))
+                _save_image(img, os.path.join(staging, pass_file(job, view, name)))
+
+            with ThreadPoolExecutor(max_workers=min(len(files), os.cpu_count() or 1)) as executor:
+                list(executor.map(save, [aligned[view] for view, _, _ in written], [os.path.join(staging, f) for f in files]))
+                list(executor.map(save_pass, [view for view, _ in extra], [name for _, name in extra]))
+            write_metadata(os.path.join(staging, metadata_name), job, max_bbox, framing, written)
+            saved = files + pass_files + [metadata_name]
+        if cache is not None:
+            cache.put('final', keys['final'], [os.path.join(staging, f) for f in saved])
+        publish(staging, out_dir, saved, job)
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+    stages.record('write', None, True, time.perf_counter() - start)
+
+    for file in files + pass_files + atlas_files:
+        log(f'  Processed: {file}')
+    stages.report()
+    progress.advance(len(views))
+    result = {'files': files, 'passes': pass_files, 'sprites': len(written), 'rendered': rendered,
+              'stages': stages.stages, 'timing': progress.report(stages.stages)}
+    if job.get('output') == 'atlas':
+        result['atlas'] = atlas_files
+    return result
+
+
+def run_job(blender, job, out_dir, log_dir=None, threads=None, pool=None, cache=None):
+    result = {'name': job['name'], 'model': job['model'], 'ok': False, 'error': None, 'files': []}
+    log_file = None
+    if log_dir:
+        os.makedirs(log_dir, exist_ok=True)
+        log_file = open(os.path.join(log_dir, f"{job['name']}.log"), 'w', encoding='utf-8')
+        result['log'] = log_file.name
+
+    def log(text):
+        if log_file:
+            log_file.write(text + '\n')
+
+    start = time.perf_counter()
+    try:
+        result.update(generate_job(blender, job, out_dir, threads, log, pool, cache))
+        result['ok'] = True
+    except subprocess.CalledProcessError as e:
+        log('ERROR: Blender returned non-zero exit code (its output is above)')
+        result['error'] = f'Blender exited with code {e.returncode}'
+    except Exception as e:
+        log(f'ERROR: {str(e)}')
+        result['error'] = str(e)
+    finally:
+        result['seconds'] = time.perf_counter() - start
+        if log_file:
+            log_file.close()
+    if log_dir and result.get('timing'):
+        result['timing_report'] = os.path.join(log_dir, f"{job['name']}_timing.json")
+        write_timing_report(result['timing_report'], job, result)
+    return result
+
+
+def atlas_jobs(jobs, log=None):
+    # Jobs packed into one batch atlas: each builds a per-model atlas first, checked like any other job
+    binary = sorted(job['name'] for job in jobs if job.get('atlas_binary'))
+    if binary and log is not None:
+        log(f"Ignoring atlas_binary of {', '.join(binary)}: only the merged atlas gets a binary index (--atlas-binary)")
+    return [make_job(dict(job, output='atlas', atlas_binary=False)) for job in jobs]
+
+
+def run_batch(blender, jobs, out_dir, workers=None, log_dir=None, threads=None, persistent=True, cache=None, log=print,
+              atlas=None, atlas_binary=False, pool=None):
+    if atlas:
+        jobs = atlas_jobs(jobs, log)
+    workers = max(1, workers or os.cpu_count() or 1)
+    if threads is None:
+        # Split the machine between the concurrent Blenders instead of oversubscribing it
+        threads = max(1, (os.cpu_count() or 1) // workers)
+
+    start = time.perf_counter()
+    results = []
+    if pool is not None:
+        # A pool from the caller (e.g. a render cluster) stays open for it to close
+        log(f'Rendering {len(jobs)} models, {workers} at a time...')
+        servers = None
+    else:
+        mode = 'persistent' if persistent else 'one-shot'
+        log(f'Rendering {len(jobs)} models with {workers} {mode} Blender workers ({threads} threads each)...')
+        shards = max(job.get('shards', 1) for job in jobs) if jobs else 1
+        servers = pool = ServerPool(blender, min(workers, len(jobs)) * shards) if persistent else None
+    job_out = out_dir
+    if atlas:
+        # Build per-model atlases (cached like any other output) in scratch, then pack them into one sheet
+        job_out = tempfile.mkdtemp(prefix='atlas-', dir=scratch_root())
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(run_job, blender, job, job_out, log_dir, threads, pool, cache): job for job in jobs}
+            for future in as_completed(futures):
+                result = future.result()
+                results.append(result)
+                status = 'ok' if result['ok'] else f"FAILED ({result['error']})"
+                if result['ok'] and len(result['rendered']) < result['sprites']:
+                    status += f" (rendered {len(result['rendered'])}/{result['sprites']} views)"
+                log(f"[{len(results)}/{len(jobs)}] {result['name']}: {status} in {result['seconds']:.1f}s")
+        if atlas:
+            indexes = [os.path.join(job_out, f"{r['name']}_atlas.json") for r in sorted(results, key=lambda r: r['name'])
+                       if r['ok'] and r.get('atlas')]
+            os.makedirs(out_dir, exist_ok=True)
+            # Jobs sharing one palette keep the merged sheet indexed too
+            palettes = {(job['palette'], job['palette_bits'], job['palette_transparent']) for job in jobs}
+            palette = job_palette(jobs[0], cache) if len(palettes) == 1 and jobs[0]['palette'] else None
+            atlas_files = sprite_atlas.merge_atlases(indexes, out_dir, atlas, atlas_binary, palette)
+            log(f"Packed {len(indexes)} models into {', '.join(atlas_files)}")
+    finally:
+        if servers is not None:
+            servers.close()
+        if atlas:
+            shutil.rmtree(job_out, ignore_errors=True)
+    summary = summarize(results, time.perf_counter() - start, workers)
+    if atlas:
+        # The per-model atlases were only a step towards the merged one
+        summary['atlas'] = [os.path.join(out_dir, f) for f in atlas_files]
+        summary['atlas_files_written'] = len(atlas_files)
+    if cache is not None and cache.enabled:
+        summary['cache'] = cache.summary()
+    return summary
+
+
+def summarize(results, wall_seconds, workers):
+    ok = [r for r in results if r['ok']]
+    failed = [r for r in results if not r['ok']]
+    busy = sum(r['seconds'] for r in results)
+    return {
+        'jobs': len(results),
+        'succeeded': len(ok),
+        'failed': len(failed),
+        'workers': workers,
+        'wall_seconds': wall_seconds,
+        'jobs_per_minute': (len(results) * 60.0 / wall_seconds) if wall_seconds > 0 else 0.0,
+        'sprites_written': sum(r['sprites'] for r in ok),
+        'atlas_files_written': sum(len(r.get('atlas', [])) for r in ok),
+        'worker_utilization': (busy / (wall_seconds * workers)) if wall_seconds > 0 else 0.0,
+        'failures': [{'name': r['name'], 'model': r['model'], 'error': r['error'], 'log': r.get('log')} for r in failed],
+        'results': sorted(results, key=lambda r: r['name']),
+    }
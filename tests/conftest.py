@@ -0,0 +1,29 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import benchmark_sprites
+
+
+@pytest.fixture
+def blender(tmp_path):
+    # The stand-in Blender from the benchmark: renders OBJ vertices as points, no Blender needed
+    return benchmark_sprites.stub_launcher(str(tmp_path))
+
+
+@pytest.fixture
+def model(tmp_path):
+    # A lopsided point cloud, so every direction renders differently
+    rng = np.random.default_rng(0)
+    verts = rng.normal(size=(4000, 3))
+    verts /= np.linalg.norm(verts, axis=1, keepdims=True)
+    verts *= [1.0, 0.6, 1.5]
+    verts[:, 0] += 0.3 * (verts[:, 2] > 0)
+    path = tmp_path / 'imp.obj'
+    with open(path, 'w', encoding='utf-8') as f:
+        f.writelines(f'v {x:.4f} {y:.4f} {z:.4f}\n' for x, y, z in verts)
+    return str(path)
@@ -0,0 +1,111 @@
+import json
+import os
+
+import numpy as np
+from PIL import Image, ImageOps
+
+import sprite_atlas
+import sprite_pipeline
+
+
+def sprite(w, h, seed):
+    # Random opaque pixels in a transparent border, so trimming has something to cut
+    rng = np.random.default_rng(seed)
+    img = np.zeros((h + 4, w + 6, 4), dtype=np.uint8)
+    img[2:2 + h, 3:3 + w] = rng.integers(0, 256, (h, w, 4), dtype=np.uint8) | np.array([0, 0, 0, 1], dtype=np.uint8)
+    return Image.fromarray(img, 'RGBA')
+
+
+def test_pack_has_no_overlap():
+    rng = np.random.default_rng(0)
+    sizes = [tuple(int(v) for v in rng.integers(1, 80, 2)) for _ in range(60)]
+    width, height, positions = sprite_atlas.pack(sizes)
+    assert width & (width - 1) == 0
+    used = np.zeros((height, width), dtype=int)
+    for (w, h), (x, y) in zip(sizes, positions):
+        assert x >= 0 and y >= 0 and x + w <= width and y + h <= height
+        used[y:y + h, x:x + w] += 1
+    assert used.max() == 1
+    # Padding keeps every pair of rects at least a pixel apart
+    for i, ((w1, h1), (x1, y1)) in enumerate(zip(sizes, positions)):
+        for (w2, h2), (x2, y2) in list(zip(sizes, positions))[i + 1:]:
+            assert x1 + w1 + 1 <= x2 or x2 + w2 + 1 <= x1 or y1 + h1 + 1 <= y2 or y2 + h2 + 1 <= y1
+    assert sprite_atlas.pack([]) == (0, 0, [])
+
+
+def test_mirrored_sprites_take_no_space(tmp_path):
+    front = sprite(10, 20, 0)
+    aligned = {'front': front, 'right': sprite(8, 20, 1), 'left': ImageOps.mirror(sprite(8, 20, 1))}
+    views = [('front', 'front', None), ('right', 'right', None), ('left', 'left', None)]
+    entries = sprite_atlas.make_entries('imp', views, aligned, {'left': 'right'})
+    sprite_atlas.write_atlas(entries, str(tmp_path), 'imp_atlas', {})
+    with open(tmp_path / 'imp_atlas.json', 'r', encoding='utf-8') as f:
+        index = json.load(f)
+    records = {r['name']: r for r in index['sprites']}
+    assert records['imp_left']['flip'] and records['imp_left']['mirrored_from'] == 'imp_right'
+    assert records['imp_left']['rect'] == records['imp_right']['rect']
+    # The sheet holds only the two real sprites
+    assert index['size'] == list(sprite_atlas.pack([(10, 20), (8, 20)])[:2])
+
+
+def test_binary_index_round_trip(tmp_path):
+    aligned = {'0001_front': sprite(5, 7, 2), '0001_right': sprite(6, 3, 3),
+               '0001_left': ImageOps.mirror(sprite(6, 3, 3))}
+    views = [('0001_front', 'front', 1), ('0001_right', 'right', 1), ('0001_left', 'left', 1)]
+    entries = sprite_atlas.make_entries('imp', views, aligned, {'0001_left': '0001_right'})
+    files = sprite_atlas.write_atlas(entries, str(tmp_path), 'imp_atlas', {}, binary=True)
+    assert files == ['imp_atlas.png', 'imp_atlas.json', 'imp_atlas.bin']
+    with open(tmp_path / 'imp_atlas.json', 'r', encoding='utf-8') as f:
+        index = json.load(f)
+    data = (tmp_path / 'imp_atlas.bin').read_bytes()
+    magic, version, count, width, height = sprite_atlas.BINARY_HEADER.unpack_from(data)
+    assert (magic, version, count, [width, height]) == (b'SPAT', 1, 3, index['size'])
+    offset = sprite_atlas.BINARY_HEADER.size
+    for record in index['sprites']:
+        length = data[offset]
+        assert data[offset + 1:offset + 1 + length].decode('utf-8') == record['name']
+        offset += 1 + length
+        x, y, w, h, ox, oy, sw, sh, frame, flags = sprite_atlas.BINARY_RECORD.unpack_from(data, offset)
+        offset += sprite_atlas.BINARY_RECORD.size
+        assert [x, y, w, h] == record['rect'] and [ox, oy] == record['offset'] and [sw, sh] == record['source_size']
+        assert frame == record['frame'] and bool(flags & sprite_atlas.FLAG_FLIP) == record['flip']
+    assert offset == len(data)
+
+
+def test_unpack_matches_sprites(tmp_path, blender, model):
+    settings = {'model': model, 'name': 'imp', 'img_size': 128, 'pixel_size': 32, 'symmetry': 'force'}
+    for output in ('sprites', 'atlas'):
+        job = sprite_pipeline.make_job(dict(settings, output=output))
+        sprite_pipeline.generate_job(blender, job, str(tmp_path / output), log=lambda text: None)
+    with open(tmp_path / 'atlas' / 'imp_atlas.json', 'r', encoding='utf-8') as f:
+        index = json.load(f)
+    assert any(record['flip'] for record in index['sprites'])
+    with Image.open(tmp_path / 'atlas' / 'imp_atlas.png') as img:
+        sheet = img.convert('RGBA')
+    for record in index['sprites']:
+        with Image.open(tmp_path / 'sprites' / f"{record['name']}.png") as img:
+            assert np.array_equal(np.asarray(sprite_atlas.unpack_sprite(sheet, record)), np.asarray(img.convert('RGBA')))
+
+
+def test_merge_atlases(tmp_path):
+    paths = []
+    originals = {}
+    for i, model in enumerate(('imp', 'demon')):
+        aligned = {'front': sprite(9, 12, 10 + i), 'right': sprite(7, 12, 20 + i),
+                   'left': ImageOps.mirror(sprite(7, 12, 20 + i))}
+        views = [(view, view, None) for view in aligned]
+        entries = sprite_atlas.make_entries(model, views, aligned, {'left': 'right'})
+        sprite_atlas.write_atlas(entries, str(tmp_path), f'{model}_atlas', {model: {'pixel_size': 32 + i}})
+        paths.append(os.path.join(tmp_path, f'{model}_atlas.json'))
+        originals.update({f'{model}_{view}': img for view, img in aligned.items()})
+    files = sprite_atlas.merge_atlases(paths, str(tmp_path), 'all', binary=True)
+    assert files == ['all.png', 'all.json', 'all.bin']
+    with open(tmp_path / 'all.json', 'r', encoding='utf-8') as f:
+        index = json.load(f)
+    assert index['models'] == {'imp': {'pixel_size': 32}, 'demon': {'pixel_size': 33}}
+    assert sorted(r['name'] for r in index['sprites']) == sorted(originals)
+    with Image.open(tmp_path / 'all.png') as img:
+        sheet = img.convert('RGBA')
+    for record in index['sprites']:
+        assert np.array_equal(np.asarray(sprite_atlas.unpack_sprite(sheet, record)), np.asarray(originals[record['name']]))
+    assert sprite_atlas.BINARY_HEADER.unpack_from((tmp_path / 'all.bin').read_bytes())[2] == len(originals)
@@ -0,0 +1,17 @@
+import sprite_cache
+import sprite_pipeline
+
+
+def test_job_bigger_than_the_cache(tmp_path, blender, model):
+    # Raw 256px frames are ~256 KB each, so one job's renders alone overflow a 200 KB cache
+    jobs = [sprite_pipeline.make_job({'model': model, 'name': name, 'img_size': 256, 'pixel_size': 32,
+                                      'transport': 'raw', 'crop_border': False})
+            for name in ('imp', 'imp_boss', 'imp_lord')]
+    cache = sprite_cache.RenderCache(str(tmp_path / 'cache'), sprite_cache.parse_size('200KB'))
+    for _ in range(2):
+        summary = sprite_pipeline.run_batch(blender, jobs, str(tmp_path / 'out'), workers=3, cache=cache,
+                                            log=lambda text: None)
+        assert summary['failed'] == 0, summary['failures']
+        assert summary['sprites_written'] == 3 * len(sprite_pipeline.DIRECTION_NAMES)
+    assert cache.summary()['evictions'] > 0
+    assert cache.size() <= cache.max_bytes
@@ -0,0 +1,41 @@
+import socket
+import threading
+
+import pytest
+
+import sprite_cluster
+import sprite_pipeline
+from sprite_pipeline import RenderError
+
+
+def fake_worker(address, reply):
+    # Says hello, takes one task and answers it with `reply`
+    with socket.create_connection(('127.0.0.1', address[1])) as conn:
+        stream = conn.makefile('rwb')
+        sprite_cluster.send_message(stream, {'type': 'hello', 'version': sprite_cluster.PROTOCOL_VERSION,
+                                             'name': 'fake', 'cpus': 1})
+        message, _ = sprite_cluster.read_message(stream)
+        sprite_cluster.send_message(stream, dict(reply, id=message['id']))
+        stream.readline()
+
+
+def test_malformed_reply_fails_the_task(tmp_path, model):
+    coordinator = sprite_cluster.ClusterCoordinator('127.0.0.1', 0, max_attempts=1, log=lambda text: None)
+    # A successful result without its frames
+    worker = threading.Thread(target=fake_worker, args=(coordinator.address, {'type': 'result', 'ok': True}), daemon=True)
+    worker.start()
+    try:
+        job = sprite_pipeline.make_job({'model': model, 'name': 'imp', 'img_size': 64, 'pixel_size': 16})
+        with pytest.raises(RenderError):
+            coordinator.render(job, str(tmp_path), log=lambda text: None)
+    finally:
+        coordinator.close()
+
+
+@pytest.mark.parametrize('name', ['/etc/passwd', '../../evil.obj', 'a/../../b.obj', 'C:\\evil.obj', 'a//b.obj', ''])
+def test_worker_rejects_unsafe_names(tmp_path, name):
+    worker = sprite_cluster.ClusterWorker('blender', ('127.0.0.1', 0), work_dir=str(tmp_path), log=lambda text: None)
+    entry = {'role': 'model', 'name': name, 'digest': '0' * 64, 'sent': True}
+    with pytest.raises(RenderError):
+        worker._store([entry], [b'v 0 0 0\n'])
+    assert not (tmp_path / 'files').exists()
@@ -0,0 +1,18 @@
+import asyncio
+
+import sprite_jobs
+import sprite_pipeline
+
+
+def test_runner_outlives_its_event_loop(tmp_path, blender, model):
+    # Two jobs contend for the one render slot, on one loop and then on the next
+    runner = sprite_jobs.AsyncJobRunner(blender, max_renders=1, max_jobs=2)
+    jobs = [sprite_pipeline.make_job({'model': model, 'name': name, 'img_size': 64, 'pixel_size': 16})
+            for name in ('imp', 'demon')]
+
+    async def batch(out_dir):
+        return await asyncio.gather(*(runner.generate(job, str(out_dir)) for job in jobs))
+
+    for attempt in range(2):
+        results = asyncio.run(batch(tmp_path / str(attempt)))
+        assert [r['sprites'] for r in results] == [len(sprite_pipeline.DIRECTION_NAMES)] * 2
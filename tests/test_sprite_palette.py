@@ -0,0 +1,116 @@
+import struct
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import sprite_palette
+
+
+COLORS = np.array([[0, 0, 0], [255, 0, 0], [0, 255, 0], [0, 0, 255], [200, 200, 200]], dtype=np.uint8)
+
+
+def test_raw_palettes(tmp_path):
+    # PLAYPAL holds 14 palettes; only the first is read
+    playpal = tmp_path / 'PLAYPAL.lmp'
+    first = np.random.default_rng(0).integers(0, 256, (256, 3), dtype=np.uint8)
+    playpal.write_bytes(first.tobytes() + bytes(768 * 13))
+    assert np.array_equal(sprite_palette.load_palette(str(playpal)), first)
+    act = tmp_path / 'small.act'
+    act.write_bytes(COLORS.tobytes())
+    assert np.array_equal(sprite_palette.load_palette(str(act)), COLORS)
+    bad = tmp_path / 'bad.act'
+    bad.write_bytes(b'\0' * 10)
+    with pytest.raises(ValueError):
+        sprite_palette.load_palette(str(bad))
+
+
+def test_text_palettes(tmp_path):
+    jasc = tmp_path / 'p.pal'
+    jasc.write_text('JASC-PAL\r\n0100\r\n5\r\n' + ''.join(f'{r} {g} {b}\r\n' for r, g, b in COLORS))
+    assert np.array_equal(sprite_palette.load_palette(str(jasc)), COLORS)
+    gimp = tmp_path / 'p.gpl'
+    gimp.write_text('GIMP Palette\nName: test\nColumns: 4\n#\n'
+                    + ''.join(f'{r:3d} {g:3d} {b:3d}\tcolour {i}\n' for i, (r, g, b) in enumerate(COLORS)))
+    assert np.array_equal(sprite_palette.load_palette(str(gimp)), COLORS)
+
+
+def test_image_palettes(tmp_path):
+    paletted = Image.new('P', (1, 1))
+    paletted.putpalette(COLORS.ravel().tolist() + [0] * (768 - COLORS.size))
+    paletted.save(tmp_path / 'p.png')
+    assert np.array_equal(sprite_palette.load_palette(str(tmp_path / 'p.png'))[:len(COLORS)], COLORS)
+    # A swatch: its distinct colours in reading order, repeats dropped
+    swatch = np.array([[COLORS[2], COLORS[0], COLORS[2]], [COLORS[4], COLORS[0], COLORS[1]]], dtype=np.uint8)
+    Image.fromarray(swatch).save(tmp_path / 'swatch.png')
+    assert np.array_equal(sprite_palette.load_palette(str(tmp_path / 'swatch.png')), COLORS[[2, 0, 4, 1]])
+
+
+@pytest.mark.parametrize('bits', [5, 6])
+def test_lut_matches_brute_force(bits):
+    palette = np.random.default_rng(1).integers(0, 256, (256, 3), dtype=np.uint8)
+    lut = sprite_palette.build_lut(palette, bits)
+    step = 256 // (1 << bits)
+    centres = np.arange(1 << bits) * step + step // 2
+    g, b = np.meshgrid(centres, centres, indexing='ij')
+    for r in range(1 << bits):
+        cells = np.stack([np.full(g.size, centres[r]), g.ravel(), b.ravel()], axis=1)
+        distances = ((cells[:, None] - palette.astype(np.int64)[None]) ** 2).sum(axis=2)
+        chosen = np.take_along_axis(distances, lut[r].reshape(-1, 1).astype(np.int64), axis=1)[:, 0]
+        # Ties may pick either colour, so compare distances rather than indices
+        assert np.array_equal(chosen, distances.min(axis=1))
+
+
+def test_transparent_index(tmp_path):
+    palette = np.vstack([COLORS, np.zeros((251, 3), dtype=np.uint8)])
+    palette[255] = [255, 0, 0]
+    lut = sprite_palette.PaletteLUT(palette, sprite_palette.build_lut(palette, 6, exclude=255), transparent_index=255)
+    # Pure red matches index 1 exactly, never the excluded slot that has the same colour
+    assert 255 not in lut.lut
+    img = Image.new('RGBA', (2, 1), (255, 0, 0, 255))
+    img.putpixel((1, 0), (255, 0, 0, sprite_palette.ALPHA_THRESHOLD - 1))
+    indices, opaque = lut.quantize(img)
+    assert indices.tolist() == [[1, 255]]
+    assert opaque.tolist() == [[True, False]]
+    lut.save_png(img, str(tmp_path / 'out.png'))
+    with Image.open(tmp_path / 'out.png') as out:
+        assert out.mode == 'P'
+        assert out.info['transparency'] == 255
+        assert np.asarray(out).tolist() == [[1, 255]]
+
+
+def read_patch(data):
+    width, height, left, top = struct.unpack_from('<hhhh', data)
+    offsets = struct.unpack_from(f'<{width}I', data, 8)
+    columns = []
+    for offset in offsets:
+        posts = []
+        while data[offset] != 0xff:
+            start, length = data[offset], data[offset + 1]
+            # A padding byte either side of the pixels
+            posts.append((start, list(data[offset + 3:offset + 3 + length])))
+            assert data[offset + 2] == 0 and data[offset + 3 + length] == 0
+            offset += length + 4
+        columns.append(posts)
+    return (width, height, left, top), columns
+
+
+def test_patch_layout():
+    indices = np.arange(12, dtype=np.uint8).reshape(4, 3)
+    opaque = np.array([[True, False, False],
+                       [True, False, True],
+                       [False, False, True],
+                       [True, False, False]])
+    header, columns = read_patch(sprite_palette.patch_bytes(indices, opaque))
+    assert header == (3, 4, 1, 4)
+    assert columns == [[(0, [0, 3]), (3, [9])], [], [(1, [5, 8])]]
+    header, _ = read_patch(sprite_palette.patch_bytes(indices, opaque, left=-2, top=10))
+    assert header == (3, 4, -2, 10)
+
+
+def test_patch_height_limit():
+    tall = np.zeros((254, 1), dtype=np.uint8)
+    _, columns = read_patch(sprite_palette.patch_bytes(tall, np.ones((254, 1), dtype=bool)))
+    assert columns == [[(0, [0] * 254)]]
+    with pytest.raises(ValueError):
+        sprite_palette.patch_bytes(np.zeros((255, 1), dtype=np.uint8), np.ones((255, 1), dtype=bool))
@@ -0,0 +1,104 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+import types
+
+import numpy as np
+from PIL import Image
+
+import sprite_cache
+import sprite_pipeline
+
+
+def generate(blender, cache, out_dir, **settings):
+    job = sprite_pipeline.make_job(dict({'img_size': 128, 'pixel_size': 32, 'name': 'imp'}, **settings))
+    return sprite_pipeline.generate_job(blender, job, str(out_dir), log=lambda text: None, cache=cache)
+
+
+def evict(cache, kind):
+    shutil.rmtree(os.path.join(cache.root, kind))
+    cache._index = None
+
+
+def test_evicted_framing_is_recovered(tmp_path, blender, model):
+    cache = sprite_cache.RenderCache(str(tmp_path / 'cache'))
+    generate(blender, cache, tmp_path / 'out', model=model)
+    with open(tmp_path / 'out' / 'imp_sprites.json', 'r', encoding='utf-8') as f:
+        framing = json.load(f)['framing']
+    assert 'camera' in framing
+    evict(cache, 'framing')
+    # A new pixel size re-downscales the cached renders without Blender
+    result = generate(blender, cache, tmp_path / 'out', model=model, pixel_size=24)
+    assert result['rendered'] == []
+    with open(tmp_path / 'out' / 'imp_sprites.json', 'r', encoding='utf-8') as f:
+        assert json.load(f)['framing'] == framing
+
+
+def test_depth_pass_after_eviction(tmp_path, blender, model):
+    palette = tmp_path / 'grey.act'
+    palette.write_bytes(bytes(v for i in range(256) for v in (i, i, i)))
+    cache = sprite_cache.RenderCache(str(tmp_path / 'cache'))
+    generate(blender, cache, tmp_path / 'out', model=model, passes='depth')
+    evict(cache, 'framing')
+    evict(cache, 'render')
+    # Only the final key changes, so the sprites come straight from the downscale entries
+    result = generate(blender, cache, tmp_path / 'out', model=model, passes='depth', palette=str(palette))
+    assert result['rendered'] == []
+    assert len(result['passes']) == len(sprite_pipeline.DIRECTION_NAMES)
+    with open(tmp_path / 'out' / 'imp_sprites.json', 'r', encoding='utf-8') as f:
+        depth = json.load(f)['passes']['depth']
+    assert depth['near'] < depth['far']
+
+
+def test_depth_image_without_range():
+    sprite = Image.new('RGBA', (2, 1), (255, 255, 255, 255))
+    data = np.array([[[2.0], [sprite_pipeline.PASS_FILL['depth']]]], dtype=np.float32)
+    assert np.asarray(sprite_pipeline.pass_image('depth', sprite, data)).tolist() == [[0, 65535]]
+
+
+def test_publish_removes_dropped_frames(tmp_path, blender, model):
+    out_dir = tmp_path / 'out'
+    generate(blender, None, out_dir, model=model, action='walk', frame_start=1, frame_end=3)
+    assert (out_dir / 'imp_0003_front.png').exists()
+    generate(blender, None, out_dir, model=model, action='walk', frame_start=1, frame_end=2)
+    assert not (out_dir / 'imp_0003_front.png').exists()
+    assert (out_dir / 'imp_0002_front.png').exists()
+
+
+def test_publish_removes_the_other_format(tmp_path, blender, model):
+    out_dir = tmp_path / 'out'
+    generate(blender, None, out_dir, model=model)
+    generate(blender, None, out_dir, model=model, output='atlas')
+    assert sorted(os.listdir(out_dir)) == ['imp_atlas.json', 'imp_atlas.png']
+    generate(blender, None, out_dir, model=model)
+    assert sorted(os.listdir(out_dir)) == sorted([f'imp_{d}.png' for d in sprite_pipeline.DIRECTION_NAMES]
+                                                 + ['imp_sprites.json'])
+
+
+def test_stale_staging_folders_are_cleared(tmp_path, blender, model):
+    out_dir = tmp_path / 'out'
+    left = out_dir / '.imp-abcd1234'
+    left.mkdir(parents=True)
+    (left / 'imp_front.png').write_bytes(b'')
+    old = time.time() - sprite_pipeline.STAGING_MAX_AGE - 60
+    os.utime(left, (old, old))
+    # Another job's folder and a live one are left alone
+    (out_dir / '.imp_boss-abcd1234').mkdir()
+    os.utime(out_dir / '.imp_boss-abcd1234', (old, old))
+    (out_dir / '.imp-live1234').mkdir()
+    generate(blender, None, out_dir, model=model)
+    assert sorted(n for n in os.listdir(out_dir) if n.startswith('.')) == ['.imp-live1234', '.imp_boss-abcd1234']
+
+
+def test_scratch_root_falls_back_when_shm_is_small(tmp_path, monkeypatch):
+    monkeypatch.delenv('SPRITE_SCRATCH_DIR', raising=False)
+    monkeypatch.setattr(os, 'access', lambda path, mode: True)
+    monkeypatch.setattr(shutil, 'disk_usage', lambda path: types.SimpleNamespace(free=64 << 20))
+    assert sprite_pipeline.scratch_root() == tempfile.gettempdir()
+    monkeypatch.setattr(shutil, 'disk_usage', lambda path: types.SimpleNamespace(free=8 << 30))
+    assert sprite_pipeline.scratch_root(1 << 30) == '/dev/shm'
+    assert sprite_pipeline.scratch_root(16 << 30) == tempfile.gettempdir()
+    monkeypatch.setenv('SPRITE_SCRATCH_DIR', str(tmp_path / 'scratch'))
+    assert sprite_pipeline.scratch_root() == str(tmp_path / 'scratch')
@@ -0,0 +1,67 @@
+import threading
+import types
+
+import pytest
+
+import watch_sprites
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(watch_sprites, 'time', types.SimpleNamespace(time=lambda: now[0]))
+    return now
+
+
+def test_change_merges_into_queued_model(clock):
+    queue = watch_sprites.RegenQueue()
+    queue.put('imp.obj', {'pixel_size': 32}, 1.0)
+    queue.put('demon.obj', {'pixel_size': 32}, 2.0)
+    clock[0] += 10
+    queue.put('imp.obj', {'pixel_size': 48}, 3.0)
+    assert queue.merged == 1
+    assert queue.state()['depth'] == 2
+    # Still first in line, with the newest settings and the first change's time
+    entry = queue.get()
+    assert (entry['model'], entry['job'], entry['changed'], entry['queued']) == ('imp.obj', {'pixel_size': 48}, 1.0, 1000.0)
+
+
+def test_age_overtakes_priority(clock):
+    queue = watch_sprites.RegenQueue(age_boost=60.0)
+    queue.put('old.obj', {}, 0.0)
+    clock[0] += 90
+    queue.put('boss.obj', {'priority': 1}, 0.0)
+    # Waiting 90s is worth 1.5 priority levels
+    assert queue.get()['model'] == 'old.obj'
+    queue.put('urgent.obj', {'priority': 2}, 0.0)
+    queue.put('old2.obj', {}, 0.0)
+    clock[0] += 60
+    assert [queue.get()['model'] for _ in range(3)] == ['urgent.obj', 'boss.obj', 'old2.obj']
+
+
+def test_model_changed_while_rendering_waits_for_the_run(clock):
+    queue = watch_sprites.RegenQueue()
+    queue.put('imp.obj', {'pixel_size': 32}, 0.0)
+    assert queue.get()['model'] == 'imp.obj'
+    queue.put('imp.obj', {'pixel_size': 48}, 1.0)
+    queue.put('demon.obj', {}, 2.0)
+    # The rerun of imp.obj is queued, but other models go first while imp.obj still renders
+    assert queue.get()['model'] == 'demon.obj'
+    got = []
+    worker = threading.Thread(target=lambda: got.append(queue.get()))
+    worker.start()
+    worker.join(0.2)
+    assert worker.is_alive() and queue.state() == {'depth': 1, 'running': 2, 'oldest': 0.0}
+    queue.done('imp.obj')
+    worker.join(5)
+    assert got[0]['model'] == 'imp.obj' and got[0]['job'] == {'pixel_size': 48}
+
+
+def test_close_releases_waiting_workers():
+    queue = watch_sprites.RegenQueue()
+    got = []
+    worker = threading.Thread(target=lambda: got.append(queue.get()))
+    worker.start()
+    queue.close()
+    worker.join(5)
+    assert got == [None]
@@ -0,0 +1,414 @@
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+import collections
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import sprite_cache
+import sprite_pipeline
+
+
+MODEL_EXTENSIONS = ('.obj', '.fbx', '.gltf', '.glb')
+
+# Per-model settings next to the model: imp.obj -> imp.sprite.json
+SIDECAR_SUFFIX = '.sprite.json'
+
+POLL_SECONDS = 1.0
+
+# A model is queued once none of its files has changed for this long (exporters write in bursts)
+DEFAULT_SETTLE_SECONDS = 2.0
+
+# Every this many seconds in the queue counts as one priority level, so low-priority models still get their turn
+DEFAULT_AGE_BOOST_SECONDS = 300.0
+
+# Finished jobs kept for the latency percentiles
+LATENCY_SAMPLES = 500
+
+
+def sidecar_path(model):
+    return os.path.splitext(model)[0] + SIDECAR_SUFFIX
+
+
+def load_defaults(path):
+    # Same shape as a batch manifest's defaults: a settings dict, or {"defaults": {...}}
+    if not path:
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    if not isinstance(data, dict):
+        raise ValueError('Watch config must be a JSON object')
+    return data.get('defaults', data)
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class RegenQueue:
+    # Models waiting for regeneration. A model is queued at most once: later changes update the queued job.
+    # A model that changes while it renders is queued again but not handed out until that render finishes.
+    def __init__(self, age_boost=DEFAULT_AGE_BOOST_SECONDS):
+        self.age_boost = age_boost
+        self.merged = 0
+        self._pending = {}
+        self._running = set()
+        self._closed = False
+        self._cond = threading.Condition()
+
+    def put(self, model, job, changed):
+        with self._cond:
+            entry = self._pending.get(model)
+            if entry is None:
+                self._pending[model] = {'model': model, 'job': job, 'changed': changed, 'queued': time.time()}
+            else:
+                # Keep the place in the queue, render the newest settings
+                entry['job'] = job
+                self.merged += 1
+            self._cond.notify()
+
+    def discard(self, model):
+        with self._cond:
+            self._pending.pop(model, None)
+
+    def _score(self, entry, now):
+        return (entry['job'].get('priority', 0) + (now - entry['queued']) / self.age_boost, -entry['queued'])
+
+    def get(self):
+        # Blocks until a model is ready; None once the queue is closed
+        with self._cond:
+            while True:
+                if self._closed:
+                    return None
+                ready = [e for model, e in self._pending.items() if model not in self._running]
+                if ready:
+                    now = time.time()
+                    entry = max(ready, key=lambda e: self._score(e, now))
+                    del self._pending[entry['model']]
+                    self._running.add(entry['model'])
+                    entry['started'] = now
+                    return entry
+                self._cond.wait()
+
+    def done(self, model):
+        with self._cond:
+            self._running.discard(model)
+            self._cond.notify_all()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def state(self):
+        with self._cond:
+            queued = [e['queued'] for e in self._pending.values()]
+            return {'depth': len(self._pending), 'running': len(self._running),
+                    'oldest': time.time() - min(queued) if queued else 0.0}
+
+
+class WatchMetrics:
+    def __init__(self):
+        self.changes = 0
+        self.jobs = {'ok': 0, 'failed': 0}
+        self.sprites = 0
+        # Latency: first change seen -> sprites published. Wait: queued -> picked up by a worker.
+        self.latency = collections.deque(maxlen=LATENCY_SAMPLES)
+        self.wait = collections.deque(maxlen=LATENCY_SAMPLES)
+        self.render = collections.deque(maxlen=LATENCY_SAMPLES)
+        self._lock = threading.Lock()
+
+    def changed(self, count=1):
+        with self._lock:
+            self.changes += count
+
+    def record(self, entry, result, finished):
+        with self._lock:
+            self.jobs['ok' if result['ok'] else 'failed'] += 1
+            self.sprites += result['sprites'] if result['ok'] else 0
+            self.latency.append(finished - entry['changed'])
+            self.wait.append(entry['started'] - entry['queued'])
+            self.render.append(result['seconds'])
+
+    def snapshot(self, queue):
+        with self._lock:
+            status = {'queue': queue.state(), 'changes': self.changes, 'merged': queue.merged,
+                      'jobs': dict(self.jobs), 'sprites': self.sprites}
+            for name in ('latency', 'wait', 'render'):
+                values = list(getattr(self, name))
+                status[name] = {'count': len(values), 'sum': sum(values), 'p50': percentile(values, 0.5),
+                                'p95': percentile(values, 0.95), 'max': max(values) if values else None}
+        return status
+
+    def prometheus(self, queue):
+        status = self.snapshot(queue)
+        lines = [
+            '# HELP sprite_watch_queue_depth Models waiting to be regenerated',
+            '# TYPE sprite_watch_queue_depth gauge',
+            f"sprite_watch_queue_depth {status['queue']['depth']}",
+            '# HELP sprite_watch_running Models being regenerated',
+            '# TYPE sprite_watch_running gauge',
+            f"sprite_watch_running {status['queue']['running']}",
+            '# HELP sprite_watch_oldest_queued_seconds Time the oldest queued model has waited',
+            '# TYPE sprite_watch_oldest_queued_seconds gauge',
+            f"sprite_watch_oldest_queued_seconds {status['queue']['oldest']:.3f}",
+            '# HELP sprite_watch_changes_total Model changes detected',
+            '# TYPE sprite_watch_changes_total counter',
+            f"sprite_watch_changes_total {status['changes']}",
+            '# HELP sprite_watch_merged_total Changes merged into an already queued job',
+            '# TYPE sprite_watch_merged_total counter',
+            f"sprite_watch_merged_total {status['merged']}",
+            '# HELP sprite_watch_jobs_total Finished regenerations',
+            '# TYPE sprite_watch_jobs_total counter',
+        ]
+        lines += [f'sprite_watch_jobs_total{{status="{s}"}} {n}' for s, n in status['jobs'].items()]
+        for name, help_text in (('latency', 'First change seen to sprites published'),
+                                ('wait', 'Time queued before a worker picked the model up'),
+                                ('render', 'Time to regenerate one model')):
+            stats = status[name]
+            lines += [f'# HELP sprite_watch_{name}_seconds {help_text}', f'# TYPE sprite_watch_{name}_seconds summary']
+            for quantile in ('0.5', '0.95'):
+                value = stats['p50' if quantile == '0.5' else 'p95']
+                if value is not None:
+                    lines.append(f'sprite_watch_{name}_seconds{{quantile="{quantile}"}} {value:.3f}')
+            lines += [f"sprite_watch_{name}_seconds_sum {stats['sum']:.3f}",
+                      f"sprite_watch_{name}_seconds_count {stats['count']}"]
+        return '\n'.join(lines) + '\n'
+
+
+class WatchDaemon:
+    def __init__(self, blender, root, out_dir, defaults=None, workers=1, settle=DEFAULT_SETTLE_SECONDS,
+                 age_boost=DEFAULT_AGE_BOOST_SECONDS, log_dir=None, threads=None, cache=None, log=print):
+        self.blender = blender
+        self.root = os.path.abspath(root)
+        self.out_dir = out_dir
+        self.defaults = defaults or {}
+        self.workers = max(1, workers)
+        self.settle = settle
+        self.log_dir = log_dir
+        # Split the machine between the concurrent Blenders, as batch rendering does
+        self.threads = threads or max(1, (os.cpu_count() or 1) // self.workers)
+        self.cache = cache
+        self.log = log
+        self.queue = RegenQueue(age_boost)
+        self.metrics = WatchMetrics()
+        self.servers = sprite_pipeline.ServerPool(blender, self.workers)
+        self._files = None
+        self._deps = {}
+        self._dirty = {}
+
+    def scan(self):
+        files = {}
+        for folder, dirs, names in os.walk(self.root):
+            # Skips staging folders and other hidden ones
+            dirs[:] = [d for d in dirs if not d.startswith('.')]
+            for name in names:
+                path = os.path.join(folder, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                files[path] = (st.st_mtime_ns, st.st_size)
+        return files
+
+    def _model_files(self, model):
+        # Everything whose change means the model's sprites must be regenerated
+        deps = [model, sidecar_path(model)] + sprite_cache.model_dependencies(model)
+        try:
+            job = self._make_job(model)
+            if job.get('texture'):
+                deps.append(job['texture'])
+        except (OSError, ValueError):
+            pass
+        return {os.path.abspath(d) for d in deps}
+
+    def _make_job(self, model):
+        entry = {}
+        if os.path.isfile(sidecar_path(model)):
+            with open(sidecar_path(model), 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        job = sprite_pipeline.make_job(dict(entry, model=model), self.defaults, os.path.dirname(model))
+        job['priority'] = int(job.get('priority') or 0)
+        return job
+
+    def poll(self, initial=False):
+        files = self.scan()
+        now = time.time()
+        # The first scan only learns what is there, unless everything should be regenerated
+        first = self._files is None
+        known = self._files or {}
+        changed = {path for path, sig in files.items() if known.get(path) != sig}
+        removed = set(known) - set(files)
+        self._files = files
+
+        for model in [m for m in self._deps if m in removed]:
+            del self._deps[model]
+            self._dirty.pop(model, None)
+            self.queue.discard(model)
+        models = set()
+        for path in changed | removed:
+            if path.lower().endswith(MODEL_EXTENSIONS) and path in files:
+                models.add(path)
+            elif path.endswith(SIDECAR_SUFFIX):
+                models.update(m for m in self._deps if sidecar_path(m) == path)
+            models.update(m for m, deps in self._deps.items() if path in deps)
+        for model in models:
+            self._deps[model] = self._model_files(model)
+            if first and not initial:
+                continue
+            if model in self._dirty:
+                self._dirty[model]['last'] = now
+            else:
+                self._dirty[model] = {'first': now, 'last': now}
+                self.metrics.changed()
+
+        # Debounce: queue models whose files have been quiet for the settle time
+        for model, dirty in list(self._dirty.items()):
+            if now - dirty['last'] < self.settle:
+                continue
+            del self._dirty[model]
+            try:
+                job = self._make_job(model)
+            except (OSError, ValueError) as e:
+                self.log(f'Skipping {self._relative(model)}: {e}')
+                continue
+            self.queue.put(model, job, dirty['first'])
+            self.log(f"Queued {self._relative(model)} (priority {job.get('priority', 0)}, {self.queue.state()['depth']} waiting)")
+
+    def _relative(self, model):
+        return os.path.relpath(model, self.root)
+
+    def _worker(self):
+        while True:
+            entry = self.queue.get()
+            if entry is None:
+                return
+            model = entry['model']
+            # Output mirrors the watched tree, so models with the same name in different folders don't collide
+            folder = os.path.dirname(self._relative(model))
+            out_dir = os.path.join(self.out_dir, folder)
+            log_dir = os.path.join(self.log_dir, folder) if self.log_dir else None
+            try:
+                self.servers.size = max(self.servers.size, self.workers * entry['job']['shards'])
+                result = sprite_pipeline.run_job(self.blender, entry['job'], out_dir, log_dir, self.threads,
+                                                 self.servers, self.cache)
+            finally:
+                self.queue.done(model)
+            finished = time.time()
+            self.metrics.record(entry, result, finished)
+            status = 'ok' if result['ok'] else f"FAILED ({result['error']})"
+            self.log(f"{self._relative(model)}: {status} in {result['seconds']:.1f}s, "
+                     f"{finished - entry['changed']:.1f}s after the change")
+
+    def run(self, stop=None, poll_seconds=POLL_SECONDS, initial=False):
+        stop = stop or threading.Event()
+        workers = [threading.Thread(target=self._worker, daemon=True) for _ in range(self.workers)]
+        for worker in workers:
+            worker.start()
+        self.log(f'Watching {self.root} with {self.workers} Blender workers ({self.threads} threads each)...')
+        try:
+            self.poll(initial)
+            while not stop.wait(poll_seconds):
+                self.poll()
+        finally:
+            # Renders in progress finish; queued ones are dropped
+            self.queue.close()
+            for worker in workers:
+                worker.join()
+            self.servers.close()
+
+
+def serve_metrics(daemon, host, port):
+    # /metrics in the Prometheus text format, /status as JSON
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == '/metrics':
+                body, content_type = daemon.metrics.prometheus(daemon.queue), 'text/plain; version=0.0.4'
+            elif self.path == '/status':
+                body, content_type = json.dumps(daemon.metrics.snapshot(daemon.queue), indent=2), 'application/json'
+            else:
+                self.send_error(404)
+                return
+            data = body.encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Watch a folder tree and regenerate sprites whenever a model changes.')
+    parser.add_argument('folder', help='Folder to watch (models: ' + ', '.join(MODEL_EXTENSIONS) + ')')
+    parser.add_argument('--config', default=None,
+                        help='JSON job defaults for every model, like a manifest\'s "defaults"; '
+                             f'<model>{SIDECAR_SUFFIX} next to a model overrides them')
+    parser.add_argument('--blender', default=os.environ.get('BLENDER', sprite_pipeline.DEFAULT_BLENDER),
+                        help='Path to the Blender executable (default: $BLENDER or the GUI default)')
+    parser.add_argument('--out', default=os.path.join(os.getcwd(), 'output_sprites'),
+                        help='Output directory; sprites go to the same subfolder as their model')
+    parser.add_argument('-j', '--workers', type=int, default=2, help='Number of Blender processes to run at once')
+    parser.add_argument('--threads', type=int, default=None, help='Render threads per job (default: cores / workers)')
+    parser.add_argument('--settle', type=float, default=DEFAULT_SETTLE_SECONDS,
+                        help='Seconds a model\'s files must be unchanged before it is queued')
+    parser.add_argument('--age-boost', type=float, default=DEFAULT_AGE_BOOST_SECONDS,
+                        help='Seconds of waiting that count as one priority level')
+    parser.add_argument('--poll', type=float, default=POLL_SECONDS, help='Seconds between folder scans')
+    parser.add_argument('--initial', action='store_true', help='Also regenerate every model already in the folder at startup')
+    parser.add_argument('--metrics-port', type=int, default=None,
+                        help='Serve /metrics (Prometheus) and /status (JSON) on this port')
+    parser.add_argument('--metrics-host', default='127.0.0.1', help='Address for the metrics server')
+    parser.add_argument('--no-cache', action='store_true', help='Bypass the render cache and always re-render')
+    parser.add_argument('--cache-dir', default=None, help='Render cache folder (default: $SPRITE_CACHE_DIR or the user cache folder)')
+    parser.add_argument('--cache-size', type=sprite_cache.parse_size, default=sprite_cache.DEFAULT_CACHE_SIZE,
+                        help='Render cache size limit, e.g. 500MB or 4GB (default: 2GB)')
+    parser.add_argument('--log-dir', default=None, help='Directory for per-job Blender logs (default: <out>/logs)')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not os.path.isfile(args.blender):
+        print(f'Blender executable not found: {args.blender}', file=sys.stderr)
+        return 2
+    if not os.path.isdir(args.folder):
+        print(f'Folder not found: {args.folder}', file=sys.stderr)
+        return 2
+    try:
+        defaults = load_defaults(args.config)
+    except (OSError, ValueError) as e:
+        print(f'Invalid config: {e}', file=sys.stderr)
+        return 2
+
+    cache = sprite_cache.RenderCache(args.cache_dir, args.cache_size, enabled=not args.no_cache)
+    daemon = WatchDaemon(args.blender, args.folder, args.out, defaults, args.workers, args.settle, args.age_boost,
+                         args.log_dir or os.path.join(args.out, 'logs'), args.threads, cache)
+    metrics = None
+    if args.metrics_port is not None:
+        metrics = serve_metrics(daemon, args.metrics_host, args.metrics_port)
+        print(f'Metrics at http://{args.metrics_host}:{metrics.server_port}/metrics')
+    try:
+        daemon.run(poll_seconds=args.poll, initial=args.initial)
+    except KeyboardInterrupt:
+        print('Stopping after the renders in progress...')
+    finally:
+        if metrics is not None:
+            metrics.shutdown()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,58 @@
+import os
+import sys
+import time
+import shutil
+import argparse
+
+import sprite_cluster
+import sprite_pipeline
+
+
+# Seconds between attempts to reach the coordinator
+RECONNECT_SECONDS = 2.0
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Render sprites for a batch coordinator (batch_sprites.py --cluster).')
+    parser.add_argument('coordinator', help=f'Coordinator address, HOST[:PORT] (default port {sprite_cluster.DEFAULT_PORT})')
+    parser.add_argument('--blender', default=os.environ.get('BLENDER', sprite_pipeline.DEFAULT_BLENDER),
+                        help='Path to the Blender executable (default: $BLENDER or the GUI default)')
+    parser.add_argument('--threads', type=int, default=None, help='Render threads (default: all cores)')
+    parser.add_argument('--name', default=None, help='Name in the coordinator\'s reports (default: host:pid)')
+    parser.add_argument('--work-dir', default=None,
+                        help='Folder for received models and frames (default: a temporary folder, removed on exit)')
+    parser.add_argument('--once', action='store_true', help='Exit when the coordinator finishes instead of waiting for the next one')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not os.path.isfile(args.blender):
+        print(f'Blender executable not found: {args.blender}', file=sys.stderr)
+        return 2
+    address = sprite_cluster.parse_address(args.coordinator, 'localhost')
+    worker = sprite_cluster.ClusterWorker(args.blender, address, args.work_dir, args.threads, args.name)
+    waiting = False
+    try:
+        while True:
+            try:
+                worker.serve()
+                waiting = False
+                print('Coordinator finished')
+            except (OSError, ValueError) as e:
+                if not waiting:
+                    print(f'Waiting for the coordinator at {address[0]}:{address[1]} ({e})')
+                waiting = True
+            if args.once and not waiting:
+                return 0
+            time.sleep(RECONNECT_SECONDS)
+    except KeyboardInterrupt:
+        return 0
+    finally:
+        worker.close()
+        if args.work_dir is None:
+            shutil.rmtree(worker.work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    sys.exit(main())